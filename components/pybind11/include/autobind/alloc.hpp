@@ -0,0 +1,506 @@
+/**
+ * @file alloc.hpp
+ * @brief Runtime helpers for `--alloc-stats` bindings emitted by cpp_bind_python.py
+ *
+ * Every bound class counts the C++ objects owned by its Python objects: the
+ * generator wraps the `init_instance` and `dealloc` hooks of the class's
+ * pybind11 type info, which run when a Python object takes ownership of a
+ * C++ object (bound constructor, value or pointer returned with ownership)
+ * and when it destroys it, so objects kept alive by forgotten references
+ * (callbacks, caches) show up as live instances. Bytes are `sizeof` the class,
+ * memory the objects allocate themselves is not included.
+ * With `--alloc-heap` the module also counts the C++ heap bytes allocated and
+ * freed (`operator new`/`operator delete`, replaced by AUTOBIND_ALLOC_OPERATORS)
+ * while its bindings run, including the code of `libmain.so` they call: a
+ * scope around each call points the thread's current counter to the module's,
+ * and so does the dealloc hook, as objects are freed outside of any call.
+ * `<module>.__alloc_snapshot__()` takes a snapshot whose `compare_to(old)`
+ * lists what grew or shrank in between, like `tracemalloc`.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <algorithm>
+#include <atomic>
+#include <cstdint>
+#include <cstdlib>
+#include <map>
+#include <memory>
+#include <mutex>
+#include <new>
+#include <string>
+#include <vector>
+
+#include <malloc.h>
+#include <pthread.h>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace alloc
+    {
+        /**
+         * Live blocks (objects or heap allocations) and bytes with their peaks, relaxed atomics.
+         * Heap counters are net: freeing memory allocated outside the scope makes them decrease.
+         */
+        class Counter
+        {
+        public:
+            void add(int64_t bytes)
+            {
+                _created.fetch_add(1, std::memory_order_relaxed);
+                update_peak(_peak_live, _live.fetch_add(1, std::memory_order_relaxed) + 1);
+                update_peak(_peak_bytes, _bytes.fetch_add(bytes, std::memory_order_relaxed) + bytes);
+            }
+
+            void sub(int64_t bytes)
+            {
+                _live.fetch_sub(1, std::memory_order_relaxed);
+                _bytes.fetch_sub(bytes, std::memory_order_relaxed);
+            }
+
+            void reset_peak()
+            {
+                _peak_live.store(_live.load(std::memory_order_relaxed), std::memory_order_relaxed);
+                _peak_bytes.store(_bytes.load(std::memory_order_relaxed), std::memory_order_relaxed);
+            }
+
+            int64_t live() const { return _live.load(std::memory_order_relaxed); }
+
+            int64_t bytes() const { return _bytes.load(std::memory_order_relaxed); }
+
+            py::dict to_dict() const
+            {
+                py::dict stats;
+                stats["live"] = live();
+                stats["peak"] = _peak_live.load(std::memory_order_relaxed);
+                stats["bytes"] = bytes();
+                stats["peak_bytes"] = _peak_bytes.load(std::memory_order_relaxed);
+                stats["created"] = _created.load(std::memory_order_relaxed);
+                return stats;
+            }
+
+        private:
+            static void update_peak(std::atomic<int64_t> &peak, int64_t value)
+            {
+                int64_t old = peak.load(std::memory_order_relaxed);
+                while (value > old && !peak.compare_exchange_weak(old, value, std::memory_order_relaxed))
+                    ;
+            }
+
+            std::atomic<int64_t> _live{0};
+            std::atomic<int64_t> _bytes{0};
+            std::atomic<int64_t> _peak_live{0};
+            std::atomic<int64_t> _peak_bytes{0};
+            std::atomic<uint64_t> _created{0};
+        };
+
+        namespace detail
+        {
+            struct Registry
+            {
+                std::mutex mutex;
+                std::map<std::string, std::unique_ptr<Counter>> counters;
+            };
+
+            inline Registry &registry()
+            {
+                // never destroyed, objects may be freed at exit
+                static Registry *registry = new Registry();
+                return *registry;
+            }
+
+            /**
+             * Thread's current heap counter, shared by all modules of the process through pybind11's shared data:
+             * libmain.so calls the operator new of the first module loading it, which must see the scopes of all modules.
+             */
+            struct Heap
+            {
+                pthread_key_t current;
+            };
+
+            // set by install() before any binding runs, read by the operators of this binary
+            inline std::atomic<Heap *> heap{nullptr};
+
+            inline Heap *shared_heap()
+            {
+                auto *shared = static_cast<Heap *>(py::get_shared_data("autobind.alloc.heap"));
+                if (!shared)
+                {
+                    // never destroyed, operators run until the process exits
+                    shared = new Heap();
+                    pthread_key_create(&shared->current, nullptr);
+                    py::set_shared_data("autobind.alloc.heap", shared);
+                }
+                return shared;
+            }
+
+            inline void count(void *ptr, bool allocated)
+            {
+                Heap *shared = heap.load(std::memory_order_relaxed);
+                if (!ptr || !shared)
+                    return;
+                auto *counter = static_cast<Counter *>(pthread_getspecific(shared->current));
+                if (!counter)
+                    return;
+                int64_t bytes = (int64_t)malloc_usable_size(ptr);
+                if (allocated)
+                    counter->add(bytes);
+                else
+                    counter->sub(bytes);
+            }
+
+            inline void *allocate(size_t size, bool nothrow)
+            {
+                void *ptr;
+                while (!(ptr = malloc(size ? size : 1)))
+                {
+                    std::new_handler handler = std::get_new_handler();
+                    if (!handler)
+                    {
+                        if (nothrow)
+                            return nullptr;
+                        throw std::bad_alloc();
+                    }
+                    handler();
+                }
+                count(ptr, true);
+                return ptr;
+            }
+
+            inline void *allocate_aligned(size_t size, size_t alignment, bool nothrow)
+            {
+                // aligned_alloc needs size to be a multiple of alignment
+                void *ptr = aligned_alloc(alignment, (std::max<size_t>(size, 1) + alignment - 1) / alignment * alignment);
+                if (!ptr && !nothrow)
+                    throw std::bad_alloc();
+                count(ptr, true);
+                return ptr;
+            }
+
+            inline void deallocate(void *ptr)
+            {
+                count(ptr, false);
+                free(ptr);
+            }
+        } // namespace detail
+
+        /**
+         * Counter with the full name, e.g. "add.Vec" for a class, "add.<heap>" for the C++ heap of module add, created on first use.
+         */
+        inline Counter &counter(const std::string &name)
+        {
+            auto &registry = detail::registry();
+            std::lock_guard<std::mutex> lock(registry.mutex);
+            auto &counter = registry.counters[name];
+            if (!counter)
+                counter = std::make_unique<Counter>();
+            return *counter;
+        }
+
+        /**
+         * Heap counter of module module_name.
+         */
+        inline Counter &heap(const std::string &module_name)
+        {
+            return counter(module_name + ".<heap>");
+        }
+
+        /**
+         * Count the C++ heap allocations of the current thread to counter during the scope (nullptr pauses counting),
+         * restoring the outer scope's after.
+         */
+        class HeapScope
+        {
+        public:
+            explicit HeapScope(Counter *counter) : _heap(detail::heap.load(std::memory_order_relaxed))
+            {
+                if (!_heap)
+                    return;
+                _saved = pthread_getspecific(_heap->current);
+                pthread_setspecific(_heap->current, counter);
+            }
+
+            HeapScope(const HeapScope &) = delete;
+            HeapScope &operator=(const HeapScope &) = delete;
+
+            ~HeapScope()
+            {
+                if (_heap)
+                    pthread_setspecific(_heap->current, _saved);
+            }
+
+        private:
+            detail::Heap *_heap;
+            void *_saved = nullptr;
+        };
+
+        /**
+         * Binding attribute counting the heap allocations of the calls of a function, Name is a lambda returning the module name,
+         * whose unique type gives each binding its own wrapper of the pybind11 impl.
+         */
+        template <typename Name>
+        struct heap_calls
+        {
+            Name name;
+        };
+
+        template <typename Name>
+        heap_calls<Name> make_heap_calls(Name name)
+        {
+            return {name};
+        }
+
+        /**
+         * Counters of a module taken by `__alloc_snapshot__()`.
+         */
+        class Snapshot
+        {
+        public:
+            struct Entry
+            {
+                int64_t live;
+                int64_t bytes;
+            };
+
+            explicit Snapshot(const std::string &prefix)
+            {
+                auto &registry = detail::registry();
+                std::lock_guard<std::mutex> lock(registry.mutex);
+                for (auto &item : registry.counters)
+                {
+                    if (item.first.compare(0, prefix.size(), prefix) == 0)
+                        _entries[item.first] = {item.second->live(), item.second->bytes()};
+                }
+            }
+
+            py::dict stats() const
+            {
+                py::dict stats;
+                for (auto &item : _entries)
+                {
+                    py::dict entry;
+                    entry["live"] = item.second.live;
+                    entry["bytes"] = item.second.bytes;
+                    stats[py::str(item.first)] = entry;
+                }
+                return stats;
+            }
+
+            /**
+             * Counters changed since old, biggest byte difference first.
+             */
+            py::list compare_to(const Snapshot &old) const
+            {
+                struct Diff
+                {
+                    const std::string *name;
+                    Entry now;
+                    Entry diff;
+                };
+                std::vector<Diff> diffs;
+                for (auto &item : _entries)
+                {
+                    auto found = old._entries.find(item.first);
+                    Entry before = found != old._entries.end() ? found->second : Entry{0, 0};
+                    Entry diff{item.second.live - before.live, item.second.bytes - before.bytes};
+                    if (diff.live || diff.bytes)
+                        diffs.push_back({&item.first, item.second, diff});
+                }
+                std::stable_sort(diffs.begin(), diffs.end(), [](const Diff &a, const Diff &b) {
+                    if (std::llabs(a.diff.bytes) != std::llabs(b.diff.bytes))
+                        return std::llabs(a.diff.bytes) > std::llabs(b.diff.bytes);
+                    return std::llabs(a.diff.live) > std::llabs(b.diff.live);
+                });
+                py::list result;
+                for (auto &diff : diffs)
+                {
+                    py::dict entry;
+                    entry["name"] = *diff.name;
+                    entry["live"] = diff.now.live;
+                    entry["live_diff"] = diff.diff.live;
+                    entry["bytes"] = diff.now.bytes;
+                    entry["bytes_diff"] = diff.diff.bytes;
+                    result.append(entry);
+                }
+                return result;
+            }
+
+        private:
+            std::map<std::string, Entry> _entries;
+        };
+
+        namespace detail
+        {
+            template <typename T>
+            struct Tracked
+            {
+                static inline Counter *counter = nullptr;
+                // heap counter of the module with --alloc-heap, objects are freed outside the scope of the calls allocating them
+                static inline Counter *heap = nullptr;
+                static inline const py::detail::type_info *type = nullptr;
+                static inline void (*init_instance)(py::detail::instance *, const void *) = nullptr;
+                static inline void (*dealloc)(py::detail::value_and_holder &) = nullptr;
+
+                // same condition as pybind11's clear_instance() for calling dealloc
+                static bool owned(const py::detail::value_and_holder &v_h)
+                {
+                    return v_h && (v_h.inst->owned || v_h.holder_constructed());
+                }
+
+                static void init(py::detail::instance *inst, const void *holder)
+                {
+                    {
+                        // pybind11's registration of the instance is freed before dealloc, not counted on either side
+                        HeapScope paused(nullptr);
+                        init_instance(inst, holder);
+                    }
+                    if (owned(inst->get_value_and_holder(type, false)))
+                        counter->add((int64_t)sizeof(T));
+                }
+
+                static void destroy(py::detail::value_and_holder &v_h)
+                {
+                    if (owned(v_h))
+                        counter->sub((int64_t)sizeof(T));
+                    if (!heap)
+                    {
+                        dealloc(v_h);
+                        return;
+                    }
+                    HeapScope scope(heap);
+                    dealloc(v_h);
+                }
+            };
+
+            template <typename Name>
+            struct HeapWrapped
+            {
+                static inline py::handle (*impl)(py::detail::function_call &) = nullptr;
+                static inline Counter *counter = nullptr;
+
+                static py::handle call(py::detail::function_call &call)
+                {
+                    HeapScope scope(counter);
+                    return impl(call);
+                }
+            };
+        } // namespace detail
+
+        /**
+         * Count the C++ objects owned by the Python objects of the bound class as live instances of name (full name),
+         * called right after the class is created and after install().
+         */
+        template <typename Class>
+        void track(Class &cls, const std::string &name)
+        {
+            using T = typename Class::type;
+            using Tracked = detail::Tracked<T>;
+            auto *type = py::detail::get_type_info(typeid(T));
+            Tracked::counter = &counter(name);
+            if (detail::heap.load(std::memory_order_relaxed))
+                Tracked::heap = &heap(name.substr(0, name.find('.')));
+            Tracked::type = type;
+            Tracked::init_instance = type->init_instance;
+            Tracked::dealloc = type->dealloc;
+            type->init_instance = &Tracked::init;
+            type->dealloc = &Tracked::destroy;
+        }
+
+        /**
+         * Add `__alloc_stats__()`, `__alloc_snapshot__()` and `__alloc_reset_peak__()` to module m for the counters under module_name,
+         * heap enables counting the C++ heap (`--alloc-heap`).
+         */
+        inline void install(py::module_ &m, const std::string &module_name, bool heap = false)
+        {
+            if (heap)
+                detail::heap.store(detail::shared_heap(), std::memory_order_relaxed);
+            std::string prefix = module_name + ".";
+            py::class_<Snapshot>(m, "AllocSnapshot", "Counters of the bound classes and the C++ heap taken by __alloc_snapshot__()", py::module_local())
+                .def_property_readonly("stats", &Snapshot::stats, "{name: {live, bytes}} at the time of the snapshot")
+                .def("compare_to", &Snapshot::compare_to,
+                     "Counters changed since the older snapshot old: [{name, live, live_diff, bytes, bytes_diff}],\n"
+                     "biggest absolute bytes_diff first, e.g. `assert not after.compare_to(before)` in leak tests",
+                     py::arg("old"));
+            m.def(
+                "__alloc_stats__", [prefix]() {
+                    py::dict result;
+                    auto &registry = detail::registry();
+                    std::lock_guard<std::mutex> lock(registry.mutex);
+                    for (auto &item : registry.counters)
+                    {
+                        if (item.first.compare(0, prefix.size(), prefix) == 0)
+                            result[py::str(item.first)] = item.second->to_dict();
+                    }
+                    return result;
+                },
+                "Live C++ objects owned by Python objects of each bound class, and net C++ heap allocations of the bindings\n"
+                "(\"<module>.<heap>\", with --alloc-heap): {name: {live, peak, bytes, peak_bytes, created}},\n"
+                "bytes of a class is live * sizeof the class");
+            m.def(
+                "__alloc_snapshot__", [prefix]() { return Snapshot(prefix); }, "Snapshot of the counters of __alloc_stats__(), compare with AllocSnapshot.compare_to(old)");
+            m.def(
+                "__alloc_reset_peak__", [prefix]() {
+                    auto &registry = detail::registry();
+                    std::lock_guard<std::mutex> lock(registry.mutex);
+                    for (auto &item : registry.counters)
+                    {
+                        if (item.first.compare(0, prefix.size(), prefix) == 0)
+                            item.second->reset_peak();
+                    }
+                },
+                "Set the peaks of __alloc_stats__() to the current values");
+        }
+    } // namespace alloc
+} // namespace autobind
+
+namespace pybind11
+{
+    namespace detail
+    {
+        template <typename Name>
+        struct process_attribute<::autobind::alloc::heap_calls<Name>> : process_attribute_default<::autobind::alloc::heap_calls<Name>>
+        {
+            static void init(const ::autobind::alloc::heap_calls<Name> &attr, function_record *r)
+            {
+                using Wrapped = ::autobind::alloc::detail::HeapWrapped<Name>;
+                Wrapped::counter = &::autobind::alloc::heap(attr.name());
+                Wrapped::impl = r->impl;
+                r->impl = &Wrapped::call;
+            }
+        };
+    } // namespace detail
+} // namespace pybind11
+
+/**
+ * Binding attribute counting the C++ heap allocations of the function's calls to module_name (a string literal),
+ * e.g. `m.def("add", &add, AUTOBIND_ALLOC_HEAP("add"))`.
+ */
+#define AUTOBIND_ALLOC_HEAP(module_name) ::autobind::alloc::make_heap_calls([] { return module_name; })
+
+/**
+ * Replace the global operator new/delete with ones counting to the thread's current heap counter, placed at global scope.
+ * Weak and exported, so modules linked into one executable (EMBED_RUNNER) share one definition, and libmain.so
+ * loaded by a module uses the module's. Memory is from malloc like libstdc++'s operators, so blocks allocated
+ * by either can be freed by the other.
+ */
+#define AUTOBIND_ALLOC_OPERATORS                                                                                                                                       \
+    __attribute__((weak, visibility("default"))) void *operator new(size_t size) { return ::autobind::alloc::detail::allocate(size, false); }                           \
+    __attribute__((weak, visibility("default"))) void *operator new[](size_t size) { return ::autobind::alloc::detail::allocate(size, false); }                         \
+    __attribute__((weak, visibility("default"))) void *operator new(size_t size, const std::nothrow_t &) noexcept { return ::autobind::alloc::detail::allocate(size, true); } \
+    __attribute__((weak, visibility("default"))) void *operator new[](size_t size, const std::nothrow_t &) noexcept { return ::autobind::alloc::detail::allocate(size, true); } \
+    __attribute__((weak, visibility("default"))) void *operator new(size_t size, std::align_val_t alignment) { return ::autobind::alloc::detail::allocate_aligned(size, (size_t)alignment, false); } \
+    __attribute__((weak, visibility("default"))) void *operator new[](size_t size, std::align_val_t alignment) { return ::autobind::alloc::detail::allocate_aligned(size, (size_t)alignment, false); } \
+    __attribute__((weak, visibility("default"))) void operator delete(void *ptr) noexcept { ::autobind::alloc::detail::deallocate(ptr); }                                 \
+    __attribute__((weak, visibility("default"))) void operator delete[](void *ptr) noexcept { ::autobind::alloc::detail::deallocate(ptr); }                               \
+    __attribute__((weak, visibility("default"))) void operator delete(void *ptr, size_t) noexcept { ::autobind::alloc::detail::deallocate(ptr); }                         \
+    __attribute__((weak, visibility("default"))) void operator delete[](void *ptr, size_t) noexcept { ::autobind::alloc::detail::deallocate(ptr); }                       \
+    __attribute__((weak, visibility("default"))) void operator delete(void *ptr, std::align_val_t) noexcept { ::autobind::alloc::detail::deallocate(ptr); }               \
+    __attribute__((weak, visibility("default"))) void operator delete[](void *ptr, std::align_val_t) noexcept { ::autobind::alloc::detail::deallocate(ptr); }             \
+    __attribute__((weak, visibility("default"))) void operator delete(void *ptr, size_t, std::align_val_t) noexcept { ::autobind::alloc::detail::deallocate(ptr); }       \
+    __attribute__((weak, visibility("default"))) void operator delete[](void *ptr, size_t, std::align_val_t) noexcept { ::autobind::alloc::detail::deallocate(ptr); }
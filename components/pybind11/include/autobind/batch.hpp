@@ -0,0 +1,177 @@
+/**
+ * @file batch.hpp
+ * @brief Runtime helpers for `:batch` bindings emitted by cpp_bind_python.py
+ *
+ * A batched binding converts every input up front, runs the C++ loop once
+ * with the GIL released and converts all results back in one go, so the
+ * pybind11 dispatcher is paid once per batch instead of once per call.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
+
+#include <array>
+#include <string>
+#include <tuple>
+#include <type_traits>
+#include <utility>
+#include <vector>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace detail
+    {
+        /**
+         * Storage type used to hold a converted argument while the GIL is released.
+         * `const char *` is stored as std::string, the caster's buffer won't outlive the conversion.
+         */
+        template <typename T>
+        struct arg_storage
+        {
+            using type = std::decay_t<T>;
+        };
+
+        template <>
+        struct arg_storage<const char *>
+        {
+            using type = std::string;
+        };
+
+        template <typename T>
+        using arg_storage_t = typename arg_storage<std::decay_t<T>>::type;
+
+        template <typename T, typename S>
+        decltype(auto) arg_pass(S &value)
+        {
+            if constexpr (std::is_same_v<std::decay_t<T>, const char *>)
+                return value.c_str();
+            else
+                return (value);
+        }
+
+        template <typename... Args>
+        using arg_tuple = std::tuple<arg_storage_t<Args>...>;
+
+        template <typename T>
+        arg_storage_t<T> load_arg(py::handle h)
+        {
+            py::detail::make_caster<arg_storage_t<T>> caster;
+            if (!caster.load(h, true))
+                throw py::type_error("unable to convert argument of type " + std::string(py::str(py::type::handle_of(h))));
+            return py::detail::cast_op<arg_storage_t<T>>(std::move(caster));
+        }
+
+        template <typename... Args, size_t... I>
+        arg_tuple<Args...> load_args(py::handle item, const py::tuple &defaults, std::index_sequence<I...>)
+        {
+            constexpr size_t count = sizeof...(Args);
+            size_t required = count - defaults.size();
+            bool is_seq = PyTuple_Check(item.ptr()) || PyList_Check(item.ptr());
+            size_t n = is_seq ? (size_t)PySequence_Fast_GET_SIZE(item.ptr()) : 1;
+            if (n < required || n > count)
+                throw py::type_error("expected tuple of " + (required == count ? "" : std::to_string(required) + " to ") + std::to_string(count) + " arguments");
+            std::array<py::handle, count> values{};
+            for (size_t i = 0; i < n; ++i)
+                values[i] = is_seq ? PySequence_Fast_GET_ITEM(item.ptr(), i) : item.ptr();
+            // omitted trailing arguments take the C++ default values, as the unbatched binding does
+            for (size_t i = n; i < count; ++i)
+                values[i] = PyTuple_GET_ITEM(defaults.ptr(), i - required);
+            return arg_tuple<Args...>(load_arg<Args>(values[I])...);
+        }
+
+        /**
+         * Convert one item of the input iterable to an argument tuple, defaults are the values of the trailing
+         * arguments with C++ default values. Functions with a single required argument also accept bare values
+         * instead of 1-tuples.
+         */
+        template <typename... Args>
+        arg_tuple<Args...> load_args(py::handle item, const py::tuple &defaults)
+        {
+            return load_args<Args...>(item, defaults, std::index_sequence_for<Args...>{});
+        }
+
+        /**
+         * Convert all items of inputs, the items are appended to keep so that
+         * pointer and reference arguments stay valid while the GIL is released.
+         */
+        template <typename... Args>
+        std::vector<arg_tuple<Args...>> load_all_args(py::iterable inputs, std::vector<py::object> &keep, const py::tuple &defaults = py::tuple())
+        {
+            std::vector<arg_tuple<Args...>> args;
+            if (py::hasattr(inputs, "__len__"))
+            {
+                size_t n = py::len(inputs);
+                args.reserve(n);
+                keep.reserve(n);
+            }
+            for (auto item : inputs)
+            {
+                args.emplace_back(load_args<Args...>(item, defaults));
+                keep.emplace_back(py::reinterpret_borrow<py::object>(item));
+            }
+            return args;
+        }
+
+        template <typename R, typename... Args, size_t... I>
+        R apply(R (*func)(Args...), arg_tuple<Args...> &args, std::index_sequence<I...>)
+        {
+            return func(arg_pass<Args>(std::get<I>(args))...);
+        }
+
+        template <typename R, typename... Args>
+        R apply(R (*func)(Args...), arg_tuple<Args...> &args)
+        {
+            return apply(func, args, std::index_sequence_for<Args...>{});
+        }
+
+        /**
+         * Results are held by value, pointers keep the policy chosen by the generator.
+         */
+        template <typename R>
+        py::return_value_policy result_policy(py::return_value_policy policy)
+        {
+            return std::is_pointer_v<std::decay_t<R>> ? policy : py::return_value_policy::move;
+        }
+    } // namespace detail
+
+    /**
+     * Call func once per argument tuple in inputs.
+     * @param func function to call, free function or static method
+     * @param inputs iterable of argument tuples (or bare values for single argument functions)
+     * @param policy return value policy for pointer results
+     * @param defaults values of the trailing arguments with C++ default values, used for omitted items
+     * @return list of results, or None if func returns void
+     */
+    template <typename R, typename... Args>
+    py::object batch_call(R (*func)(Args...), py::iterable inputs, py::return_value_policy policy, const py::tuple &defaults = py::tuple())
+    {
+        std::vector<py::object> keep;
+        auto args = detail::load_all_args<Args...>(inputs, keep, defaults);
+        if constexpr (std::is_void_v<R>)
+        {
+            {
+                GilRelease release;
+                for (auto &a : args)
+                    detail::apply(func, a);
+            }
+            return py::none();
+        }
+        else
+        {
+            std::vector<std::decay_t<R>> results;
+            results.reserve(args.size());
+            {
+                GilRelease release;
+                for (auto &a : args)
+                    results.push_back(detail::apply(func, a));
+            }
+            return py::cast(std::move(results), detail::result_policy<R>(policy));
+        }
+    }
+} // namespace autobind
@@ -0,0 +1,130 @@
+/**
+ * @file bench.hpp
+ * @brief Runtime helpers of the native harness `bench_<module>.cpp` emitted by cpp_bind_python.py --bench
+ *
+ * The harness calls the same C++ functions with the same arguments as the
+ * generated `bench_<module>.py` calls the bindings, so the difference of the
+ * two is the cost of the binding: dispatch and argument/result conversion.
+ * Arguments are locals whose address escapes and memory is clobbered before
+ * every call, so the compiler can't fold or hoist calls of inline functions.
+ * Results are printed as one JSON object `{name: ns per call}`.
+ * Doesn't depend on Python, the harness is a plain executable.
+ */
+
+#pragma once
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <type_traits>
+#include <vector>
+
+namespace autobind
+{
+    namespace bench
+    {
+        template <typename T>
+        inline void escape(T *ptr)
+        {
+            asm volatile("" : : "g"(ptr) : "memory");
+        }
+
+        inline void clobber()
+        {
+            asm volatile("" : : : "memory");
+        }
+
+        class Runner
+        {
+        public:
+            /**
+             * Options `--min-time SECONDS` (timing per function, default 0.2), `--repeat N` (best of N runs, default 5),
+             * and names of the functions to run (default all).
+             */
+            Runner(int argc, char *argv[])
+            {
+                for (int i = 1; i < argc; ++i)
+                {
+                    if (strcmp(argv[i], "--min-time") == 0 && i + 1 < argc)
+                        _min_time = atof(argv[++i]);
+                    else if (strcmp(argv[i], "--repeat") == 0 && i + 1 < argc)
+                        _repeat = atoi(argv[++i]) > 0 ? atoi(argv[i]) : 1;
+                    else
+                        _names.push_back(argv[i]);
+                }
+                printf("{");
+            }
+
+            /**
+             * Time func, a lambda calling the function with args (the locals it uses).
+             */
+            template <typename F, typename... Args>
+            void run(const char *name, F &&func, Args &...args)
+            {
+                if (!selected(name))
+                    return;
+                (escape(&args), ...);
+                // calibrate the calls per run to take at least 1/repeat of min_time
+                size_t number = 1;
+                double elapsed = time(func, number);
+                while (elapsed < _min_time / _repeat && number < ((size_t)1 << 40))
+                {
+                    number = elapsed > 0 ? (size_t)(number * (_min_time / _repeat / elapsed) * 1.2) + 1 : number * 10;
+                    elapsed = time(func, number);
+                }
+                double best = elapsed;
+                for (int i = 1; i < _repeat; ++i)
+                {
+                    double t = time(func, number);
+                    best = t < best ? t : best;
+                }
+                printf("%s\n  \"%s\": %.3f", _count++ ? "," : "", name, best / number * 1e9);
+                fflush(stdout);
+            }
+
+            int finish()
+            {
+                printf("\n}\n");
+                return 0;
+            }
+
+        private:
+            template <typename F>
+            static double time(F &func, size_t number)
+            {
+                auto start = std::chrono::steady_clock::now();
+                for (size_t i = 0; i < number; ++i)
+                {
+                    clobber();
+                    if constexpr (std::is_void_v<decltype(func())>)
+                        func();
+                    else
+                    {
+                        decltype(auto) result = func();
+                        escape(&result);
+                    }
+                }
+                return std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+            }
+
+            bool selected(const char *name) const
+            {
+                if (_names.empty())
+                    return true;
+                for (auto &x : _names)
+                {
+                    if (x == name)
+                        return true;
+                }
+                return false;
+            }
+
+            double _min_time = 0.2;
+            int _repeat = 5;
+            std::vector<std::string> _names;
+            int _count = 0;
+        };
+    } // namespace bench
+} // namespace autobind
@@ -0,0 +1,62 @@
+/**
+ * @file common.hpp
+ * @brief Common definitions of the runtime helpers used by generated bindings
+ */
+
+#pragma once
+
+#include <pybind11/pybind11.h>
+
+/**
+ * Same visibility as pybind11's namespace, every extension module keeps its own copy
+ * of the helpers' state instead of sharing it through the dynamic linker.
+ */
+#if !defined(AUTOBIND_NAMESPACE)
+#    if defined(__GNUG__) && !defined(_WIN32)
+#        define AUTOBIND_NAMESPACE autobind __attribute__((visibility("hidden")))
+#    else
+#        define AUTOBIND_NAMESPACE autobind
+#    endif
+#endif
+
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+
+namespace AUTOBIND_NAMESPACE
+{
+    /**
+     * Called with the start and end (steady clock ns) of waiting for the GIL when a GilRelease scope ends,
+     * set by trace.hpp while recording a trace.
+     */
+    inline std::atomic<void (*)(uint64_t, uint64_t)> gil_wait_hook{nullptr};
+
+    /**
+     * Release the GIL for the scope like `py::gil_scoped_release`, reporting the wait to reacquire it to gil_wait_hook.
+     */
+    class GilRelease
+    {
+    public:
+        GilRelease() : _state(PyEval_SaveThread()) {}
+        GilRelease(const GilRelease &) = delete;
+        GilRelease &operator=(const GilRelease &) = delete;
+
+        ~GilRelease()
+        {
+            auto hook = gil_wait_hook.load(std::memory_order_relaxed);
+            if (!hook)
+            {
+                PyEval_RestoreThread(_state);
+                return;
+            }
+            uint64_t start = now();
+            PyEval_RestoreThread(_state);
+            hook(start, now());
+        }
+
+    private:
+        static uint64_t now() { return (uint64_t)std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now().time_since_epoch()).count(); }
+
+        PyThreadState *_state;
+    };
+} // namespace autobind
@@ -0,0 +1,295 @@
+/**
+ * @file dispatch.hpp
+ * @brief Runtime helpers for `:instantiate` templates emitted by cpp_bind_python.py
+ *
+ * A template function or class annotated `:instantiate float,double,uint8_t`
+ * is bound once per type under suffixed names (`scale_float`, ...), plus a
+ * front function under the original name choosing the instantiation by the
+ * dtype of the arguments, so float32 NumPy data runs the float kernel instead
+ * of being converted to double and back. The dtype comes from the `dtype=`
+ * keyword if given, else from the first argument with a `dtype` attribute
+ * (NumPy arrays and scalars) or the buffer protocol (memoryview, array.array,
+ * bytes), else from the first Python bool/int/float argument. Arrays must
+ * match an instantiation exactly, Python scalars also match an instantiation
+ * of the same kind (e.g. int to uint8_t). Without any dtype the
+ * instantiations are tried in order like pybind11 overloads.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <cctype>
+#include <initializer_list>
+#include <optional>
+#include <regex>
+#include <string>
+#include <type_traits>
+#include <utility>
+#include <vector>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace dispatch
+    {
+        /**
+         * Kind ('b' bool, 'i' signed, 'u' unsigned, 'f' float) and size in bytes, as NumPy's dtype.kind/itemsize.
+         */
+        struct DType
+        {
+            char kind;
+            size_t size;
+
+            bool operator==(const DType &other) const { return kind == other.kind && size == other.size; }
+
+            bool is_integer() const { return kind == 'i' || kind == 'u'; }
+
+            std::string name() const
+            {
+                if (kind == 'b')
+                    return "bool";
+                return std::string(kind == 'f' ? "float" : kind == 'i' ? "int" : "uint") + std::to_string(size * 8);
+            }
+        };
+
+        template <typename T>
+        DType dtype_of()
+        {
+            static_assert(std::is_arithmetic_v<T>, "`:instantiate` types must be arithmetic types");
+            if constexpr (std::is_same_v<T, bool>)
+                return {'b', 1};
+            else if constexpr (std::is_floating_point_v<T>)
+                return {'f', sizeof(T)};
+            else
+                return {std::is_signed_v<T> ? 'i' : 'u', sizeof(T)};
+        }
+
+        namespace detail
+        {
+            // "float32", "uint8", "f4", "double", "uint8_t", ...
+            inline std::optional<DType> parse_name(std::string name)
+            {
+                for (auto &c : name)
+                    c = (char)std::tolower((unsigned char)c);
+                if (name.size() > 2 && name.compare(name.size() - 2, 2, "_t") == 0)
+                    name.resize(name.size() - 2);
+                if (name == "bool")
+                    return DType{'b', 1};
+                if (name == "float" || name == "double")
+                    return DType{'f', 8};
+                if (name == "half")
+                    return DType{'f', 2};
+                if (name == "int")
+                    return DType{'i', 8};
+                std::smatch m;
+                static const std::regex bits_re("(float|int|uint)(8|16|32|64)");
+                static const std::regex code_re("([fiub])([1248])");
+                if (std::regex_match(name, m, bits_re))
+                    return DType{m[1] == "float" ? 'f' : m[1] == "int" ? 'i' : 'u', std::stoul(m[2]) / 8};
+                if (std::regex_match(name, m, code_re))
+                    return DType{m[1].str()[0], std::stoul(m[2])};
+                return std::nullopt;
+            }
+
+            // struct module format character of a buffer, e.g. "<f"
+            inline std::optional<DType> parse_format(const char *format, size_t itemsize)
+            {
+                if (!format)
+                    return DType{'u', 1};
+                std::string f(format);
+                if (!f.empty() && std::string("@=<>!").find(f[0]) != std::string::npos)
+                    f.erase(0, 1);
+                if (f.size() != 1)
+                    return std::nullopt;
+                char c = f[0];
+                if (c == '?')
+                    return DType{'b', itemsize};
+                if (c == 'e' || c == 'f' || c == 'd')
+                    return DType{'f', itemsize};
+                if (std::string("bhilqn").find(c) != std::string::npos)
+                    return DType{'i', itemsize};
+                if (std::string("BHILQNc").find(c) != std::string::npos)
+                    return DType{'u', itemsize};
+                return std::nullopt;
+            }
+
+            // dtype of NumPy arrays and scalars or buffer objects
+            inline std::optional<DType> array_dtype(py::handle obj)
+            {
+                if (py::hasattr(obj, "dtype"))
+                {
+                    py::object dtype = obj.attr("dtype");
+                    if (py::hasattr(dtype, "kind") && py::hasattr(dtype, "itemsize"))
+                        return DType{dtype.attr("kind").cast<std::string>()[0], dtype.attr("itemsize").cast<size_t>()};
+                }
+                if (PyObject_CheckBuffer(obj.ptr()) && !PyUnicode_Check(obj.ptr()))
+                {
+                    py::memoryview view = py::reinterpret_steal<py::memoryview>(PyMemoryView_FromObject(obj.ptr()));
+                    if (!view)
+                    {
+                        PyErr_Clear();
+                        return std::nullopt;
+                    }
+                    Py_buffer *buffer = PyMemoryView_GET_BUFFER(view.ptr());
+                    return parse_format(buffer->format, (size_t)buffer->itemsize);
+                }
+                return std::nullopt;
+            }
+
+            inline std::optional<DType> scalar_dtype(py::handle obj)
+            {
+                if (PyBool_Check(obj.ptr()))
+                    return DType{'b', 1};
+                if (PyLong_Check(obj.ptr()))
+                    return DType{'i', 8};
+                if (PyFloat_Check(obj.ptr()))
+                    return DType{'f', 8};
+                return std::nullopt;
+            }
+
+            // value of the dtype= keyword: NumPy dtype, Python or NumPy type, or name
+            inline DType parse_dtype(py::handle obj)
+            {
+                if (py::hasattr(obj, "kind") && py::hasattr(obj, "itemsize"))
+                    return DType{obj.attr("kind").cast<std::string>()[0], obj.attr("itemsize").cast<size_t>()};
+                std::optional<DType> dtype;
+                if (obj.ptr() == (PyObject *)&PyFloat_Type)
+                    dtype = DType{'f', 8};
+                else if (obj.ptr() == (PyObject *)&PyBool_Type)
+                    dtype = DType{'b', 1};
+                else if (obj.ptr() == (PyObject *)&PyLong_Type)
+                    dtype = DType{'i', 8};
+                else if (PyType_Check(obj.ptr()))
+                    dtype = parse_name(obj.attr("__name__").cast<std::string>());
+                else if (PyUnicode_Check(obj.ptr()))
+                    dtype = parse_name(obj.cast<std::string>());
+                if (!dtype)
+                    throw py::value_error("unknown dtype " + py::repr(obj).cast<std::string>());
+                return *dtype;
+            }
+        } // namespace detail
+
+        class Dispatcher
+        {
+        public:
+            Dispatcher(std::string name, std::vector<std::pair<DType, py::object>> funcs) : _name(std::move(name)), _funcs(std::move(funcs)) {}
+
+            py::object operator()(const py::args &args, const py::kwargs &kwargs) const
+            {
+                if (kwargs.contains("dtype"))
+                {
+                    DType dtype = detail::parse_dtype(kwargs["dtype"]);
+                    py::dict rest;
+                    for (auto item : kwargs)
+                    {
+                        if (!py::str(item.first).equal(py::str("dtype")))
+                            rest[item.first] = item.second;
+                    }
+                    return find(dtype, false)(*args, **rest);
+                }
+                std::vector<py::handle> values(args.begin(), args.end());
+                for (auto item : kwargs)
+                    values.push_back(item.second);
+                for (auto value : values)
+                {
+                    if (auto dtype = detail::array_dtype(value))
+                        return find(*dtype, false)(*args, **kwargs);
+                }
+                for (auto value : values)
+                {
+                    if (auto dtype = detail::scalar_dtype(value))
+                    {
+                        if (py::object func = match(*dtype, true))
+                            return func(*args, **kwargs);
+                        break;
+                    }
+                }
+                // no dtype, try in order like overloads
+                for (size_t i = 0; i < _funcs.size(); ++i)
+                {
+                    try
+                    {
+                        return _funcs[i].second(*args, **kwargs);
+                    }
+                    catch (py::error_already_set &e)
+                    {
+                        if (!e.matches(PyExc_TypeError) || i + 1 == _funcs.size())
+                            throw;
+                    }
+                }
+                throw py::type_error(_name + "() has no instantiation");
+            }
+
+            std::string dtypes() const
+            {
+                std::string names;
+                for (auto &item : _funcs)
+                    names += (names.empty() ? "" : ", ") + item.first.name();
+                return names;
+            }
+
+        private:
+            py::object match(const DType &dtype, bool scalar) const
+            {
+                for (auto &item : _funcs)
+                {
+                    if (item.first == dtype)
+                        return item.second;
+                }
+                if (scalar)
+                {
+                    for (auto &item : _funcs)
+                    {
+                        if (item.first.kind == dtype.kind || (item.first.is_integer() && dtype.is_integer()))
+                            return item.second;
+                    }
+                }
+                return py::object();
+            }
+
+            py::object find(const DType &dtype, bool scalar) const
+            {
+                py::object func = match(dtype, scalar);
+                if (!func)
+                    throw py::type_error(_name + "() has no instantiation for dtype " + dtype.name() + ", instantiated for " + dtypes());
+                return func;
+            }
+
+            std::string _name;
+            std::vector<std::pair<DType, py::object>> _funcs;
+        };
+
+        template <typename Scope>
+        Dispatcher make(Scope &scope, const char *name, std::initializer_list<std::pair<DType, const char *>> instantiations)
+        {
+            std::vector<std::pair<DType, py::object>> funcs;
+            for (auto &item : instantiations)
+                funcs.emplace_back(item.first, scope.attr(item.second));
+            return Dispatcher(name, std::move(funcs));
+        }
+    } // namespace dispatch
+
+    /**
+     * Add the front function name to module m, calling the instantiation (already bound) matching the dtype of the arguments.
+     */
+    inline void def_dispatch(py::module_ &m, const char *name, std::initializer_list<std::pair<dispatch::DType, const char *>> instantiations, const char *doc)
+    {
+        m.def(name, dispatch::make(m, name, instantiations), doc);
+    }
+
+    /**
+     * Add the front method name to class cls, static for static template methods.
+     */
+    template <typename... Options>
+    void def_dispatch(py::class_<Options...> &cls, const char *name, std::initializer_list<std::pair<dispatch::DType, const char *>> instantiations, const char *doc, bool is_static = false)
+    {
+        if (is_static)
+            cls.def_static(name, dispatch::make(cls, name, instantiations), doc);
+        else
+            cls.def(name, dispatch::make(cls, name, instantiations), doc);
+    }
+} // namespace autobind
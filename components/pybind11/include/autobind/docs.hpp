@@ -0,0 +1,249 @@
+/**
+ * @file docs.hpp
+ * @brief Runtime helpers for the `--strip-docs` option of cpp_bind_python.py
+ *
+ * With `--strip-docs` the bindings are generated without docstrings and with
+ * pybind11's function signatures disabled, so no doc text ends up in the
+ * extension module. The docs are written to a gzip compressed JSON sidecar
+ * file shipped next to the module instead, it is loaded once on the first read
+ * of `__doc__` of the module, one of its submodules (also lazy ones) or classes,
+ * on the first `help()` call, by `pydoc.render_doc()` if pydoc was imported
+ * before the module, or by calling `__load_docs__()`. Reading `__doc__` of a
+ * function can't be intercepted, it is None until one of these loaded the docs.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <cstdlib>
+#include <cstring>
+#include <memory>
+#include <string>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace docs
+    {
+        class Sidecar
+        {
+        public:
+            /**
+             * Make the docs of root and its submodules load from file_name (in the directory of root's `__file__`)
+             * on demand, and add `root.__load_docs__()`.
+             */
+            static void install(py::module_ root, const char *file_name)
+            {
+                std::shared_ptr<Sidecar> self(new Sidecar(root, file_name));
+                self->_self = self;
+                py::object builtins = py::module_::import("builtins");
+                py::object doc = builtins.attr("property")(
+                    py::cpp_function([self](py::handle module) { return self->module_doc(module); }),
+                    py::cpp_function([self](py::handle module, py::object value) { self->_module_docs[module.attr("__name__")] = value; }));
+                py::dict attrs;
+                attrs["__doc__"] = doc;
+                attrs["__slots__"] = py::tuple();
+                attrs["__module__"] = root.attr("__name__");
+                // called by LazyModules for the submodules it creates later
+                attrs["__autobind_hook__"] = py::cpp_function([self](py::module_ module) { self->hook_modules(module); });
+                self->_module_class = builtins.attr("type")("module", py::make_tuple(py::module_::import("types").attr("ModuleType")), attrs);
+                self->hook_modules(root);
+                self->hook_help(builtins);
+                root.def("__load_docs__", [self]() { return self->load(); });
+            }
+
+            /**
+             * Load the sidecar file and install all docstrings, only the first call reads the file.
+             * @return number of docs installed
+             */
+            size_t load()
+            {
+                if (_loaded)
+                    return _count;
+                _loaded = true;
+                py::object file = _root.attr("__dict__").attr("get")("__file__");
+                if (file.is_none())
+                    return 0;
+                py::module_ os_path = py::module_::import("os.path");
+                py::object path = os_path.attr("join")(os_path.attr("dirname")(file), _file_name);
+                if (!os_path.attr("exists")(path).cast<bool>())
+                    return 0;
+                py::object f = py::module_::import("io").attr("open")(path, "rb");
+                py::object data = f.attr("read")();
+                f.attr("close")();
+                py::dict docs = py::module_::import("json").attr("loads")(py::module_::import("gzip").attr("decompress")(data));
+                for (auto item : docs)
+                {
+                    py::object obj = find(item.first.cast<std::string>());
+                    if (!obj)
+                        continue;
+                    set_doc(obj, item.second.cast<std::string>());
+                    ++_count;
+                }
+                return _count;
+            }
+
+        private:
+            Sidecar(py::module_ root, const char *file_name) : _root(std::move(root)), _file_name(file_name) {}
+
+            py::object module_doc(py::handle module)
+            {
+                load();
+                py::object name = module.attr("__name__");
+                return _module_docs.contains(name) ? py::object(_module_docs[name]) : py::none();
+            }
+
+            // swap the class of module and its submodules, and the metaclass of their classes, so reading __doc__ triggers load()
+            void hook_modules(py::module_ module)
+            {
+                if (!py::type::of(module).is(_module_class))
+                    module.attr("__class__") = _module_class;
+                std::string name = module.attr("__name__").cast<std::string>();
+                for (auto item : module.attr("__dict__").cast<py::dict>())
+                {
+                    if (PyModule_Check(item.second.ptr()) && item.second.attr("__name__").cast<std::string>().rfind(name + ".", 0) == 0 &&
+                        !py::type::of(item.second).is(_module_class))
+                        hook_modules(py::reinterpret_borrow<py::module_>(item.second));
+                    else if (PyType_Check(item.second.ptr()))
+                        hook_class(item.second, name);
+                }
+            }
+
+            // classes of the module (and their nested classes) get a subclass of their metaclass with a __doc__ property
+            void hook_class(py::handle cls, const std::string &module_name)
+            {
+                PyTypeObject *meta = Py_TYPE(cls.ptr());
+                if (!(meta->tp_flags & Py_TPFLAGS_HEAPTYPE))
+                    return;
+                py::handle meta_obj((PyObject *)meta);
+                py::object hooked = _class_metas.attr("get")(meta_obj, py::none());
+                py::object module = py::getattr(cls, "__module__", py::none());
+                if (hooked.is(meta_obj) || !py::isinstance<py::str>(module) || module.cast<std::string>() != module_name)
+                    return;
+                if (hooked.is_none())
+                {
+                    std::shared_ptr<Sidecar> self = _self.lock();
+                    // type's own __doc__ descriptor reads and writes the class dict, so instances see the docs too
+                    py::object type_doc = py::reinterpret_borrow<py::object>((PyObject *)&PyType_Type).attr("__dict__")["__doc__"];
+                    py::dict attrs;
+                    attrs["__doc__"] = py::module_::import("builtins").attr("property")(
+                        py::cpp_function([self, type_doc](py::handle c) {
+                            self->load();
+                            return type_doc.attr("__get__")(c);
+                        }),
+                        py::cpp_function([type_doc](py::handle c, py::object value) { type_doc.attr("__set__")(c, value); }));
+                    attrs["__slots__"] = py::tuple();
+                    attrs["__module__"] = meta_obj.attr("__module__");
+                    hooked = py::type::of(meta_obj)(meta_obj.attr("__name__"), py::make_tuple(meta_obj), attrs);
+                    _class_metas[meta_obj] = hooked;
+                    _class_metas[hooked] = hooked;
+                }
+                cls.attr("__class__") = hooked;
+                for (auto item : cls.attr("__dict__").attr("items")())
+                {
+                    py::handle value = item.cast<py::tuple>()[1];
+                    if (PyType_Check(value.ptr()) && !value.is(cls))
+                        hook_class(value, module_name);
+                }
+            }
+
+            // help() and, if already imported, pydoc.render_doc() load the docs before rendering, functions included
+            void hook_help(py::object builtins)
+            {
+                std::shared_ptr<Sidecar> self = _self.lock();
+                if (py::hasattr(builtins, "help"))
+                {
+                    // subclass of site's _Helper, keeps its repr
+                    py::object help = builtins.attr("help");
+                    py::dict attrs;
+                    attrs["__call__"] = py::cpp_function([self, help](py::args args, py::kwargs kwargs) {
+                        self->load();
+                        return help(*args, **kwargs);
+                    });
+                    attrs["__module__"] = py::type::of(help).attr("__module__");
+                    builtins.attr("help") = builtins.attr("type")(py::type::of(help).attr("__name__"), py::make_tuple(py::type::of(help)), attrs)();
+                }
+                py::dict modules = py::module_::import("sys").attr("modules");
+                if (modules.contains("pydoc"))
+                {
+                    py::object pydoc = modules["pydoc"];
+                    py::object render_doc = pydoc.attr("render_doc");
+                    pydoc.attr("render_doc") = py::cpp_function([self, render_doc](py::args args, py::kwargs kwargs) {
+                        self->load();
+                        return render_doc(*args, **kwargs);
+                    });
+                }
+            }
+
+            // object at dotted path relative to the root module, "" is the root module, null if not found
+            py::object find(const std::string &path)
+            {
+                py::object obj = _root;
+                size_t start = 0;
+                while (start < path.size())
+                {
+                    size_t end = path.find('.', start);
+                    if (end == std::string::npos)
+                        end = path.size();
+                    PyObject *attr = PyObject_GetAttrString(obj.ptr(), path.substr(start, end - start).c_str());
+                    if (!attr)
+                    {
+                        PyErr_Clear();
+                        return py::object();
+                    }
+                    obj = py::reinterpret_steal<py::object>(attr);
+                    start = end + 1;
+                }
+                return obj;
+            }
+
+            void set_doc(py::handle obj, const std::string &doc)
+            {
+                // methods looked up on pybind11 classes are still wrapped
+                if (PyInstanceMethod_Check(obj.ptr()))
+                    obj = PyInstanceMethod_GET_FUNCTION(obj.ptr());
+                if (PyModule_Check(obj.ptr()))
+                {
+                    // lazy submodules are created after install()
+                    if (!py::type::of(obj).is(_module_class))
+                        obj.attr("__class__") = _module_class;
+                    _module_docs[obj.attr("__name__")] = py::str(doc);
+                }
+                else if (PyCFunction_Check(obj.ptr()))
+                {
+                    // pybind11 functions own their malloc'ed ml_doc, others (fastcall) have static PyMethodDef
+                    auto *func = (PyCFunctionObject *)obj.ptr();
+                    PyObject *self = PyCFunction_GET_SELF(obj.ptr());
+                    if (self && PyCapsule_CheckExact(self) && py::detail::is_function_record_capsule(py::reinterpret_borrow<py::capsule>(self)))
+                        std::free(const_cast<char *>(func->m_ml->ml_doc));
+                    func->m_ml->ml_doc = strdup(doc.c_str());
+                }
+                else if (PyType_Check(obj.ptr()))
+                    obj.attr("__doc__") = doc;
+                else
+                {
+                    // callable objects, e.g. `:memoize` wrappers, have a class of their own
+                    py::type::of(obj).attr("__doc__") = doc;
+                }
+            }
+
+            py::module_ _root;
+            std::string _file_name;
+            std::weak_ptr<Sidecar> _self;
+            py::object _module_class;
+            py::dict _class_metas; // original and hooked metaclass -> hooked metaclass
+            py::dict _module_docs;
+            bool _loaded = false;
+            size_t _count = 0;
+        };
+
+        inline void install(py::module_ root, const char *file_name)
+        {
+            Sidecar::install(std::move(root), file_name);
+        }
+    } // namespace docs
+} // namespace autobind
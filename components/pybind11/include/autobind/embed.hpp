@@ -0,0 +1,141 @@
+/**
+ * @file embed.hpp
+ * @brief Embedded interpreter runner of the project executable
+ *
+ * With `EMBED_RUNNER` enabled the generated modules are linked into the
+ * project executable as built-in modules (see embedded_module.hpp) and
+ * `main()` calls `autobind::embed::run()`, which starts an interpreter and
+ * runs a script like `python3` does. Importing a built-in module needs no
+ * dlopen, no relocation of `libmain.so` and no search of sys.path, and `site`
+ * is skipped unless `--site` is given, so starting the runner and importing
+ * the modules is much faster than `python3 -c "import <pkg>"`.
+ * Pure-Python files frozen by freeze_python.py (built-in module
+ * `_autobind_frozen`) are imported from memory by its meta path finder.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/embed.h>
+
+#include <algorithm>
+#include <climits>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#include <unistd.h>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace embed
+    {
+        namespace detail
+        {
+            inline bool has_frozen()
+            {
+                for (struct _inittab *p = PyImport_Inittab; p->name; ++p)
+                {
+                    if (strcmp(p->name, "_autobind_frozen") == 0)
+                        return true;
+                }
+                return false;
+            }
+
+            inline int usage(const char *prog)
+            {
+                fprintf(stderr, "usage: %s [--site] (-m module | -c code | script.py) [args ...]\n", prog);
+                return 2;
+            }
+
+            // sys.path[0] as python3 sets it: the script's directory, the current directory for -m, "" for -c
+            inline std::string path0(const std::string &mode)
+            {
+                if (mode == "-c")
+                    return "";
+                char path[PATH_MAX];
+                if (mode == "-m")
+                    return getcwd(path, sizeof(path)) ? path : "";
+                if (!realpath(mode.c_str(), path))
+                    return "";
+                std::string dir(path);
+                return dir.substr(0, std::max<size_t>(dir.rfind('/'), 1));
+            }
+
+            // exit code of SystemExit, printing non-integer codes like Python does
+            inline int exit_code(py::error_already_set &e)
+            {
+                py::object code = e.value().attr("code");
+                if (code.is_none())
+                    return 0;
+                if (PyLong_Check(code.ptr()))
+                    return code.cast<int>();
+                fprintf(stderr, "%s\n", py::str(code).cast<std::string>().c_str());
+                return 1;
+            }
+        } // namespace detail
+
+        /**
+         * Run `[--site] (-m module | -c code | script.py) [args ...]` in an embedded interpreter,
+         * sys.argv is set as python3 does, returns the exit code.
+         */
+        inline int run(int argc, char *argv[])
+        {
+            int i = 1;
+            bool site = false;
+            if (i < argc && strcmp(argv[i], "--site") == 0)
+            {
+                site = true;
+                ++i;
+            }
+            if (i >= argc || ((strcmp(argv[i], "-m") == 0 || strcmp(argv[i], "-c") == 0) && i + 1 >= argc))
+                return detail::usage(argv[0]);
+            std::string mode = argv[i];
+            std::string target = mode == "-m" || mode == "-c" ? argv[++i] : mode;
+            std::vector<const char *> args{mode == "-m" || mode == "-c" ? mode.c_str() : argv[i]};
+            for (++i; i < argc; ++i)
+                args.push_back(argv[i]);
+
+            PyConfig config;
+            PyConfig_InitPythonConfig(&config);
+            // our own options are parsed above, the rest is sys.argv
+            config.parse_argv = 0;
+            config.site_import = site ? 1 : 0;
+            // sys.path[0] is set below, pybind11 would import os.path for it
+            py::scoped_interpreter guard(&config, (int)args.size(), args.data(), false);
+            try
+            {
+                py::module_::import("sys").attr("path").attr("insert")(0, detail::path0(mode));
+                if (detail::has_frozen())
+                    py::module_::import("_autobind_frozen").attr("install")();
+                py::object globals = py::module_::import("__main__").attr("__dict__");
+                if (mode == "-m")
+                {
+                    using namespace pybind11::literals;
+                    py::module_::import("runpy").attr("run_module")(target, "run_name"_a = "__main__", "alter_sys"_a = true);
+                }
+                else if (mode == "-c")
+                {
+                    py::module_ builtins = py::module_::import("builtins");
+                    builtins.attr("exec")(builtins.attr("compile")(target, "<string>", "exec"), globals);
+                }
+                else
+                    py::eval_file(target, globals);
+            }
+            catch (py::error_already_set &e)
+            {
+                if (e.matches(PyExc_SystemExit))
+                    return detail::exit_code(e);
+                e.restore();
+                PyErr_Print();
+                return 1;
+            }
+            return 0;
+        }
+    } // namespace embed
+} // namespace autobind
@@ -0,0 +1,17 @@
+/**
+ * @file embedded_module.hpp
+ * @brief Build a generated binding as a built-in module of the embedded interpreter runner
+ *
+ * Included before a generated `bind_<name>.cpp`, turns its `PYBIND11_MODULE`
+ * into `PYBIND11_EMBEDDED_MODULE`, which registers the module in the
+ * interpreter's built-in module table before `main()` runs, so importing it
+ * needs no dlopen and no search of sys.path. The object must be linked into
+ * the executable itself, see `ADD_EXECUTABLE_SRCS` of `register_component`.
+ */
+
+#pragma once
+
+#include <pybind11/embed.h>
+
+#undef PYBIND11_MODULE
+#define PYBIND11_MODULE(name, variable) PYBIND11_EMBEDDED_MODULE(name, variable)
@@ -0,0 +1,219 @@
+/**
+ * @file fastcall.hpp
+ * @brief Runtime helpers for the `--fastcall` backend of cpp_bind_python.py
+ *
+ * Functions taking and returning only ints, floats, bools and strings are
+ * emitted as plain CPython `METH_FASTCALL | METH_KEYWORDS` functions, which
+ * unbox the arguments with PyLong_AsLongLong / PyFloat_AsDouble directly
+ * instead of going through the pybind11 dispatcher and its type casters.
+ * Argument errors and C++ exceptions are reported the same way as pybind11.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <limits>
+#include <string>
+#include <type_traits>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace fastcall
+    {
+        /**
+         * Match positional and keyword arguments to names, out must have n items set to nullptr.
+         * @param required number of arguments without default value
+         * @return false with a Python TypeError set if arguments don't match
+         */
+        inline bool parse_args(const char *fname, const char *const *names, Py_ssize_t n, Py_ssize_t required,
+                               PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames, PyObject **out)
+        {
+            nargs = PyVectorcall_NARGS(nargs);
+            if (nargs > n)
+            {
+                PyErr_Format(PyExc_TypeError, "%s() takes at most %zd arguments (%zd given)", fname, n, nargs);
+                return false;
+            }
+            for (Py_ssize_t i = 0; i < nargs; ++i)
+                out[i] = args[i];
+            Py_ssize_t nkw = kwnames ? PyTuple_GET_SIZE(kwnames) : 0;
+            for (Py_ssize_t k = 0; k < nkw; ++k)
+            {
+                PyObject *key = PyTuple_GET_ITEM(kwnames, k);
+                Py_ssize_t i = 0;
+                while (i < n && PyUnicode_CompareWithASCIIString(key, names[i]) != 0)
+                    ++i;
+                if (i == n)
+                {
+                    PyErr_Format(PyExc_TypeError, "%s() got an unexpected keyword argument '%U'", fname, key);
+                    return false;
+                }
+                if (out[i])
+                {
+                    PyErr_Format(PyExc_TypeError, "%s() got multiple values for argument '%s'", fname, names[i]);
+                    return false;
+                }
+                out[i] = args[nargs + k];
+            }
+            for (Py_ssize_t i = 0; i < required; ++i)
+            {
+                if (!out[i])
+                {
+                    PyErr_Format(PyExc_TypeError, "%s() missing required argument '%s' (pos %zd)", fname, names[i], i + 1);
+                    return false;
+                }
+            }
+            return true;
+        }
+
+        inline bool arg_error(const char *fname, const char *name, const char *expected, PyObject *obj)
+        {
+            PyErr_Clear();
+            PyErr_Format(PyExc_TypeError, "%s(): argument '%s' must be %s, not %s", fname, name, expected, Py_TYPE(obj)->tp_name);
+            return false;
+        }
+
+        inline bool int_error(const char *fname, const char *name, PyObject *obj)
+        {
+            if (!PyLong_Check(obj))
+                return arg_error(fname, name, "int", obj);
+            PyErr_Clear();
+            PyErr_Format(PyExc_TypeError, "%s(): argument '%s' is out of range of the C++ type", fname, name);
+            return false;
+        }
+
+        /**
+         * Convert obj to value, same acceptance as pybind11's casters with conversion enabled.
+         * @return false with a Python TypeError set on failure
+         */
+        template <typename T>
+        bool load(PyObject *obj, T &value, const char *fname, const char *name)
+        {
+            if constexpr (std::is_same_v<T, bool>)
+            {
+                if (obj != Py_True && obj != Py_False)
+                    return arg_error(fname, name, "bool", obj);
+                value = obj == Py_True;
+            }
+            else if constexpr (std::is_integral_v<T>)
+            {
+                if (PyFloat_Check(obj))
+                    return arg_error(fname, name, "int", obj);
+                if constexpr (std::is_signed_v<T>)
+                {
+                    long long v = PyLong_AsLongLong(obj);
+                    if ((v == -1 && PyErr_Occurred()) || v < (long long)std::numeric_limits<T>::min() || v > (long long)std::numeric_limits<T>::max())
+                        return int_error(fname, name, obj);
+                    value = (T)v;
+                }
+                else
+                {
+                    if (!PyLong_Check(obj))
+                        return arg_error(fname, name, "int", obj);
+                    unsigned long long v = PyLong_AsUnsignedLongLong(obj);
+                    if ((v == (unsigned long long)-1 && PyErr_Occurred()) || v > (unsigned long long)std::numeric_limits<T>::max())
+                        return int_error(fname, name, obj);
+                    value = (T)v;
+                }
+            }
+            else if constexpr (std::is_floating_point_v<T>)
+            {
+                double v = PyFloat_CheckExact(obj) ? PyFloat_AS_DOUBLE(obj) : PyFloat_AsDouble(obj);
+                if (v == -1.0 && PyErr_Occurred())
+                    return arg_error(fname, name, "float", obj);
+                value = (T)v;
+            }
+            else if constexpr (std::is_same_v<T, std::string> || std::is_same_v<T, const char *>)
+            {
+                const char *data = nullptr;
+                Py_ssize_t size = 0;
+                if (PyUnicode_Check(obj))
+                    data = PyUnicode_AsUTF8AndSize(obj, &size);
+                else if (PyBytes_Check(obj))
+                {
+                    data = PyBytes_AS_STRING(obj);
+                    size = PyBytes_GET_SIZE(obj);
+                }
+                if (!data)
+                    return arg_error(fname, name, "str", obj);
+                // const char * points into obj, valid until the call returns
+                if constexpr (std::is_same_v<T, std::string>)
+                    value.assign(data, (size_t)size);
+                else
+                    value = data;
+            }
+            else
+                static_assert(std::is_same_v<T, bool>, "type not supported by fastcall");
+            return true;
+        }
+
+        template <typename T>
+        PyObject *cast(const T &value)
+        {
+            if constexpr (std::is_same_v<T, bool>)
+                return PyBool_FromLong(value);
+            else if constexpr (std::is_integral_v<T> && std::is_signed_v<T>)
+                return PyLong_FromLongLong(value);
+            else if constexpr (std::is_integral_v<T>)
+                return PyLong_FromUnsignedLongLong(value);
+            else if constexpr (std::is_floating_point_v<T>)
+                return PyFloat_FromDouble(value);
+            else if constexpr (std::is_same_v<T, std::string>)
+                return PyUnicode_DecodeUTF8(value.data(), (Py_ssize_t)value.size(), nullptr);
+            else if constexpr (std::is_same_v<T, const char *> || std::is_same_v<T, char *>)
+            {
+                if (!value)
+                    Py_RETURN_NONE;
+                return PyUnicode_DecodeUTF8(value, (Py_ssize_t)std::char_traits<char>::length(value), nullptr);
+            }
+            else
+                static_assert(std::is_same_v<T, bool>, "type not supported by fastcall");
+        }
+
+        /**
+         * Call func and convert the result, C++ exceptions are translated by pybind11's registered translators.
+         */
+        template <typename F>
+        PyObject *call(F &&func)
+        {
+            try
+            {
+                if constexpr (std::is_void_v<decltype(func())>)
+                {
+                    func();
+                    Py_RETURN_NONE;
+                }
+                else
+                    return cast(func());
+            }
+            catch (py::error_already_set &e)
+            {
+                e.restore();
+            }
+            catch (...)
+            {
+                if (!py::detail::apply_exception_translators(py::detail::get_local_internals().registered_exception_translators) &&
+                    !py::detail::apply_exception_translators(py::detail::get_internals().registered_exception_translators))
+                    PyErr_SetString(PyExc_SystemError, "Exception escaped from default exception translator!");
+            }
+            return nullptr;
+        }
+
+        /**
+         * Create the function object of def and set it as attribute of scope (module or class).
+         */
+        inline void add_function(py::handle scope, PyMethodDef *def)
+        {
+            py::object module_name = PyModule_Check(scope.ptr()) ? scope.attr("__name__") : scope.attr("__module__");
+            PyObject *func = PyCFunction_NewEx(def, nullptr, module_name.ptr());
+            if (!func)
+                throw py::error_already_set();
+            scope.attr(def->ml_name) = py::reinterpret_steal<py::object>(func);
+        }
+    } // namespace fastcall
+} // namespace autobind
@@ -0,0 +1,252 @@
+/**
+ * @file freelist.hpp
+ * @brief Runtime helpers for `:freelist` bindings emitted by cpp_bind_python.py
+ *
+ * Small value classes created and destroyed at a high rate (points, rects,
+ * colors) get their C++ objects from a per-type slab allocator instead of a
+ * separate `new` per object: slabs of slots are allocated once, freed objects
+ * go to a freelist and their slot is reused by the next object. Objects
+ * created by the bound constructor and objects returned by value (copied or
+ * moved into Python) both use the slabs, the holder returns them on
+ * deallocation. All allocations happen in pybind11 under the GIL.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <cstdint>
+#include <cstdlib>
+#include <memory>
+#include <new>
+#include <type_traits>
+#include <unordered_set>
+#include <utility>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    template <typename T>
+    class Freelist
+    {
+    public:
+        static Freelist &instance()
+        {
+            // never destroyed, Python objects may still hold slots at exit
+            static Freelist *freelist = new Freelist();
+            return *freelist;
+        }
+
+        template <typename... Args>
+        T *create(Args &&...args)
+        {
+            void *slot = allocate();
+            try
+            {
+                return new (slot) T(std::forward<Args>(args)...);
+            }
+            catch (...)
+            {
+                release(slot);
+                throw;
+            }
+        }
+
+        /**
+         * Destroy obj, objects not from the slabs (e.g. created by C++ code and returned with take_ownership) are deleted.
+         */
+        void destroy(T *obj)
+        {
+            if (!owns(obj))
+            {
+                ++_foreign;
+                delete obj;
+                return;
+            }
+            obj->~T();
+            release(obj);
+        }
+
+        py::dict stats() const
+        {
+            py::dict stats;
+            stats["created"] = _created;
+            stats["reused"] = _reused;
+            stats["saved"] = _created - _slabs.size();
+            stats["in_use"] = _in_use;
+            stats["slabs"] = _slabs.size();
+            stats["slab_size"] = SlabSize;
+            stats["foreign"] = _foreign;
+            return stats;
+        }
+
+    private:
+        union Slot
+        {
+            Slot *next;
+            alignas(T) unsigned char storage[sizeof(T)];
+        };
+
+        static constexpr size_t next_pow2(size_t n)
+        {
+            size_t size = 1;
+            while (size < n)
+                size <<= 1;
+            return size;
+        }
+
+        // slabs are aligned to their size, so the slab of a slot is found by masking its address
+        static constexpr size_t SlabSize = next_pow2(sizeof(Slot) * 64 > 4096 ? sizeof(Slot) * 64 : 4096);
+        static constexpr size_t SlotsPerSlab = SlabSize / sizeof(Slot);
+
+        Freelist() = default;
+
+        bool owns(const void *ptr) const
+        {
+            return _slabs.count(reinterpret_cast<uintptr_t>(ptr) & ~(uintptr_t)(SlabSize - 1)) != 0;
+        }
+
+        void *allocate()
+        {
+            ++_created;
+            ++_in_use;
+            if (_free)
+            {
+                ++_reused;
+                Slot *slot = _free;
+                _free = slot->next;
+                return slot;
+            }
+            if (!_unused)
+            {
+                void *slab = std::aligned_alloc(SlabSize, SlabSize);
+                if (!slab)
+                {
+                    --_created;
+                    --_in_use;
+                    throw std::bad_alloc();
+                }
+                _slabs.insert(reinterpret_cast<uintptr_t>(slab));
+                _next = static_cast<Slot *>(slab);
+                _unused = SlotsPerSlab;
+            }
+            --_unused;
+            return _next++;
+        }
+
+        void release(void *ptr)
+        {
+            Slot *slot = static_cast<Slot *>(ptr);
+            slot->next = _free;
+            _free = slot;
+            --_in_use;
+        }
+
+        std::unordered_set<uintptr_t> _slabs;
+        Slot *_free = nullptr;
+        Slot *_next = nullptr;
+        size_t _unused = 0;
+        size_t _created = 0;
+        size_t _reused = 0;
+        size_t _in_use = 0;
+        size_t _foreign = 0;
+    };
+
+    template <typename T>
+    struct FreelistDeleter
+    {
+        void operator()(T *obj) const { Freelist<T>::instance().destroy(obj); }
+    };
+
+    /**
+     * Holder of `:freelist` classes, `py::class_<T, FreelistHolder<T>>`.
+     */
+    template <typename T>
+    using FreelistHolder = std::unique_ptr<T, FreelistDeleter<T>>;
+
+    /**
+     * Constructor `py::init` allocating from the freelist, Args are the C++ constructor argument types.
+     */
+    template <typename T, typename... Args>
+    auto freelist_init()
+    {
+        return py::init([](Args... args) { return Freelist<T>::instance().create(std::forward<Args>(args)...); });
+    }
+
+    /**
+     * Type caster of `:freelist` classes, copies and moves values returned to Python into freelist slots.
+     * Specialized by AUTOBIND_FREELIST_CASTER(T) before the class is used in bindings.
+     */
+    template <typename T>
+    class FreelistCaster : public py::detail::type_caster_base<T>
+    {
+        using base = py::detail::type_caster_base<T>;
+        using Constructor = void *(*)(const void *);
+
+    public:
+        static py::handle cast(const T &src, py::return_value_policy policy, py::handle parent)
+        {
+            if (policy == py::return_value_policy::automatic || policy == py::return_value_policy::automatic_reference)
+                policy = py::return_value_policy::copy;
+            return cast(&src, policy, parent);
+        }
+
+        static py::handle cast(T &&src, py::return_value_policy, py::handle parent)
+        {
+            return cast(&src, py::return_value_policy::move, parent);
+        }
+
+        static py::handle cast(const T *src, py::return_value_policy policy, py::handle parent)
+        {
+            auto st = base::src_and_type(src);
+            return py::detail::type_caster_generic::cast(st.first, policy, parent, st.second, copy_constructor(), move_constructor());
+        }
+
+    private:
+        static Constructor copy_constructor()
+        {
+            if constexpr (std::is_copy_constructible_v<T>)
+                return [](const void *arg) -> void * { return Freelist<T>::instance().create(*reinterpret_cast<const T *>(arg)); };
+            else
+                return nullptr;
+        }
+
+        static Constructor move_constructor()
+        {
+            if constexpr (std::is_move_constructible_v<T>)
+                return [](const void *arg) -> void * { return Freelist<T>::instance().create(std::move(*const_cast<T *>(reinterpret_cast<const T *>(arg)))); };
+            else
+                return copy_constructor();
+        }
+    };
+
+    /**
+     * Add static `__freelist_stats__()` to the bound class, returning the counters of its freelist:
+     * created objects, reused slots, saved heap allocations, objects in use, slabs, slab size,
+     * and objects not allocated by the freelist.
+     */
+    template <typename Class>
+    void def_freelist_stats(Class &cls)
+    {
+        using T = typename Class::type;
+        cls.def_static("__freelist_stats__", []() { return Freelist<T>::instance().stats(); }, "Counters of the slab allocator of this class");
+    }
+} // namespace autobind
+
+/**
+ * Use FreelistCaster for T, must be placed at global scope before T is used in bindings.
+ */
+#define AUTOBIND_FREELIST_CASTER(...)                                                                  \
+    namespace pybind11                                                                                 \
+    {                                                                                                  \
+        namespace detail                                                                               \
+        {                                                                                              \
+            template <>                                                                                \
+            class type_caster<__VA_ARGS__> : public ::autobind::FreelistCaster<__VA_ARGS__>            \
+            {                                                                                          \
+            };                                                                                         \
+        }                                                                                              \
+    }
@@ -0,0 +1,293 @@
+/**
+ * @file instrument.hpp
+ * @brief Runtime helpers for `--instrument` bindings emitted by cpp_bind_python.py
+ *
+ * Every bound function counts its calls and errors and records two latency
+ * histograms with log2 buckets: the time spent converting arguments and the
+ * result between Python and C++, and the time spent in the C++ function
+ * itself. The whole call is timed by wrapping the pybind11 function record's
+ * `impl` (which converts the arguments, calls and converts the result), the
+ * C++ call by a `py::call_guard` constructed just around it; conversion time
+ * is the difference. Counters are relaxed atomics, so functions called
+ * without the GIL held by the caller of C++ code stay correct. Overloads
+ * share the counters of their name. `<module>.__stats__()` and
+ * `<module>.__stats_reset__()` read and reset the counters of the module.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+#include <exception>
+#include <map>
+#include <memory>
+#include <mutex>
+#include <string>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace instrument
+    {
+        inline uint64_t now_ns()
+        {
+            return (uint64_t)std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now().time_since_epoch()).count();
+        }
+
+        /**
+         * Latency histogram, bucket i counts durations in [2^i, 2^(i+1)) ns (bucket 0 also 0 ns), the last bucket has no upper bound.
+         */
+        class Histogram
+        {
+        public:
+            static constexpr size_t Buckets = 32;
+
+            void add(uint64_t ns)
+            {
+                size_t bucket = ns ? 63 - (size_t)__builtin_clzll(ns) : 0;
+                _counts[bucket < Buckets ? bucket : Buckets - 1].fetch_add(1, std::memory_order_relaxed);
+            }
+
+            void reset()
+            {
+                for (auto &count : _counts)
+                    count.store(0, std::memory_order_relaxed);
+            }
+
+            py::list to_list() const
+            {
+                py::list counts;
+                for (auto &count : _counts)
+                    counts.append(count.load(std::memory_order_relaxed));
+                return counts;
+            }
+
+        private:
+            std::atomic<uint64_t> _counts[Buckets] = {};
+        };
+
+        class Stats
+        {
+        public:
+            void record(uint64_t total_ns, uint64_t cpp_ns, bool error)
+            {
+                uint64_t convert_ns = total_ns > cpp_ns ? total_ns - cpp_ns : 0;
+                _calls.fetch_add(1, std::memory_order_relaxed);
+                if (error)
+                    _errors.fetch_add(1, std::memory_order_relaxed);
+                _convert_ns.fetch_add(convert_ns, std::memory_order_relaxed);
+                _cpp_ns.fetch_add(cpp_ns, std::memory_order_relaxed);
+                _convert_hist.add(convert_ns);
+                _cpp_hist.add(cpp_ns);
+            }
+
+            void reset()
+            {
+                _calls.store(0, std::memory_order_relaxed);
+                _errors.store(0, std::memory_order_relaxed);
+                _convert_ns.store(0, std::memory_order_relaxed);
+                _cpp_ns.store(0, std::memory_order_relaxed);
+                _convert_hist.reset();
+                _cpp_hist.reset();
+            }
+
+            py::dict to_dict() const
+            {
+                py::dict stats;
+                stats["calls"] = _calls.load(std::memory_order_relaxed);
+                stats["errors"] = _errors.load(std::memory_order_relaxed);
+                stats["convert_ns"] = _convert_ns.load(std::memory_order_relaxed);
+                stats["cpp_ns"] = _cpp_ns.load(std::memory_order_relaxed);
+                stats["convert_hist"] = _convert_hist.to_list();
+                stats["cpp_hist"] = _cpp_hist.to_list();
+                return stats;
+            }
+
+        private:
+            std::atomic<uint64_t> _calls{0};
+            std::atomic<uint64_t> _errors{0};
+            std::atomic<uint64_t> _convert_ns{0};
+            std::atomic<uint64_t> _cpp_ns{0};
+            Histogram _convert_hist;
+            Histogram _cpp_hist;
+        };
+
+        namespace detail
+        {
+            struct Registry
+            {
+                std::mutex mutex;
+                std::map<std::string, std::unique_ptr<Stats>> stats;
+            };
+
+            inline Registry &registry()
+            {
+                // never destroyed, functions may be called by threads still running at exit
+                static Registry *registry = new Registry();
+                return *registry;
+            }
+
+            // C++ time of the current call on this thread, written by CppScope
+            inline thread_local uint64_t cpp_ns = 0;
+        } // namespace detail
+
+        /**
+         * Counters of the bound function with the full name, e.g. "add.test.add", created on first use.
+         */
+        inline Stats &stats(const std::string &name)
+        {
+            auto &registry = detail::registry();
+            std::lock_guard<std::mutex> lock(registry.mutex);
+            auto &stats = registry.stats[name];
+            if (!stats)
+                stats = std::make_unique<Stats>();
+            return *stats;
+        }
+
+        /**
+         * Times a whole call and records it to stats on destruction, as an error if an exception or a Python error is pending.
+         */
+        class CallScope
+        {
+        public:
+            explicit CallScope(Stats &stats) : _stats(&stats), _saved_cpp_ns(detail::cpp_ns), _exceptions(std::uncaught_exceptions()), _start(now_ns())
+            {
+                detail::cpp_ns = 0;
+            }
+
+            CallScope(const CallScope &) = delete;
+            CallScope &operator=(const CallScope &) = delete;
+
+            ~CallScope()
+            {
+                if (_stats)
+                    _stats->record(now_ns() - _start, detail::cpp_ns, std::uncaught_exceptions() > _exceptions || PyErr_Occurred());
+                detail::cpp_ns = _saved_cpp_ns;
+            }
+
+            /**
+             * Don't record, e.g. the arguments didn't match this overload.
+             */
+            void cancel() { _stats = nullptr; }
+
+        private:
+            Stats *_stats;
+            uint64_t _saved_cpp_ns;
+            int _exceptions;
+            uint64_t _start;
+        };
+
+        /**
+         * Times the C++ function of a call, `py::call_guard<CppScope>`.
+         */
+        class CppScope
+        {
+        public:
+            CppScope() : _start(now_ns()) {}
+            CppScope(const CppScope &) = delete;
+            CppScope &operator=(const CppScope &) = delete;
+            ~CppScope() { detail::cpp_ns = now_ns() - _start; }
+
+        private:
+            uint64_t _start;
+        };
+
+        /**
+         * Binding attribute timing the calls of a function, Name is a lambda returning the full name,
+         * whose unique type gives each binding its own wrapper of the pybind11 impl.
+         */
+        template <typename Name>
+        struct calls
+        {
+            Name name;
+        };
+
+        template <typename Name>
+        calls<Name> make_calls(Name name)
+        {
+            return {name};
+        }
+
+        namespace detail
+        {
+            template <typename Name>
+            struct Wrapped
+            {
+                static inline py::handle (*impl)(py::detail::function_call &) = nullptr;
+                static inline Stats *stats = nullptr;
+
+                static py::handle call(py::detail::function_call &call)
+                {
+                    CallScope scope(*stats);
+                    py::handle result = impl(call);
+                    if (result.ptr() == PYBIND11_TRY_NEXT_OVERLOAD)
+                        scope.cancel();
+                    return result;
+                }
+            };
+        } // namespace detail
+
+        /**
+         * Add `__stats__()` and `__stats_reset__()` to module m for the functions under module_name.
+         */
+        inline void install(py::module_ &m, const std::string &module_name)
+        {
+            std::string prefix = module_name + ".";
+            m.def(
+                "__stats__", [prefix]() {
+                    py::dict result;
+                    auto &registry = detail::registry();
+                    std::lock_guard<std::mutex> lock(registry.mutex);
+                    for (auto &item : registry.stats)
+                    {
+                        if (item.first.compare(0, prefix.size(), prefix) == 0)
+                            result[py::str(item.first)] = item.second->to_dict();
+                    }
+                    return result;
+                },
+                "Counters of the bound functions: {name: {calls, errors, convert_ns, cpp_ns, convert_hist, cpp_hist}},\n"
+                "convert_* is the time converting arguments and results, cpp_* the time in C++,\n"
+                "bucket i of the histograms counts calls taking [2**i, 2**(i+1)) ns");
+            m.def(
+                "__stats_reset__", [prefix]() {
+                    auto &registry = detail::registry();
+                    std::lock_guard<std::mutex> lock(registry.mutex);
+                    for (auto &item : registry.stats)
+                    {
+                        if (item.first.compare(0, prefix.size(), prefix) == 0)
+                            item.second->reset();
+                    }
+                },
+                "Reset the counters of __stats__()");
+        }
+    } // namespace instrument
+} // namespace autobind
+
+namespace pybind11
+{
+    namespace detail
+    {
+        template <typename Name>
+        struct process_attribute<::autobind::instrument::calls<Name>> : process_attribute_default<::autobind::instrument::calls<Name>>
+        {
+            static void init(const ::autobind::instrument::calls<Name> &attr, function_record *r)
+            {
+                using Wrapped = ::autobind::instrument::detail::Wrapped<Name>;
+                Wrapped::stats = &::autobind::instrument::stats(attr.name());
+                Wrapped::impl = r->impl;
+                r->impl = &Wrapped::call;
+            }
+        };
+    } // namespace detail
+} // namespace pybind11
+
+/**
+ * Binding attributes timing the function with the full name, e.g. `m.def("add", &add, AUTOBIND_INSTRUMENT("add.add"))`.
+ */
+#define AUTOBIND_INSTRUMENT(name) ::autobind::instrument::make_calls([] { return name; }), ::pybind11::call_guard<::autobind::instrument::CppScope>()
@@ -0,0 +1,113 @@
+/**
+ * @file lazy.hpp
+ * @brief Runtime helpers for the `--lazy` option of cpp_bind_python.py
+ *
+ * With `--lazy` every submodule is registered by an init function instead of
+ * at import time. The parent module gets a PEP 562 `__getattr__` which creates
+ * the submodule and runs its init function on first access, and a `__dir__`
+ * listing the pending submodules too, so `dir()` and `help()` still see them.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <functional>
+#include <map>
+#include <memory>
+#include <set>
+#include <string>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    class LazyModules : public std::enable_shared_from_this<LazyModules>
+    {
+    public:
+        using Init = std::function<void(py::module_ &, LazyModules *)>;
+
+        static std::shared_ptr<LazyModules> create(py::module_ root)
+        {
+            return std::shared_ptr<LazyModules>(new LazyModules(std::move(root)));
+        }
+
+        /**
+         * Register submodule name of parent, init adds its members on first access.
+         */
+        void add(py::module_ &parent, const char *name, const char *doc, Init init)
+        {
+            if (!_hooked.count(parent.ptr()))
+                hook(parent);
+            _pending[parent.ptr()][name] = Entry{doc, std::move(init)};
+        }
+
+        /**
+         * Load the submodule at path (e.g. "a.b", relative to the root module) and its parents.
+         * Used before registering members which use classes of another lazy submodule.
+         */
+        void require(const std::string &path)
+        {
+            py::object obj = _root;
+            size_t start = 0;
+            while (start <= path.size())
+            {
+                size_t end = path.find('.', start);
+                if (end == std::string::npos)
+                    end = path.size();
+                obj = obj.attr(path.substr(start, end - start).c_str());
+                start = end + 1;
+            }
+        }
+
+    private:
+        struct Entry
+        {
+            std::string doc;
+            Init init;
+        };
+
+        explicit LazyModules(py::module_ root) : _root(std::move(root)) {}
+
+        // install __getattr__ and __dir__ on parent, they hold the registry alive
+        void hook(py::module_ &parent)
+        {
+            _hooked.insert(parent.ptr());
+            std::shared_ptr<LazyModules> self = shared_from_this();
+            PyObject *key = parent.ptr();
+            parent.attr("__getattr__") = py::cpp_function([self, key](const std::string &name) { return self->load(key, name); }, py::arg("name"));
+            parent.attr("__dir__") = py::cpp_function([self, key]() {
+                py::list names(py::handle(key).attr("__dict__").attr("keys")());
+                for (auto &it : self->_pending[key])
+                    names.append(it.first);
+                names.attr("sort")();
+                return names;
+            });
+        }
+
+        py::object load(PyObject *key, const std::string &name)
+        {
+            py::module_ parent = py::reinterpret_borrow<py::module_>(key);
+            auto &pending = _pending[key];
+            auto it = pending.find(name);
+            if (it == pending.end())
+                throw py::attribute_error("module '" + parent.attr("__name__").cast<std::string>() + "' has no attribute '" + name + "'");
+            // remove first, the submodule attribute exists from now on so recursive lookups find it
+            Entry entry = std::move(it->second);
+            pending.erase(it);
+            py::module_ sub = parent.def_submodule(name.c_str(), entry.doc.c_str());
+            entry.init(sub, this);
+            // e.g. the `--strip-docs` sidecar, which hooked the parent, hooks the new submodule and its classes too
+            py::object hook = py::getattr(py::type::of(parent), "__autobind_hook__", py::none());
+            if (!hook.is_none())
+                hook(sub);
+            return std::move(sub);
+        }
+
+        py::module_ _root;
+        std::map<PyObject *, std::map<std::string, Entry>> _pending;
+        std::set<PyObject *> _hooked;
+    };
+} // namespace autobind
@@ -0,0 +1,170 @@
+/**
+ * @file lru_cache.hpp
+ * @brief Runtime helpers for `:memoize` bindings emitted by cpp_bind_python.py
+ *
+ * A memoized binding replaces the bound function with a callable object holding
+ * a bounded LRU cache keyed on the converted arguments. Results that convert to
+ * immutable Python objects are cached as Python objects, so a hit skips both the
+ * C++ call and the result conversion.
+ */
+
+#pragma once
+
+#include "common.hpp"
+#include "batch.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <list>
+#include <map>
+#include <tuple>
+#include <type_traits>
+#include <utility>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace detail
+    {
+        template <typename T, typename = void>
+        struct has_equal : std::false_type
+        {
+        };
+
+        template <typename T>
+        struct has_equal<T, std::void_t<decltype(std::declval<const T &>() == std::declval<const T &>())>> : std::true_type
+        {
+        };
+
+        template <typename T>
+        bool equal(const T &a, const T &b)
+        {
+            return a == b;
+        }
+
+        /**
+         * false if a value is not equal to itself, e.g. NaN or a container holding NaN, which would break
+         * the ordering of the cache keys, types without `==` are assumed ordered.
+         */
+        template <typename T>
+        bool is_ordered(const T &value)
+        {
+            if constexpr (has_equal<T>::value)
+                return equal(value, value);
+            else
+                return true;
+        }
+    } // namespace detail
+
+    /**
+     * Bounded LRU cache wrapping func, ID makes one C++ (and Python) type per bound function.
+     * Arguments are stored by value as the key, so they must be copyable and comparable with `<`,
+     * calls with an argument not equal to itself (NaN) are not cached.
+     * Not thread safe, all calls happen with the GIL held.
+     */
+    template <int ID, typename R, typename... Args>
+    class LruFunction
+    {
+        static_assert(!std::is_void_v<R>, "`:memoize` function must return a value");
+        static_assert(!std::is_pointer_v<R> && !std::is_reference_v<R>, "`:memoize` function must return by value");
+
+    public:
+        using Func = R (*)(Args...);
+
+        LruFunction(Func func, size_t maxsize, py::return_value_policy policy)
+            : _func(func), _maxsize(maxsize), _policy(detail::result_policy<R>(policy))
+        {
+        }
+
+        py::object operator()(Args... args)
+        {
+            Key key(args...);
+            if (!std::apply([](const auto &...x) { return (detail::is_ordered(x) && ...); }, key))
+            {
+                ++_misses;
+                return py::cast(_func(args...), _policy);
+            }
+            auto it = _index.find(key);
+            if (it != _index.end())
+            {
+                ++_hits;
+                _items.splice(_items.begin(), _items, it->second);
+                Item &item = *it->second;
+                if (item.cached)
+                    return item.cached;
+                return py::cast(item.value, _policy);
+            }
+            ++_misses;
+            std::decay_t<R> value(_func(args...));
+            py::object result = py::cast(value, _policy);
+            auto pos = _index.emplace(std::move(key), _items.end()).first;
+            _items.push_front(Item{std::move(value), is_immutable(result) ? result : py::object(), pos});
+            pos->second = _items.begin();
+            if (_items.size() > _maxsize)
+            {
+                _index.erase(_items.back().pos);
+                _items.pop_back();
+            }
+            return result;
+        }
+
+        /**
+         * @return functools._CacheInfo(hits, misses, maxsize, currsize), same as functools.lru_cache
+         */
+        py::object cache_info() const
+        {
+            return py::module_::import("functools").attr("_CacheInfo")(_hits, _misses, _maxsize, _items.size());
+        }
+
+        void cache_clear()
+        {
+            _index.clear();
+            _items.clear();
+            _hits = 0;
+            _misses = 0;
+        }
+
+        /**
+         * Register the Python type of this cache, caller adds __call__ with argument names.
+         * The type is named after scope but not added to it, only the cache object is.
+         */
+        static py::class_<LruFunction> bind(py::handle scope, const char *name, const char *doc)
+        {
+            auto cls = py::class_<LruFunction>(scope, name, doc, py::module_local())
+                           .def("cache_info", &LruFunction::cache_info, "Report cache statistics")
+                           .def("cache_clear", &LruFunction::cache_clear, "Clear the cache and cache statistics");
+            // pybind11 keeps the type registered until exit, so keep it alive without the scope attribute
+            cls.inc_ref();
+            py::delattr(scope, name);
+            return cls;
+        }
+
+    private:
+        using Key = detail::arg_tuple<Args...>;
+        struct Item;
+        using Index = std::map<Key, typename std::list<Item>::iterator>;
+
+        struct Item
+        {
+            std::decay_t<R> value;
+            py::object cached;
+            typename Index::iterator pos;
+        };
+
+        static bool is_immutable(const py::object &obj)
+        {
+            PyObject *p = obj.ptr();
+            return p == Py_None || PyBool_Check(p) || PyLong_CheckExact(p) || PyFloat_CheckExact(p) ||
+                   PyUnicode_CheckExact(p) || PyBytes_CheckExact(p) || PyComplex_CheckExact(p);
+        }
+
+        Func _func;
+        size_t _maxsize;
+        py::return_value_policy _policy;
+        std::list<Item> _items;
+        Index _index;
+        size_t _hits = 0;
+        size_t _misses = 0;
+    };
+} // namespace autobind
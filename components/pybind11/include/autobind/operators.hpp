@@ -0,0 +1,48 @@
+/**
+ * @file operators.hpp
+ * @brief Runtime helpers for operator bindings emitted by cpp_bind_python.py
+ *
+ * C++ operators are bound with py::self expressions by the generator, this file
+ * adds `__hash__` from std::hash<T> for classes binding `operator==`, pybind11
+ * sets `__hash__` to None for them otherwise and they can't be dict keys.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+#include <pybind11/operators.h>
+
+#include <functional>
+#include <type_traits>
+#include <utility>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace detail
+    {
+        // disabled std::hash specializations are not callable
+        template <typename T, typename = void>
+        struct is_std_hashable : std::false_type
+        {
+        };
+
+        template <typename T>
+        struct is_std_hashable<T, std::void_t<decltype(std::hash<T>()(std::declval<const T &>()))>> : std::true_type
+        {
+        };
+    } // namespace detail
+
+    /**
+     * Bind `__hash__` with std::hash<T>, do nothing if std::hash<T> is not specialized for T.
+     */
+    template <typename Class>
+    void def_hash(Class &cls)
+    {
+        if constexpr (detail::is_std_hashable<typename Class::type>::value)
+            cls.def(py::hash(py::self));
+    }
+} // namespace autobind
@@ -0,0 +1,230 @@
+/**
+ * @file parallel.hpp
+ * @brief Runtime helpers for `:parallel` bindings emitted by cpp_bind_python.py
+ *
+ * Every generated module owns one ParallelMap, which keeps the functions marked
+ * `:parallel` and a C++ thread pool. `parallel_map(func, inputs)` converts all
+ * inputs, shards them across the pool with the GIL released and gathers the
+ * results in input order.
+ */
+
+#pragma once
+
+#include "common.hpp"
+#include "batch.hpp"
+
+#include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
+
+#include <algorithm>
+#include <condition_variable>
+#include <exception>
+#include <functional>
+#include <mutex>
+#include <optional>
+#include <thread>
+#include <unordered_map>
+#include <vector>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    /**
+     * Thread pool running one job at a time, threads are created on first use
+     * and grow up to the largest worker count requested.
+     */
+    class ThreadPool
+    {
+    public:
+        ThreadPool() = default;
+        ThreadPool(const ThreadPool &) = delete;
+        ThreadPool &operator=(const ThreadPool &) = delete;
+
+        ~ThreadPool()
+        {
+            {
+                std::lock_guard<std::mutex> lock(_mutex);
+                _stop = true;
+            }
+            _cv.notify_all();
+            for (auto &t : _threads)
+                t.join();
+        }
+
+        /**
+         * Run task(i) for i in [0, count), blocks until all tasks finished.
+         * The calling thread takes tasks too, so workers - 1 pool threads are used.
+         * The first exception thrown by a task is rethrown here.
+         */
+        void run(size_t workers, size_t count, const std::function<void(size_t)> &task)
+        {
+            if (count == 0)
+                return;
+            std::lock_guard<std::mutex> run_lock(_run_mutex);
+            workers = std::max<size_t>(1, std::min(workers, count));
+            std::unique_lock<std::mutex> lock(_mutex);
+            while (_threads.size() < workers - 1)
+                _threads.emplace_back([this] { worker_loop(); });
+            _task = &task;
+            _count = count;
+            _next = 0;
+            _done = 0;
+            _slots = workers - 1;
+            _error = nullptr;
+            ++_generation;
+            lock.unlock();
+            _cv.notify_all();
+
+            lock.lock();
+            work(lock);
+            _done_cv.wait(lock, [this] { return _done == _count; });
+            _task = nullptr;
+            _slots = 0;
+            std::exception_ptr error = _error;
+            _error = nullptr;
+            lock.unlock();
+            if (error)
+                std::rethrow_exception(error);
+        }
+
+    private:
+        void worker_loop()
+        {
+            uint64_t seen = 0;
+            std::unique_lock<std::mutex> lock(_mutex);
+            while (true)
+            {
+                _cv.wait(lock, [&] { return _stop || (_generation != seen && _slots > 0); });
+                if (_stop)
+                    return;
+                seen = _generation;
+                --_slots;
+                work(lock);
+            }
+        }
+
+        // take tasks until none left, lock is held on entry and exit
+        void work(std::unique_lock<std::mutex> &lock)
+        {
+            while (_task && _next < _count)
+            {
+                size_t i = _next++;
+                const std::function<void(size_t)> *task = _task;
+                lock.unlock();
+                try
+                {
+                    (*task)(i);
+                }
+                catch (...)
+                {
+                    lock.lock();
+                    if (!_error)
+                        _error = std::current_exception();
+                    lock.unlock();
+                }
+                lock.lock();
+                if (++_done == _count)
+                    _done_cv.notify_all();
+            }
+        }
+
+        std::mutex _run_mutex;
+        std::mutex _mutex;
+        std::condition_variable _cv;
+        std::condition_variable _done_cv;
+        std::vector<std::thread> _threads;
+        const std::function<void(size_t)> *_task = nullptr;
+        size_t _count = 0;
+        size_t _next = 0;
+        size_t _done = 0;
+        size_t _slots = 0;
+        uint64_t _generation = 0;
+        bool _stop = false;
+        std::exception_ptr _error;
+    };
+
+    /**
+     * Call func once per argument tuple of inputs on pool, results keep input order.
+     * @param chunk inputs per task, 0 means split to about 4 tasks per worker
+     * @param defaults C++ default values of the trailing arguments, used when a tuple omits them
+     */
+    template <typename R, typename... Args>
+    py::object parallel_call(ThreadPool &pool, R (*func)(Args...), py::iterable inputs, size_t workers, size_t chunk, py::return_value_policy policy,
+                             const py::tuple &defaults = py::tuple())
+    {
+        std::vector<py::object> keep;
+        auto args = detail::load_all_args<Args...>(inputs, keep, defaults);
+        size_t n = args.size();
+        if (chunk == 0)
+            chunk = std::max<size_t>(1, (n + workers * 4 - 1) / (workers * 4));
+        size_t tasks = (n + chunk - 1) / chunk;
+        if constexpr (std::is_void_v<R>)
+        {
+            {
+                GilRelease release;
+                pool.run(workers, tasks, [&](size_t t) {
+                    for (size_t i = t * chunk; i < std::min(n, (t + 1) * chunk); ++i)
+                        detail::apply(func, args[i]);
+                });
+            }
+            return py::none();
+        }
+        else
+        {
+            // optional keeps one object per slot, std::vector<bool> would share bytes between threads
+            std::vector<std::optional<std::decay_t<R>>> results(n);
+            {
+                GilRelease release;
+                pool.run(workers, tasks, [&](size_t t) {
+                    for (size_t i = t * chunk; i < std::min(n, (t + 1) * chunk); ++i)
+                        results[i].emplace(detail::apply(func, args[i]));
+                });
+            }
+            py::list out(n);
+            py::return_value_policy p = detail::result_policy<R>(policy);
+            for (size_t i = 0; i < n; ++i)
+                out[i] = py::cast(std::move(*results[i]), p);
+            return std::move(out);
+        }
+    }
+
+    /**
+     * Registry of a module's `:parallel` functions, called as the module's parallel_map().
+     */
+    class ParallelMap
+    {
+    public:
+        /**
+         * Register func, func_obj is the bound Python function object users pass to parallel_map,
+         * defaults are the C++ default values of its trailing arguments.
+         */
+        template <typename R, typename... Args>
+        void add(py::object func_obj, R (*func)(Args...), py::return_value_policy policy, py::tuple defaults = py::tuple())
+        {
+            PyObject *key = func_obj.ptr();
+            _entries[key] = Entry{std::move(func_obj), [func, policy, defaults](ThreadPool &pool, py::iterable inputs, size_t workers, size_t chunk) {
+                                      return parallel_call(pool, func, inputs, workers, chunk, policy, defaults);
+                                  }};
+        }
+
+        py::object operator()(py::handle func, py::iterable inputs, std::optional<size_t> workers, size_t chunk)
+        {
+            auto it = _entries.find(func.ptr());
+            if (it == _entries.end())
+                throw py::type_error("parallel_map: " + std::string(py::repr(func)) + " is not a function marked :parallel");
+            size_t n = workers ? *workers : std::thread::hardware_concurrency();
+            return it->second.call(_pool, inputs, std::max<size_t>(1, n), chunk);
+        }
+
+    private:
+        struct Entry
+        {
+            py::object func_obj;
+            std::function<py::object(ThreadPool &, py::iterable, size_t, size_t)> call;
+        };
+
+        ThreadPool _pool;
+        std::unordered_map<PyObject *, Entry> _entries;
+    };
+} // namespace autobind
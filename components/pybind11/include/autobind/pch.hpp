@@ -0,0 +1,12 @@
+/**
+ * @file pch.hpp
+ * @brief Precompiled header of the pybind11 component: pybind11 and the casters every generated binding includes
+ */
+
+#pragma once
+
+#include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
+#include <pybind11/complex.h>
+#include <pybind11/functional.h>
+#include <pybind11/chrono.h>
@@ -0,0 +1,315 @@
+/**
+ * @file pickle.hpp
+ * @brief Runtime helpers for `:pickle` bindings emitted by cpp_bind_python.py
+ *
+ * The state of a pickled object is one flat binary blob instead of a tuple of
+ * Python objects: trivially copyable classes are stored as their raw bytes,
+ * other classes store their bound fields one after another, strings and
+ * containers prefixed by their length. The blob is written in place into the
+ * Python bytes (or bytearray) object, and with pickle protocol 5 it is handed
+ * out as a PickleBuffer so it can be sent out-of-band without another copy.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <cstdint>
+#include <cstring>
+#include <map>
+#include <set>
+#include <string>
+#include <type_traits>
+#include <unordered_map>
+#include <unordered_set>
+#include <utility>
+#include <vector>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace detail
+    {
+        template <typename T>
+        struct is_pickle_map : std::false_type
+        {
+        };
+
+        template <typename... Ts>
+        struct is_pickle_map<std::map<Ts...>> : std::true_type
+        {
+        };
+
+        template <typename... Ts>
+        struct is_pickle_map<std::unordered_map<Ts...>> : std::true_type
+        {
+        };
+
+        template <typename... Ts>
+        struct is_pickle_map<std::set<Ts...>> : std::true_type
+        {
+        };
+
+        template <typename... Ts>
+        struct is_pickle_map<std::unordered_set<Ts...>> : std::true_type
+        {
+        };
+
+        template <typename T>
+        struct is_pickle_vector : std::false_type
+        {
+        };
+
+        template <typename T, typename A>
+        struct is_pickle_vector<std::vector<T, A>> : std::true_type
+        {
+        };
+
+        template <typename T>
+        struct is_pickle_pair : std::false_type
+        {
+        };
+
+        template <typename A, typename B>
+        struct is_pickle_pair<std::pair<A, B>> : std::true_type
+        {
+        };
+
+        template <typename T>
+        constexpr bool is_raw_v = std::is_trivially_copyable_v<T> && !std::is_pointer_v<T>;
+
+        /**
+         * Serialize values to out, with out == nullptr only the size is counted,
+         * so the state is measured first and then written into the Python object.
+         */
+        class PickleWriter
+        {
+        public:
+            explicit PickleWriter(char *out = nullptr) : _out(out) {}
+
+            size_t size() const { return _pos; }
+
+            void write_raw(const void *data, size_t size)
+            {
+                if (_out && size)
+                    std::memcpy(_out + _pos, data, size);
+                _pos += size;
+            }
+
+            template <typename T>
+            void write(const T &value)
+            {
+                if constexpr (is_raw_v<T>)
+                    write_raw(&value, sizeof(T));
+                else if constexpr (std::is_same_v<T, std::string>)
+                {
+                    write_size(value.size());
+                    write_raw(value.data(), value.size());
+                }
+                else if constexpr (is_pickle_vector<T>::value)
+                {
+                    write_size(value.size());
+                    if constexpr (is_raw_v<typename T::value_type> && !std::is_same_v<typename T::value_type, bool>)
+                        write_raw(value.data(), value.size() * sizeof(typename T::value_type));
+                    else
+                    {
+                        for (const auto &item : value)
+                            write(static_cast<const typename T::value_type &>(item));
+                    }
+                }
+                else if constexpr (is_pickle_map<T>::value)
+                {
+                    write_size(value.size());
+                    for (const auto &item : value)
+                        write(item);
+                }
+                else if constexpr (is_pickle_pair<T>::value)
+                {
+                    write(value.first);
+                    write(value.second);
+                }
+                else
+                    static_assert(is_raw_v<T>, "`:pickle` field type not supported, use trivially copyable types, std::string, std::vector, std::map, std::set or std::pair");
+            }
+
+        private:
+            void write_size(size_t size)
+            {
+                uint64_t n = size;
+                write_raw(&n, sizeof(n));
+            }
+
+            char *_out;
+            size_t _pos = 0;
+        };
+
+        class PickleReader
+        {
+        public:
+            PickleReader(const char *data, size_t size) : _data(data), _size(size) {}
+
+            size_t remaining() const { return _size - _pos; }
+
+            void read_raw(void *data, size_t size)
+            {
+                if (size > remaining())
+                    throw py::value_error("pickle state truncated");
+                if (size)
+                    std::memcpy(data, _data + _pos, size);
+                _pos += size;
+            }
+
+            template <typename T>
+            void read(T &value)
+            {
+                if constexpr (is_raw_v<T>)
+                    read_raw(&value, sizeof(T));
+                else if constexpr (std::is_same_v<T, std::string>)
+                {
+                    size_t n = read_size(1);
+                    value.assign(_data + _pos, n);
+                    _pos += n;
+                }
+                else if constexpr (is_pickle_vector<T>::value)
+                {
+                    using V = typename T::value_type;
+                    size_t n = read_size(is_raw_v<V> ? sizeof(V) : 1);
+                    value.clear();
+                    if constexpr (is_raw_v<V> && !std::is_same_v<V, bool>)
+                    {
+                        value.resize(n);
+                        read_raw(value.data(), n * sizeof(V));
+                    }
+                    else
+                    {
+                        value.reserve(n);
+                        for (size_t i = 0; i < n; ++i)
+                        {
+                            V item{};
+                            read(item);
+                            value.push_back(std::move(item));
+                        }
+                    }
+                }
+                else if constexpr (is_pickle_map<T>::value)
+                {
+                    size_t n = read_size(1);
+                    value.clear();
+                    for (size_t i = 0; i < n; ++i)
+                    {
+                        if constexpr (is_pickle_pair<typename T::value_type>::value)
+                        {
+                            // std::map<K, V>::value_type is pair<const K, V>, read to pair<K, V>
+                            std::pair<std::remove_const_t<typename T::value_type::first_type>, typename T::value_type::second_type> item{};
+                            read(item);
+                            value.insert(std::move(item));
+                        }
+                        else
+                        {
+                            typename T::value_type item{};
+                            read(item);
+                            value.insert(std::move(item));
+                        }
+                    }
+                }
+                else if constexpr (is_pickle_pair<T>::value)
+                {
+                    read(value.first);
+                    read(value.second);
+                }
+                else
+                    static_assert(is_raw_v<T>, "`:pickle` field type not supported, use trivially copyable types, std::string, std::vector, std::map, std::set or std::pair");
+            }
+
+        private:
+            // element count, checked against the remaining bytes so a corrupted state can't allocate huge buffers
+            size_t read_size(size_t min_item_size)
+            {
+                uint64_t n = 0;
+                read_raw(&n, sizeof(n));
+                if (n > remaining() / min_item_size)
+                    throw py::value_error("pickle state truncated");
+                return (size_t)n;
+            }
+
+            const char *_data;
+            size_t _size;
+            size_t _pos = 0;
+        };
+
+        template <typename T, typename... F>
+        void dump_state(PickleWriter &writer, const T &obj, F T::*...fields)
+        {
+            if constexpr (std::is_trivially_copyable_v<T>)
+                writer.write_raw(&obj, sizeof(T));
+            else
+                (writer.write(obj.*fields), ...);
+        }
+
+        /**
+         * Dump obj to a new bytes object, or bytearray if bytearray is true, the state is written in place.
+         */
+        template <typename T, typename... F>
+        py::object dump(const T &obj, bool bytearray, F T::*...fields)
+        {
+            PickleWriter counter;
+            dump_state(counter, obj, fields...);
+            size_t size = counter.size();
+            PyObject *state = bytearray ? PyByteArray_FromStringAndSize(nullptr, (Py_ssize_t)size) : PyBytes_FromStringAndSize(nullptr, (Py_ssize_t)size);
+            if (!state)
+                throw py::error_already_set();
+            py::object result = py::reinterpret_steal<py::object>(state);
+            PickleWriter writer(bytearray ? PyByteArray_AS_STRING(state) : PyBytes_AS_STRING(state));
+            dump_state(writer, obj, fields...);
+            return result;
+        }
+
+        template <typename T, typename... F>
+        T load(const py::buffer &state, F T::*...fields)
+        {
+            py::buffer_info info = state.request();
+            PickleReader reader(static_cast<const char *>(info.ptr), (size_t)(info.size * info.itemsize));
+            T obj;
+            if constexpr (std::is_trivially_copyable_v<T>)
+            {
+                if (reader.remaining() != sizeof(T))
+                    throw py::value_error("pickle state size mismatch");
+                reader.read_raw(&obj, sizeof(T));
+            }
+            else
+                (reader.read(obj.*fields), ...);
+            if (reader.remaining())
+                throw py::value_error("pickle state has trailing data");
+            return obj;
+        }
+    } // namespace detail
+
+    /**
+     * Make the bound class picklable with a binary state.
+     * Trivially copyable classes are stored as raw bytes, others store fields in order.
+     * With pickle protocol 5 the state is a PickleBuffer, so it can go out-of-band with buffer_callback.
+     * @param cls bound class, must be default constructible
+     * @param fields pointers to the fields to store, unused for trivially copyable classes
+     */
+    template <typename T, typename... Options, typename... F>
+    void def_pickle(py::class_<T, Options...> &cls, F T::*...fields)
+    {
+        static_assert(std::is_default_constructible_v<T>, "`:pickle` class must be default constructible");
+        cls.def(py::pickle(
+            [fields...](const T &obj) { return py::reinterpret_steal<py::buffer>(detail::dump(obj, false, fields...).release()); },
+            [fields...](const py::buffer &state) { return detail::load<T>(state, fields...); }));
+        cls.def(
+            "__reduce_ex__", [fields...](const py::object &self, int protocol) {
+                py::object state;
+                if (protocol >= 5)
+                    state = py::module_::import("pickle").attr("PickleBuffer")(detail::dump(self.cast<const T &>(), true, fields...));
+                else
+                    state = detail::dump(self.cast<const T &>(), false, fields...);
+                return py::make_tuple(py::module_::import("copyreg").attr("__newobj__"), py::make_tuple(py::type::of(self)), state);
+            },
+            py::arg("protocol"));
+    }
+} // namespace autobind
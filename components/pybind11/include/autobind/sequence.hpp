@@ -0,0 +1,126 @@
+/**
+ * @file sequence.hpp
+ * @brief Runtime helpers for `:sequence` bindings emitted by cpp_bind_python.py
+ *
+ * Container-like classes (with `size()` and `operator[]`) get `__len__`,
+ * `__getitem__` and `__setitem__` with negative indices, all O(1) on the C++
+ * storage. Slicing returns a view sharing the container's storage, the view
+ * keeps the container alive and checks bounds on every access, so it stays
+ * safe if the container shrinks.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <cstddef>
+#include <type_traits>
+#include <utility>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace detail
+    {
+        template <typename T>
+        using sequence_item_t = decltype(std::declval<T &>()[std::declval<size_t>()]);
+
+        template <typename T>
+        constexpr bool sequence_writable_v = std::is_lvalue_reference_v<sequence_item_t<T>> &&
+                                             !std::is_const_v<std::remove_reference_t<sequence_item_t<T>>>;
+
+        /**
+         * Convert a Python index to [0, size), negative indices count from the end.
+         */
+        inline size_t normalize_index(Py_ssize_t i, size_t size)
+        {
+            if (i < 0)
+                i += (Py_ssize_t)size;
+            if (i < 0 || (size_t)i >= size)
+                throw py::index_error("index out of range");
+            return (size_t)i;
+        }
+    } // namespace detail
+
+    /**
+     * Slice of a `:sequence` container, index i maps to container[start + i * step].
+     */
+    template <typename T>
+    class SequenceView
+    {
+    public:
+        SequenceView(T &parent, Py_ssize_t start, Py_ssize_t step, size_t length)
+            : _parent(parent), _start(start), _step(step), _length(length)
+        {
+        }
+
+        size_t size() const { return _length; }
+
+        decltype(auto) operator[](size_t i) const
+        {
+            Py_ssize_t idx = _start + (Py_ssize_t)i * _step;
+            if (idx < 0 || (size_t)idx >= (size_t)_parent.size())
+                throw py::index_error("view index out of range of the container, the container was resized");
+            return _parent[(size_t)idx];
+        }
+
+        SequenceView slice(const py::slice &s) const
+        {
+            Py_ssize_t start = 0, stop = 0, step = 0, length = 0;
+            if (!s.compute((Py_ssize_t)_length, &start, &stop, &step, &length))
+                throw py::error_already_set();
+            return SequenceView(_parent, _start + start * _step, step * _step, (size_t)length);
+        }
+
+    private:
+        T &_parent;
+        Py_ssize_t _start;
+        Py_ssize_t _step;
+        size_t _length;
+    };
+
+    namespace detail
+    {
+        // __len__, __getitem__ and __setitem__ shared by containers and views, C is the bound type
+        template <typename C, typename Class>
+        void def_sequence_methods(Class &cls)
+        {
+            cls.def("__len__", [](const C &c) { return (size_t)c.size(); });
+            cls.def(
+                "__getitem__", [](C &c, Py_ssize_t i) -> decltype(auto) { return c[normalize_index(i, c.size())]; },
+                py::return_value_policy::reference_internal, py::arg("index"));
+            if constexpr (sequence_writable_v<C>)
+            {
+                using V = std::decay_t<sequence_item_t<C>>;
+                cls.def(
+                    "__setitem__", [](C &c, Py_ssize_t i, const V &value) { c[normalize_index(i, c.size())] = value; },
+                    py::arg("index"), py::arg("value"));
+            }
+        }
+    } // namespace detail
+
+    /**
+     * Bind the sequence protocol for a class with `size()` and `operator[]`,
+     * slices return a SequenceView which keeps the container alive.
+     */
+    template <typename Class>
+    void def_sequence(Class &cls)
+    {
+        using T = typename Class::type;
+        using View = SequenceView<T>;
+        // View is registered first, so the signature of the slice overload shows its Python name
+        auto view = py::class_<View>(cls, "View", "Slice of the container sharing its storage", py::module_local());
+        detail::def_sequence_methods<View>(view);
+        view.def("__getitem__", &View::slice, py::keep_alive<0, 1>(), py::arg("index"));
+
+        detail::def_sequence_methods<T>(cls);
+        cls.def(
+            "__getitem__", [](T &c, const py::slice &s) {
+                return View(c, 0, 1, c.size()).slice(s);
+            },
+            py::keep_alive<0, 1>(), py::arg("index"));
+    }
+} // namespace autobind
@@ -0,0 +1,461 @@
+/**
+ * @file shm.hpp
+ * @brief Runtime helpers for `:shm` return values emitted by cpp_bind_python.py
+ *
+ * The result of a `:shm` function (std::vector of trivially copyable values or
+ * std::string) is stored in a named POSIX shared memory arena instead of a
+ * Python object, and a `ShmBuffer` handle is returned. The handle supports the
+ * buffer protocol (memoryview, numpy.asarray) without copying, and pickles to
+ * the arena name and block offset only, so another process maps the same
+ * memory instead of receiving a copy of the data.
+ *
+ * Blocks are reference counted in the shared memory: every handle holds one
+ * reference, including each handle unpickled from the same data, so a block
+ * must still have a handle (e.g. the pickled one) when a pickle of it is
+ * loaded, a pickle alone holds nothing. A block is reclaimed (and merged with
+ * its free neighbours) when its last reference is dropped, in whichever
+ * process that happens. Each process creates its own arena
+ * `/autobind.<module>.<pid>` on first use, its size is 64 MiB or the value of
+ * the environment variable `AUTOBIND_SHM_SIZE` (bytes), and its name is
+ * unlinked at interpreter exit (mappings of other processes stay valid).
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <atomic>
+#include <cerrno>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <map>
+#include <memory>
+#include <string>
+#include <type_traits>
+#include <vector>
+
+#include <fcntl.h>
+#include <pthread.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace shm
+    {
+        namespace detail
+        {
+            constexpr uint64_t Magic = 0x6d68735f646e6962ULL; // "bind_shm"
+            constexpr size_t Align = 64;
+            constexpr size_t DefaultSize = 64 * 1024 * 1024;
+
+            constexpr size_t align_up(size_t n)
+            {
+                return (n + Align - 1) / Align * Align;
+            }
+
+            struct ArenaHeader
+            {
+                uint64_t magic;
+                uint64_t size;
+                uint64_t generation; // count of allocated blocks, tells a reused block from the pickled one
+                pthread_mutex_t mutex;
+            };
+
+            // blocks follow each other after the arena header, prev_size links back for merging
+            struct Block
+            {
+                uint64_t size;
+                uint64_t prev_size;
+                uint64_t generation;
+                std::atomic<uint32_t> refs;
+                uint32_t used;
+            };
+
+            constexpr size_t HeaderSize = align_up(sizeof(ArenaHeader));
+            constexpr size_t BlockSize = align_up(sizeof(Block));
+
+            [[noreturn]] inline void os_error(const std::string &what)
+            {
+                PyErr_SetFromErrnoWithFilename(PyExc_OSError, what.c_str());
+                throw py::error_already_set();
+            }
+
+            // process shared mutex, robust so a crashed process doesn't block the arena forever
+            class ArenaLock
+            {
+            public:
+                explicit ArenaLock(pthread_mutex_t *mutex) : _mutex(mutex)
+                {
+                    int ret = pthread_mutex_lock(_mutex);
+#if defined(__linux__)
+                    if (ret == EOWNERDEAD)
+                        ret = pthread_mutex_consistent(_mutex);
+#endif
+                    if (ret != 0)
+                        throw std::runtime_error("lock shared memory arena failed");
+                }
+
+                ~ArenaLock() { pthread_mutex_unlock(_mutex); }
+
+            private:
+                pthread_mutex_t *_mutex;
+            };
+        } // namespace detail
+
+        /**
+         * Mapping of a shared memory arena in this process, shared by all handles of its blocks.
+         */
+        class Arena
+        {
+        public:
+            Arena(const Arena &) = delete;
+            Arena &operator=(const Arena &) = delete;
+
+            ~Arena()
+            {
+                munmap(_data, _size);
+            }
+
+            /**
+             * Create and map a new arena of size bytes.
+             */
+            static std::shared_ptr<Arena> create(const std::string &name, size_t size)
+            {
+                int fd = shm_open(name.c_str(), O_RDWR | O_CREAT | O_EXCL, 0600);
+                if (fd < 0)
+                    detail::os_error(name);
+                if (ftruncate(fd, (off_t)size) != 0)
+                {
+                    close(fd);
+                    shm_unlink(name.c_str());
+                    detail::os_error(name);
+                }
+                std::shared_ptr<Arena> arena = map(name, fd, size);
+                auto *header = arena->header();
+                header->size = size;
+                header->generation = 0;
+                pthread_mutexattr_t attr;
+                pthread_mutexattr_init(&attr);
+                pthread_mutexattr_setpshared(&attr, PTHREAD_PROCESS_SHARED);
+#if defined(__linux__)
+                pthread_mutexattr_setrobust(&attr, PTHREAD_MUTEX_ROBUST);
+#endif
+                pthread_mutex_init(&header->mutex, &attr);
+                pthread_mutexattr_destroy(&attr);
+                auto *first = arena->block(detail::HeaderSize);
+                first->size = size - detail::HeaderSize;
+                first->prev_size = 0;
+                first->refs.store(0);
+                first->used = 0;
+                header->magic = detail::Magic;
+                return arena;
+            }
+
+            /**
+             * Map the arena name, the mapping is shared while any handle of this process uses it.
+             */
+            static std::shared_ptr<Arena> open(const std::string &name)
+            {
+                auto &opened = registry();
+                auto it = opened.find(name);
+                if (it != opened.end())
+                {
+                    if (auto arena = it->second.lock())
+                        return arena;
+                }
+                int fd = shm_open(name.c_str(), O_RDWR, 0600);
+                if (fd < 0)
+                    detail::os_error(name);
+                struct stat st;
+                if (fstat(fd, &st) != 0)
+                {
+                    close(fd);
+                    detail::os_error(name);
+                }
+                std::shared_ptr<Arena> arena = map(name, fd, (size_t)st.st_size);
+                if ((size_t)st.st_size < detail::HeaderSize || arena->header()->magic != detail::Magic)
+                    throw py::value_error("'" + name + "' is not a shared memory arena");
+                return arena;
+            }
+
+            const std::string &name() const { return _name; }
+            char *data() const { return _data; }
+
+            /**
+             * Allocate a block of size bytes with one reference, first fit.
+             * @return offset of the block data in the arena
+             */
+            size_t allocate(size_t size)
+            {
+                size_t need = detail::BlockSize + detail::align_up(size ? size : 1);
+                detail::ArenaLock lock(&header()->mutex);
+                for (size_t offset = detail::HeaderSize; offset < _size; offset += block(offset)->size)
+                {
+                    auto *blk = block(offset);
+                    if (blk->used || blk->size < need)
+                        continue;
+                    if (blk->size - need >= detail::BlockSize + detail::Align)
+                    {
+                        // split, the rest stays free
+                        auto *rest = block(offset + need);
+                        rest->size = blk->size - need;
+                        rest->prev_size = need;
+                        rest->refs.store(0);
+                        rest->used = 0;
+                        if (offset + blk->size < _size)
+                            block(offset + blk->size)->prev_size = rest->size;
+                        blk->size = need;
+                    }
+                    blk->used = 1;
+                    blk->generation = ++header()->generation;
+                    blk->refs.store(1);
+                    return offset + detail::BlockSize;
+                }
+                PyErr_Format(PyExc_MemoryError, "shared memory arena '%s' is full, %zu bytes requested, set AUTOBIND_SHM_SIZE for a larger arena", _name.c_str(), size);
+                throw py::error_already_set();
+            }
+
+            uint64_t generation(size_t offset) const
+            {
+                return block(offset - detail::BlockSize)->generation;
+            }
+
+            /**
+             * Add a reference to the block of data at offset, e.g. for an unpickled handle.
+             * @return false if it is not the block of that generation with at least size bytes, or
+             *         it is already freed: its last reference was dropped
+             */
+            bool acquire(size_t offset, uint64_t generation, size_t size)
+            {
+                detail::ArenaLock lock(&header()->mutex);
+                // offset comes from a pickle, only trust it if it starts a block
+                size_t pos = detail::HeaderSize;
+                while (pos < _size && pos + detail::BlockSize < offset)
+                    pos += block(pos)->size;
+                if (pos >= _size || pos + detail::BlockSize != offset)
+                    return false;
+                auto *blk = block(pos);
+                if (!blk->used || blk->generation != generation || size > blk->size - detail::BlockSize)
+                    return false;
+                // release drops references without the lock, a block at 0 is being freed
+                uint32_t refs = blk->refs.load();
+                do
+                {
+                    if (refs == 0)
+                        return false;
+                } while (!blk->refs.compare_exchange_weak(refs, refs + 1));
+                return true;
+            }
+
+            /**
+             * Drop one reference of the block at offset, the last one frees the block and merges it with free neighbours.
+             */
+            void release(size_t offset)
+            {
+                size_t pos = offset - detail::BlockSize;
+                auto *blk = block(pos);
+                if (blk->refs.fetch_sub(1) != 1)
+                    return;
+                detail::ArenaLock lock(&header()->mutex);
+                blk->used = 0;
+                size_t next = pos + blk->size;
+                if (next < _size && !block(next)->used)
+                {
+                    blk->size += block(next)->size;
+                    next = pos + blk->size;
+                }
+                if (blk->prev_size && !block(pos - blk->prev_size)->used)
+                {
+                    pos -= blk->prev_size;
+                    block(pos)->size += blk->size;
+                    blk = block(pos);
+                }
+                if (next < _size)
+                    block(next)->prev_size = blk->size;
+            }
+
+        private:
+            Arena(std::string name, char *data, size_t size) : _name(std::move(name)), _data(data), _size(size) {}
+
+            static std::map<std::string, std::weak_ptr<Arena>> &registry()
+            {
+                static auto *opened = new std::map<std::string, std::weak_ptr<Arena>>();
+                return *opened;
+            }
+
+            static std::shared_ptr<Arena> map(const std::string &name, int fd, size_t size)
+            {
+                void *data = mmap(nullptr, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+                close(fd);
+                if (data == MAP_FAILED)
+                    detail::os_error(name);
+                std::shared_ptr<Arena> arena(new Arena(name, static_cast<char *>(data), size));
+                registry()[name] = arena;
+                return arena;
+            }
+
+            detail::ArenaHeader *header() const { return reinterpret_cast<detail::ArenaHeader *>(_data); }
+            detail::Block *block(size_t offset) const { return reinterpret_cast<detail::Block *>(_data + offset); }
+
+            std::string _name;
+            char *_data;
+            size_t _size;
+        };
+
+        /**
+         * Handle of a block in an arena, holds one reference of the block.
+         */
+        class ShmBuffer
+        {
+        public:
+            /**
+             * Take over the reference of the block at offset, the caller allocated or acquired it.
+             */
+            ShmBuffer(std::shared_ptr<Arena> arena, size_t offset, std::string format, size_t itemsize, size_t count)
+                : _arena(std::move(arena)), _offset(offset), _format(std::move(format)), _itemsize(itemsize), _count(count)
+            {
+            }
+
+            /**
+             * Handle of a block in arena name, adds a reference which the block must still have.
+             */
+            static std::unique_ptr<ShmBuffer> open(const std::string &name, size_t offset, uint64_t generation, const std::string &format, size_t itemsize, size_t count)
+            {
+                auto arena = Arena::open(name);
+                if (itemsize == 0 || count > SIZE_MAX / itemsize || !arena->acquire(offset, generation, count * itemsize))
+                    throw py::value_error("invalid or freed shared memory block of '" + name + "', keep a handle of it alive until its pickle is loaded");
+                return std::make_unique<ShmBuffer>(std::move(arena), offset, format, itemsize, count);
+            }
+
+            ShmBuffer(const ShmBuffer &) = delete;
+            ShmBuffer &operator=(const ShmBuffer &) = delete;
+
+            ~ShmBuffer() { _arena->release(_offset); }
+
+            py::buffer_info buffer() const
+            {
+                return py::buffer_info(_arena->data() + _offset, (py::ssize_t)_itemsize, _format, 1, {(py::ssize_t)_count}, {(py::ssize_t)_itemsize});
+            }
+
+            // only names the block, the handle it's unpickled to adds its own reference
+            py::tuple reduce(py::handle self) const
+            {
+                return py::make_tuple(py::type::of(self), py::make_tuple(_arena->name(), _offset, _arena->generation(_offset), _format, _itemsize, _count));
+            }
+
+            const std::string &name() const { return _arena->name(); }
+            size_t offset() const { return _offset; }
+            size_t size() const { return _count; }
+            size_t nbytes() const { return _count * _itemsize; }
+
+        private:
+            std::shared_ptr<Arena> _arena;
+            size_t _offset;
+            std::string _format;
+            size_t _itemsize;
+            size_t _count;
+        };
+
+        namespace detail
+        {
+            inline std::string &module_name()
+            {
+                static std::string name;
+                return name;
+            }
+
+            // arena of this process and module, created on first use
+            inline std::shared_ptr<Arena> &own_arena()
+            {
+                static auto *arena = new std::shared_ptr<Arena>();
+                if (!*arena)
+                {
+                    size_t size = DefaultSize;
+                    if (const char *env = std::getenv("AUTOBIND_SHM_SIZE"))
+                        size = (size_t)std::strtoull(env, nullptr, 10);
+                    std::string name = "/autobind." + module_name() + "." + std::to_string(getpid());
+                    *arena = Arena::create(name, size);
+                    py::module_::import("atexit").attr("register")(py::cpp_function([name]() { shm_unlink(name.c_str()); }));
+                }
+                return *arena;
+            }
+
+            template <typename T>
+            std::string format()
+            {
+                if constexpr (std::is_arithmetic_v<T>)
+                    return py::format_descriptor<T>::format();
+                else
+                    return "B";
+            }
+
+            template <typename T>
+            std::unique_ptr<ShmBuffer> store(const std::vector<T> &value)
+            {
+                static_assert(std::is_trivially_copyable_v<T>, "`:shm` vector items must be trivially copyable");
+                auto &arena = own_arena();
+                size_t nbytes = value.size() * sizeof(T);
+                size_t offset = arena->allocate(nbytes);
+                if (nbytes)
+                    std::memcpy(arena->data() + offset, value.data(), nbytes);
+                if constexpr (std::is_arithmetic_v<T>)
+                    return std::make_unique<ShmBuffer>(arena, offset, format<T>(), sizeof(T), value.size());
+                else
+                    return std::make_unique<ShmBuffer>(arena, offset, format<T>(), 1, nbytes);
+            }
+
+            inline std::unique_ptr<ShmBuffer> store(const std::string &value)
+            {
+                auto &arena = own_arena();
+                size_t offset = arena->allocate(value.size());
+                std::memcpy(arena->data() + offset, value.data(), value.size());
+                return std::make_unique<ShmBuffer>(arena, offset, "B", 1, value.size());
+            }
+        } // namespace detail
+
+        /**
+         * Wrap func to store its result in the shared memory arena and return a ShmBuffer handle.
+         */
+        template <typename R, typename... Args>
+        auto wrap(R (*func)(Args...))
+        {
+            return [func](Args... args) { return detail::store(func(std::forward<Args>(args)...)); };
+        }
+
+        template <typename R, typename C, typename... Args>
+        auto wrap(R (C::*func)(Args...))
+        {
+            return [func](C &self, Args... args) { return detail::store((self.*func)(std::forward<Args>(args)...)); };
+        }
+
+        template <typename R, typename C, typename... Args>
+        auto wrap(R (C::*func)(Args...) const)
+        {
+            return [func](const C &self, Args... args) { return detail::store((self.*func)(std::forward<Args>(args)...)); };
+        }
+
+        /**
+         * Bind the ShmBuffer handle class to module m, the root module of the bindings.
+         */
+        inline void install(py::module_ &m)
+        {
+            detail::module_name() = m.attr("__name__").cast<std::string>();
+            py::class_<ShmBuffer>(m, "ShmBuffer", "Handle of a buffer in a shared memory arena, zero-copy memoryview/numpy.asarray, pickles to the arena name and offset", py::buffer_protocol(), py::module_local())
+                .def(py::init(&ShmBuffer::open),
+                     "Another handle of a block still referenced by a handle, used by pickle", py::arg("name"), py::arg("offset"), py::arg("generation"), py::arg("format"), py::arg("itemsize"), py::arg("count"))
+                .def_buffer(&ShmBuffer::buffer)
+                .def("__reduce__", [](const py::object &self) { return self.cast<const ShmBuffer &>().reduce(self); })
+                .def("__len__", &ShmBuffer::size)
+                .def_property_readonly("nbytes", &ShmBuffer::nbytes)
+                .def_property_readonly("name", &ShmBuffer::name)
+                .def_property_readonly("offset", &ShmBuffer::offset);
+        }
+    } // namespace shm
+} // namespace autobind
@@ -0,0 +1,308 @@
+/**
+ * @file trace.hpp
+ * @brief Runtime helpers for `--trace` bindings emitted by cpp_bind_python.py
+ *
+ * While a trace is recording, every call of a bound function is recorded as a
+ * complete event (start, duration, thread id, full name) into a ring buffer
+ * owned by the calling thread, so recording takes no lock and threads never
+ * share cache lines; the oldest events are overwritten when a buffer is full.
+ * Bound functions record when they return to Python, i.e. with the GIL held,
+ * so starting and dumping (also with the GIL) never race with a writer.
+ * Waiting to reacquire the GIL after C++ code ran without it (GilRelease of
+ * `:batch` and `:parallel`) is recorded as its own "GIL wait" span.
+ * `<module>.trace_dump(path)` stops recording and writes the events of all
+ * threads as Chrome trace event JSON, opened by chrome://tracing or
+ * https://ui.perfetto.dev. Without `--trace` nothing is generated.
+ */
+
+#pragma once
+
+#include "common.hpp"
+
+#include <pybind11/pybind11.h>
+
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+#include <cstdio>
+#include <memory>
+#include <mutex>
+#include <stdexcept>
+#include <string>
+#include <utility>
+#include <vector>
+
+#include <sys/syscall.h>
+#include <unistd.h>
+
+namespace AUTOBIND_NAMESPACE
+{
+    namespace py = pybind11;
+
+    namespace trace
+    {
+        inline uint64_t now_ns()
+        {
+            return (uint64_t)std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now().time_since_epoch()).count();
+        }
+
+        struct Event
+        {
+            const char *name;
+            const char *category;
+            uint64_t start_ns;
+            uint64_t duration_ns;
+        };
+
+        /**
+         * Events of one thread, written only by that thread, read by dump() after recording stopped.
+         */
+        class ThreadBuffer
+        {
+        public:
+            ThreadBuffer(size_t capacity, std::string name) : _tid((long)syscall(SYS_gettid)), _name(std::move(name)), _events(capacity) {}
+
+            void add(const char *name, const char *category, uint64_t start_ns, uint64_t end_ns)
+            {
+                uint64_t head = _head.load(std::memory_order_relaxed);
+                _events[head % _events.size()] = {name, category, start_ns, end_ns - start_ns};
+                _head.store(head + 1, std::memory_order_release);
+            }
+
+            void reset(size_t capacity)
+            {
+                _events.assign(capacity, Event{});
+                _head.store(0, std::memory_order_relaxed);
+            }
+
+            long tid() const { return _tid; }
+
+            const std::string &name() const { return _name; }
+
+            // oldest first
+            template <typename F>
+            void for_each(F &&func) const
+            {
+                uint64_t head = _head.load(std::memory_order_acquire);
+                uint64_t begin = head > _events.size() ? head - _events.size() : 0;
+                for (uint64_t i = begin; i < head; ++i)
+                    func(_events[i % _events.size()]);
+            }
+
+        private:
+            long _tid;
+            std::string _name;
+            std::vector<Event> _events;
+            std::atomic<uint64_t> _head{0};
+        };
+
+        class Recorder
+        {
+        public:
+            static Recorder &instance()
+            {
+                // never destroyed, threads may still record at exit
+                static Recorder *recorder = new Recorder();
+                return *recorder;
+            }
+
+            bool recording() const { return _recording.load(std::memory_order_relaxed); }
+
+            void add(const char *name, const char *category, uint64_t start_ns, uint64_t end_ns)
+            {
+                thread_local ThreadBuffer *buffer = nullptr;
+                if (!buffer)
+                    buffer = new_buffer();
+                buffer->add(name, category, start_ns, end_ns);
+            }
+
+            void start(size_t capacity)
+            {
+                stop();
+                std::lock_guard<std::mutex> lock(_mutex);
+                _capacity = capacity;
+                for (auto &buffer : _buffers)
+                    buffer->reset(capacity);
+                gil_wait_hook.store(&Recorder::gil_wait, std::memory_order_relaxed);
+                _recording.store(true, std::memory_order_relaxed);
+            }
+
+            void stop()
+            {
+                _recording.store(false, std::memory_order_relaxed);
+                gil_wait_hook.store(nullptr, std::memory_order_relaxed);
+            }
+
+            /**
+             * Stop recording and write the events as Chrome trace event JSON, returns the number of events.
+             */
+            size_t dump(const std::string &path)
+            {
+                stop();
+                FILE *f = fopen(path.c_str(), "w");
+                if (!f)
+                    throw std::runtime_error("can not open " + path);
+                std::lock_guard<std::mutex> lock(_mutex);
+                long pid = (long)getpid();
+                size_t count = 0;
+                fprintf(f, "{\"displayTimeUnit\":\"ns\",\"traceEvents\":[\n");
+                for (auto &buffer : _buffers)
+                {
+                    fprintf(f, "%s{\"name\":\"thread_name\",\"ph\":\"M\",\"pid\":%ld,\"tid\":%ld,\"args\":{\"name\":%s}}", count ? ",\n" : "", pid, buffer->tid(), buffer->name().c_str());
+                    ++count;
+                    buffer->for_each([&](const Event &e) {
+                        fprintf(f, ",\n{\"name\":\"%s\",\"cat\":\"%s\",\"ph\":\"X\",\"pid\":%ld,\"tid\":%ld,\"ts\":%.3f,\"dur\":%.3f}",
+                                e.name, e.category, pid, buffer->tid(), e.start_ns / 1000.0, e.duration_ns / 1000.0);
+                        ++count;
+                    });
+                }
+                fprintf(f, "\n]}\n");
+                bool failed = ferror(f) != 0;
+                fclose(f);
+                if (failed)
+                    throw std::runtime_error("write " + path + " failed");
+                return count - _buffers.size();
+            }
+
+        private:
+            Recorder() = default;
+
+            ThreadBuffer *new_buffer()
+            {
+                // Python name of the thread as JSON string, called with the GIL held
+                std::string name = "\"thread " + std::to_string((long)syscall(SYS_gettid)) + "\"";
+                try
+                {
+                    // keep a Python error being returned by the call
+                    py::error_scope error;
+                    py::object thread = py::module_::import("threading").attr("current_thread")();
+                    name = py::module_::import("json").attr("dumps")(thread.attr("name")).cast<std::string>();
+                }
+                catch (py::error_already_set &)
+                {
+                }
+                std::lock_guard<std::mutex> lock(_mutex);
+                // buffers of exited threads are kept, their events are still dumped
+                _buffers.push_back(std::make_unique<ThreadBuffer>(_capacity, std::move(name)));
+                return _buffers.back().get();
+            }
+
+            static void gil_wait(uint64_t start_ns, uint64_t end_ns)
+            {
+                Recorder &recorder = instance();
+                if (recorder.recording())
+                    recorder.add("GIL wait", "gil", start_ns, end_ns);
+            }
+
+            std::atomic<bool> _recording{false};
+            std::mutex _mutex;
+            size_t _capacity = 65536;
+            std::vector<std::unique_ptr<ThreadBuffer>> _buffers;
+        };
+
+        /**
+         * Records the scope as a call of name if recording when it starts, name must be a string literal.
+         */
+        class Scope
+        {
+        public:
+            explicit Scope(const char *name) : _name(Recorder::instance().recording() ? name : nullptr), _start(_name ? now_ns() : 0) {}
+            Scope(const Scope &) = delete;
+            Scope &operator=(const Scope &) = delete;
+
+            ~Scope()
+            {
+                if (_name)
+                    Recorder::instance().add(_name, "call", _start, now_ns());
+            }
+
+            void cancel() { _name = nullptr; }
+
+        private:
+            const char *_name;
+            uint64_t _start;
+        };
+
+        /**
+         * Binding attribute recording the calls of a function, Name is a lambda returning the full name,
+         * whose unique type gives each binding its own wrapper of the pybind11 impl.
+         */
+        template <typename Name>
+        struct calls
+        {
+            Name name;
+        };
+
+        template <typename Name>
+        calls<Name> make_calls(Name name)
+        {
+            return {name};
+        }
+
+        namespace detail
+        {
+            template <typename Name>
+            struct Wrapped
+            {
+                static inline py::handle (*impl)(py::detail::function_call &) = nullptr;
+                static inline const char *name = nullptr;
+
+                static py::handle call(py::detail::function_call &call)
+                {
+                    Scope scope(name);
+                    py::handle result = impl(call);
+                    if (result.ptr() == PYBIND11_TRY_NEXT_OVERLOAD)
+                        scope.cancel();
+                    return result;
+                }
+            };
+        } // namespace detail
+
+        /**
+         * Add trace_start(), trace_stop() and trace_dump() to module m.
+         */
+        inline void install(py::module_ &m)
+        {
+            m.def(
+                "trace_start", [](size_t capacity) {
+                    if (capacity == 0)
+                        throw py::value_error("capacity must be > 0");
+                    Recorder::instance().start(capacity);
+                },
+                "Start recording calls of the bound functions and GIL waits, clearing the events recorded before.\n"
+                "Each thread keeps its last capacity events.",
+                py::arg("capacity") = 65536);
+            m.def(
+                "trace_stop", []() { Recorder::instance().stop(); }, "Stop recording, the events are kept for trace_dump()");
+            m.def(
+                "trace_dump", [](const std::string &path) { return Recorder::instance().dump(path); },
+                "Stop recording and write the events to path as Chrome trace event JSON (chrome://tracing, ui.perfetto.dev),\n"
+                "return the number of events",
+                py::arg("path"));
+        }
+    } // namespace trace
+} // namespace autobind
+
+namespace pybind11
+{
+    namespace detail
+    {
+        template <typename Name>
+        struct process_attribute<::autobind::trace::calls<Name>> : process_attribute_default<::autobind::trace::calls<Name>>
+        {
+            static void init(const ::autobind::trace::calls<Name> &attr, function_record *r)
+            {
+                using Wrapped = ::autobind::trace::detail::Wrapped<Name>;
+                Wrapped::name = attr.name();
+                Wrapped::impl = r->impl;
+                r->impl = &Wrapped::call;
+            }
+        };
+    } // namespace detail
+} // namespace pybind11
+
+/**
+ * Binding attribute recording the calls of the function with the full name (a string literal) while tracing,
+ * e.g. `m.def("add", &add, AUTOBIND_TRACE("add.add"))`.
+ */
+#define AUTOBIND_TRACE(name) ::autobind::trace::make_calls([] { return name; })
@@ -0,0 +1,81 @@
+'''
+    @brief Benchmark per-call latency of add.test.add, pybind11 binding vs `--fastcall` backend
+
+    Generates the binding of main/include/add.hpp twice (default and --fastcall),
+    compiles each to an extension module in a temporary directory, and times
+    add.test.add(1, 2) in a fresh interpreter for every variant.
+
+    Usage:
+        python3 bench/bench_fastcall.py [--number 1000000] [--repeat 5] [--cxx g++]
+'''
+
+import os
+import sys
+import argparse
+import subprocess
+import sysconfig
+import tempfile
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(curr_dir)
+sdk_path = os.path.abspath(os.path.join(project_dir, "..", ".."))
+
+TIMING_CODE = '''
+import sys, timeit
+sys.path.insert(0, sys.argv[1])
+import add
+f = add.test.add
+number, repeat = int(sys.argv[2]), int(sys.argv[3])
+best = min(timeit.repeat("f(1, 2)", globals={"f": f}, number=number, repeat=repeat))
+print(best / number * 1e9)
+'''
+
+
+def build_variant(out_dir, cxx, fastcall):
+    sys.path.insert(0, project_dir)
+    from doc_tool.gen_api import parse_api_from_header
+    from cpp_bind_python import generate_api_cpp
+    sys.path.pop(0)
+
+    header = os.path.join(project_dir, "main", "include", "add.hpp")
+    api_tree, _, _ = parse_api_from_header(header, {}, sdks=["module"], module_name="add")
+    bind_cpp = os.path.join(out_dir, "bind_add.cpp")
+    generate_api_cpp(api_tree, header, "add", bind_cpp, fastcall=fastcall)
+    ext = sysconfig.get_config_var("EXT_SUFFIX") or ".so"
+    cmd = [cxx, "-O2", "-shared", "-fPIC", "-std=c++17",
+           "-I", os.path.join(project_dir, "main", "include"),
+           "-I", os.path.join(sdk_path, "components", "pybind11", "pybind11", "include"),
+           "-I", os.path.join(sdk_path, "components", "pybind11", "include"),
+           "-I", sysconfig.get_paths()["include"],
+           bind_cpp, os.path.join(project_dir, "main", "src", "add.cpp"),
+           "-o", os.path.join(out_dir, "add" + ext)]
+    subprocess.run(cmd, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark add.test.add, pybind11 vs --fastcall")
+    parser.add_argument("--number", type=int, default=1000000, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs, best one is reported")
+    parser.add_argument("--cxx", type=str, default=os.environ.get("CXX", "g++"), help="C++ compiler")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fastcall in [("pybind11", False), ("fastcall", True)]:
+            out_dir = os.path.join(tmp, name)
+            os.makedirs(out_dir)
+            print(f"-- Building {name} variant")
+            build_variant(out_dir, args.cxx, fastcall)
+            out = subprocess.run([sys.executable, "-c", TIMING_CODE, out_dir, str(args.number), str(args.repeat)],
+                                 check=True, capture_output=True, text=True).stdout
+            results[name] = float(out.strip())
+
+    print("\n| backend | ns/call |")
+    print("| --- | --- |")
+    for name, ns in results.items():
+        print(f"| {name} | {ns:.1f} |")
+    print(f"\n-- fastcall speedup: {results['pybind11'] / results['fastcall']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
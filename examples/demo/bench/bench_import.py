@@ -0,0 +1,312 @@
+'''
+    @brief Benchmark import time, RSS and .so size of generated packages against the number of bindings
+
+    For every size, copies this project to a temporary directory, replaces main/include
+    with synthetic headers of that many bindings (functions and class methods, grouped
+    into submodules of 100), and builds the package through the normal pipeline
+    (project.py build: cpp_bind_python.py -> CMake -> setup.py). The package directory
+    build/<package> (the content of the wheel) is then imported in fresh interpreters:
+    cold (the package files evicted from the page cache first) and warm, measuring the
+    time and RSS growth of `import <package>` and of touching every submodule
+    afterwards (registers `--lazy` submodules). Also reports the size and the dynamic
+    relocation count of every .so, relocations are resolved by the loader at import.
+
+    Usage:
+        python3 bench/bench_import.py [--sizes 10,100,1000,10000] [--headers 1] [--bind-args="--lazy --strip-docs"]
+                                      [--runs 5] [--output import_bench.json] [--keep DIR]
+'''
+
+import os
+import sys
+import json
+import shlex
+import struct
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(curr_dir)
+sdk_path = os.path.abspath(os.environ.get("MY_SDK_PATH") or os.path.join(project_dir, "..", ".."))
+
+PACKAGE_NAME = "synth"
+GROUP_SIZE = 100        # bindings per submodule
+GROUP_FUNCTIONS = 80    # the other bindings of a group are the constructor and methods of one class
+
+IMPORT_CODE = '''
+import os, sys, json, time, importlib
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def touch(module, depth):
+    for name in dir(module):
+        value = getattr(module, name)
+        if depth and type(value).__name__ == "module" and value is not module:
+            touch(value, depth - 1)
+
+
+sys.path.insert(0, sys.argv[1])
+rss0 = rss()
+t0 = time.perf_counter()
+package = importlib.import_module(sys.argv[2])
+t1 = time.perf_counter()
+rss1 = rss()
+touch(package, 3)
+t2 = time.perf_counter()
+rss2 = rss()
+print(json.dumps({"import_ms": (t1 - t0) * 1e3, "import_rss_kb": (rss1 - rss0) / 1024,
+                  "touch_ms": (t2 - t1) * 1e3, "total_rss_kb": (rss2 - rss0) / 1024}))
+'''
+
+
+def synth_sources(module_name, first, count):
+    """
+    Header and source of module_name with count bindings, numbered from first so names are unique across headers.
+    Returns (header, source).
+    """
+    header = ["#pragma once", "", "#include <string>", ""]
+    source = ['#include "{}.hpp"'.format(module_name), ""]
+    groups = {}
+    for i in range(first, first + count):
+        groups.setdefault(i // GROUP_SIZE, []).append(i % GROUP_SIZE)
+    for group, indexes in groups.items():
+        ns = "{}::g{}".format(module_name, group)
+        mod = "{}.g{}".format(module_name, group)
+        header.append("namespace {}\n{{".format(ns))
+        source.append("namespace {}\n{{".format(ns))
+        methods = [j for j in indexes if j > GROUP_FUNCTIONS]
+        for j in indexes:
+            if j >= GROUP_FUNCTIONS:
+                continue
+            kind = j % 3
+            if kind == 0:
+                decl, body = "int f{}(int a, int b)".format(j), "return a + b + {};".format(j)
+                params = ["@param a first operand", "@param b second operand", "@return sum"]
+            elif kind == 1:
+                decl, body = "double f{}(double x)".format(j), "return x * {};".format(j + 1)
+                params = ["@param x value", "@return scaled value"]
+            else:
+                decl, body = "std::string f{}(const std::string &s)".format(j), "return s + \"{}\";".format(j)
+                params = ["@param s string", "@return s with a suffix"]
+            header.append("    /**\n     * Synthetic function {}.".format(j))
+            header += ["     * " + x for x in params]
+            header.append("     * @module {}.f{}\n     */\n    {};\n".format(mod, j, decl))
+            source.append("    {}\n    {{\n        {}\n    }}\n".format(decl, body))
+        if GROUP_FUNCTIONS in indexes:
+            header.append("    /**\n     * Synthetic class.\n     * @module {}.C\n     */\n    class C\n    {{\n    public:".format(mod))
+            header.append("        /**\n         * Construct C.\n         * @param v initial value\n"
+                          "         * @module {}.C.__init__\n         */\n        C(int v);\n".format(mod))
+            source.append("    C::C(int v) : _v(v)\n    {\n    }\n")
+            for j in methods:
+                header.append("        /**\n         * Synthetic method {}.\n         * @param a operand\n         * @return value plus a\n"
+                              "         * @module {}.C.m{}\n         */\n        int m{}(int a);\n".format(j, mod, j, j))
+                source.append("    int C::m{}(int a)\n    {{\n        return _v + a + {};\n    }}\n".format(j, j))
+            header.append("    private:\n        int _v;\n    };")
+        header.append("}\n")
+        source.append("}\n")
+    return "\n".join(header), "\n".join(source)
+
+
+def prepare_project(work_dir, bindings, headers, bind_args):
+    """
+    Copy this project to work_dir with synthetic headers and a build config enabling the wheel package and bind_args.
+    """
+    shutil.copytree(project_dir, work_dir, ignore=shutil.ignore_patterns("build", "dist", "*.egg-info", "__pycache__", "bench"))
+    include_dir = os.path.join(work_dir, "main", "include")
+    src_dir = os.path.join(work_dir, "main", "src")
+    shutil.rmtree(include_dir)
+    os.makedirs(include_dir)
+    for name in os.listdir(src_dir):
+        if name != "main.cpp":
+            os.remove(os.path.join(src_dir, name))
+
+    # headers after the first are modules synth_1, synth_2... of the same package, loaded on first access
+    per_header = -(-bindings // headers)
+    first = 0
+    for i in range(headers):
+        count = min(per_header, bindings - first)
+        if count <= 0:
+            break
+        module_name = PACKAGE_NAME if i == 0 else "{}_{}".format(PACKAGE_NAME, i)
+        header, source = synth_sources(module_name, first, count)
+        with open(os.path.join(include_dir, module_name + ".hpp"), "w") as f:
+            f.write(header)
+        with open(os.path.join(src_dir, module_name + ".cpp"), "w") as f:
+            f.write(source)
+        first += count
+
+    sys.path.insert(0, project_dir)
+    from project import BIND_ARGS_MAP
+    sys.path.pop(0)
+    configs = {arg: key for key, arg in BIND_ARGS_MAP.items()}
+    lines = ["CONFIG_TARGET_ARCH_X86=y", "CONFIG_BUILD_WHL_PACKAGE=y", 'CONFIG_WHL_PACKAGE_NAME="{}"'.format(PACKAGE_NAME)]
+    for arg in bind_args:
+        if arg not in configs:
+            raise ValueError("{} has no Kconfig option, supported: {}".format(arg, ", ".join(configs)))
+        lines.append(configs[arg] + "=y")
+    config_path = os.path.join(work_dir, "build", "config", "global_config.mk")
+    os.makedirs(os.path.dirname(config_path))
+    with open(config_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def build_project(work_dir, log_path):
+    """
+    project.py build, returns the package directory build/<package> and the build time.
+    """
+    env = dict(os.environ, MY_SDK_PATH=sdk_path)
+    t = time.time()
+    with open(log_path, "w") as log:
+        # project.py always exits 1 after building the wheel, success is the package directory with the .so files
+        subprocess.run([sys.executable, "project.py", "build"], cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    elapsed = time.time() - t
+    package_dir = os.path.join(work_dir, "build", PACKAGE_NAME)
+    if not os.path.exists(os.path.join(package_dir, "__init__.py")) or not so_files(package_dir):
+        raise RuntimeError("building {} failed, see {}".format(work_dir, log_path))
+    if not os.path.isdir(os.path.join(work_dir, "dist")):
+        print("-- Warning: no wheel in {}/dist (is the wheel package installed?), measuring {}".format(work_dir, package_dir))
+    return package_dir, elapsed
+
+
+def so_files(package_dir):
+    return sorted(name for name in os.listdir(package_dir) if name.endswith(".so"))
+
+
+def count_relocations(path):
+    """
+    Number of relocation entries in the SHT_RELA/SHT_REL sections of an ELF file (.rela.dyn, .rela.plt).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"\x7fELF":
+        raise ValueError("{} is not an ELF file".format(path))
+    is64 = data[4] == 2
+    endian = "<" if data[5] == 1 else ">"
+    if is64:
+        shoff, = struct.unpack_from(endian + "Q", data, 0x28)
+        shentsize, shnum = struct.unpack_from(endian + "HH", data, 0x3A)
+        section = endian + "IIQQQQIIQQ"
+    else:
+        shoff, = struct.unpack_from(endian + "I", data, 0x20)
+        shentsize, shnum = struct.unpack_from(endian + "HH", data, 0x2E)
+        section = endian + "IIIIIIIIII"
+    count = 0
+    for i in range(shnum):
+        fields = struct.unpack_from(section, data, shoff + i * shentsize)
+        sh_type, sh_size, sh_entsize = fields[1], fields[5], fields[9]
+        if sh_type in (4, 9) and sh_entsize:  # SHT_RELA, SHT_REL
+            count += sh_size // sh_entsize
+    return count
+
+
+def evict_page_cache(package_dir):
+    """
+    Drop the clean cached pages of the package files, so the next import reads them from disk.
+    """
+    for name in os.listdir(package_dir):
+        path = os.path.join(package_dir, name)
+        if not os.path.isfile(path):
+            continue
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def run_import(package_dir):
+    # a fresh interpreter per run, only the package import is timed
+    out = subprocess.run([sys.executable, "-c", IMPORT_CODE, os.path.dirname(package_dir), PACKAGE_NAME],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def median_of(samples):
+    return {key: statistics.median(x[key] for x in samples) for key in samples[0]}
+
+
+def measure(package_dir, runs):
+    cold = []
+    for _ in range(runs):
+        evict_page_cache(package_dir)
+        cold.append(run_import(package_dir))
+    run_import(package_dir)
+    warm = [run_import(package_dir) for _ in range(runs)]
+    files = so_files(package_dir)
+    sizes = {name: os.path.getsize(os.path.join(package_dir, name)) for name in files}
+    relocations = {name: count_relocations(os.path.join(package_dir, name)) for name in files}
+    return {
+        "cold": median_of(cold),
+        "warm": median_of(warm),
+        "so_bytes": sizes,
+        "so_bytes_total": sum(sizes.values()),
+        "relocations": relocations,
+        "relocations_total": sum(relocations.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time, RSS and .so size of generated packages")
+    parser.add_argument("--sizes", type=str, default="10,100,1000,10000", help="numbers of bindings, comma separated")
+    parser.add_argument("--headers", type=int, default=1, help="split the bindings into this many headers (modules)")
+    parser.add_argument("--bind-args", type=str, default="", help='cpp_bind_python.py args, pass them with "=", e.g. --bind-args=--lazy or --bind-args="--lazy --strip-docs"')
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement, median is reported")
+    parser.add_argument("--output", type=str, default="import_bench.json", help="JSON results file")
+    parser.add_argument("--keep", type=str, default="", help="build in this directory and keep it, default a temporary one")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    bind_args = shlex.split(args.bind_args)
+    work_root = os.path.abspath(args.keep) if args.keep else tempfile.mkdtemp(prefix="bench_import_")
+    os.makedirs(work_root, exist_ok=True)
+
+    results = []
+    try:
+        for size in sizes:
+            work_dir = os.path.join(work_root, "bindings_{}".format(size))
+            if os.path.exists(work_dir):
+                shutil.rmtree(work_dir)
+            print("-- Building {} bindings in {}".format(size, work_dir))
+            prepare_project(work_dir, size, args.headers, bind_args)
+            package_dir, build_s = build_project(work_dir, work_dir + ".log")
+            print("-- Built in {:.1f}s, measuring".format(build_s))
+            result = {"bindings": size, "build_s": build_s}
+            result.update(measure(package_dir, args.runs))
+            results.append(result)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "bind_args": bind_args,
+        "headers": args.headers,
+        "runs": args.runs,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n| bindings | cold import ms | warm import ms | touch ms | import RSS KiB | total RSS KiB | .so KiB | relocations |")
+    print("| --- | --- | --- | --- | --- | --- | --- | --- |")
+    for r in results:
+        print("| {} | {:.2f} | {:.2f} | {:.2f} | {:.0f} | {:.0f} | {:.0f} | {} |".format(
+            r["bindings"], r["cold"]["import_ms"], r["warm"]["import_ms"], r["warm"]["touch_ms"],
+            r["warm"]["import_rss_kb"], r["warm"]["total_rss_kb"], r["so_bytes_total"] / 1024, r["relocations_total"]))
+    print("\n-- Results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
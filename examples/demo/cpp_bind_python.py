@@ -3,12 +3,337 @@
 '''
 
 import os
+import re
 import argparse
 import time
 import sys
 import json
+import gzip
 
-def generate_api_cpp(api_tree, header_path, module_name, out_path=None):
+# Python operator method => C++ operator, bound with py::self so no extra Python frame per operation
+_UNARY_OPERATORS = {"__neg__": "-", "__pos__": "+", "__invert__": "~"}
+_BINARY_OPERATORS = {
+    "__add__": "+", "__sub__": "-", "__mul__": "*", "__truediv__": "/", "__mod__": "%",
+    "__lshift__": "<<", "__rshift__": ">>", "__and__": "&", "__xor__": "^", "__or__": "|",
+    "__iadd__": "+=", "__isub__": "-=", "__imul__": "*=", "__itruediv__": "/=", "__imod__": "%=",
+    "__ilshift__": "<<=", "__irshift__": ">>=", "__iand__": "&=", "__ixor__": "^=", "__ior__": "|=",
+    "__eq__": "==", "__ne__": "!=", "__lt__": "<", "__gt__": ">", "__le__": "<=", "__ge__": ">=",
+}
+_REVERSE_OPERATORS = {
+    "__radd__": "+", "__rsub__": "-", "__rmul__": "*", "__rtruediv__": "/", "__rmod__": "%",
+    "__rlshift__": "<<", "__rrshift__": ">>", "__rand__": "&", "__rxor__": "^", "__ror__": "|",
+}
+# operand types which can be written as `T()` in py::self expressions
+_SCALAR_TYPES = [
+    "bool", "char", "short", "int", "long", "long long", "float", "double", "long double",
+    "unsigned char", "unsigned short", "unsigned int", "unsigned", "unsigned long", "unsigned long long",
+    "size_t", "int8_t", "int16_t", "int32_t", "int64_t", "uint8_t", "uint16_t", "uint32_t", "uint64_t",
+]
+
+def _operand_type(arg_type):
+    return arg_type.replace("const ", "").replace("&", "").strip()
+
+def _is_mutable_ref(arg_type):
+    arg_type = arg_type.strip()
+    return arg_type.endswith("&") and not arg_type.endswith("&&") and "const" not in arg_type.split()
+
+def _gen_operator(name, func, parent_var, parent_type, cpp_class_name, doc):
+    """
+    Generate binding code for a C++ operator bound to a Python operator method.
+
+    Args:
+        name: Python method name, e.g. "__add__"
+        func: func node, func["name"] is the C++ name, e.g. "operator+"
+        parent_var: Variable name of the parent in pybind11
+        parent_type: Type of parent, only operators of class are supported
+        cpp_class_name: Full C++ class name
+        doc: Escaped doc string
+
+    Returns:
+        Generated C++ code string, None if not an operator or bound as a normal method
+    """
+    if parent_type != "class" or not re.match(r"operator\s*[^\w\s]", func["name"]):
+        return None
+    op = func["name"][len("operator"):].strip()
+    args = [_operand_type(x[0]) for x in func["args"]]
+    is_self = lambda t: t in [cpp_class_name, cpp_class_name.split("::")[-1]]
+    def operand(t):
+        if is_self(t):
+            return "py::self"
+        if t in _SCALAR_TYPES or t.startswith("std::"):
+            return "{}()".format(t)
+        return None
+
+    # member operators have one less argument than the free ones, the first argument of free operators is self
+    if name in _UNARY_OPERATORS and _UNARY_OPERATORS[name] == op and (not args or (len(args) == 1 and is_self(args[0]))):
+        return '{}.def({}py::self, "{}");'.format(parent_var, op, doc)
+    if name in _BINARY_OPERATORS and _BINARY_OPERATORS[name] == op and len(args) in [1, 2]:
+        if len(args) == 2 and not is_self(args[0]):
+            raise Exception("first argument of {} should be {} for {}".format(func["name"], cpp_class_name, name))
+        other = operand(args[-1])
+        if other:
+            return '{}.def(py::self {} {}, "{}");'.format(parent_var, op, other, doc)
+        if op.endswith("=") and op not in ["==", "!=", "<=", ">="]:
+            return '{}.def("{}", []({} &l, const {} &r) -> {} & {{ return l {} r; }}, py::is_operator(), py::return_value_policy::reference, "{}");'.format(
+                parent_var, name, cpp_class_name, args[-1], cpp_class_name, op, doc)
+        return '{}.def("{}", [](const {} &l, const {} &r) {{ return l {} r; }}, py::is_operator(), "{}");'.format(
+            parent_var, name, cpp_class_name, args[-1], op, doc)
+    if name in _REVERSE_OPERATORS and _REVERSE_OPERATORS[name] == op and len(args) == 2 and is_self(args[1]):
+        other = operand(args[0])
+        if other:
+            return '{}.def({} {} py::self, "{}");'.format(parent_var, other, op, doc)
+        return '{}.def("{}", [](const {} &r, const {} &l) {{ return l {} r; }}, py::is_operator(), "{}");'.format(
+            parent_var, name, cpp_class_name, args[0], op, doc)
+    if name == "__setitem__" and op == "[]" and len(args) == 1:
+        return '{}.def("__setitem__", []({} &c, {} i, const {} &value) {{ c[i] = value; }}, "{}", py::arg("{}"), py::arg("value"));'.format(
+            parent_var, cpp_class_name, func["args"][0][0], _operand_type(func["ret_type"]), doc, func["args"][0][1])
+    if op in ["[]", "()"]:
+        # member function pointer is already native, bound as a normal method
+        return None
+    raise Exception("can not bind {} as {} of {}".format(func["name"], name, cpp_class_name))
+
+# C++ type => Python type name, types supported by the `--fastcall` backend
+_FASTCALL_INT_TYPES = [
+    "short", "int", "long", "long long", "unsigned short", "unsigned int", "unsigned", "unsigned long", "unsigned long long",
+    "size_t", "int8_t", "int16_t", "int32_t", "int64_t", "uint8_t", "uint16_t", "uint32_t", "uint64_t",
+]
+_FASTCALL_FLOAT_TYPES = ["float", "double"]
+_FASTCALL_STR_TYPES = ["std::string", "const std::string &", "const char *"]
+
+def _fastcall_type(cpp_type, ret=False):
+    """
+    Python type name of cpp_type if supported by the `--fastcall` backend, else None.
+    """
+    t = " ".join(cpp_type.replace("*", " *").replace("&", " &").split())
+    if t in _FASTCALL_INT_TYPES or (t.startswith("std::") and t[len("std::"):] in _FASTCALL_INT_TYPES):
+        return "int"
+    if t in _FASTCALL_FLOAT_TYPES:
+        return "float"
+    if t == "bool":
+        return "bool"
+    if t in _FASTCALL_STR_TYPES:
+        return "str"
+    if ret and t == "void":
+        return "None"
+    return None
+
+def _gen_fastcall(name, func, func_ref, c_name, doc, instrument=None, trace=None, alloc_heap=None):
+    """
+    Generate a CPython METH_FASTCALL | METH_KEYWORDS function for func.
+
+    Args:
+        name: Python function name
+        func: func node
+        func_ref: C++ function to call, e.g. "add::test::add"
+        c_name: C identifier for the generated function
+        doc: Escaped doc string, None for no docstring (`--strip-docs`)
+        instrument: Full name to record the calls to (`--instrument`), None for not instrumented
+        trace: Full name of the trace events of the calls (`--trace`), None for not traced
+        alloc_heap: Module name to count the C++ heap allocations of the calls to (`--alloc-heap`), None for not counted
+
+    Returns:
+        Generated C++ code string, None if func has arguments or return value not supported
+    """
+    arg_types = [_fastcall_type(x[0]) for x in func["args"]]
+    ret_type = _fastcall_type(func["ret_type"], ret=True)
+    if ret_type is None or None in arg_types:
+        return None
+    args = func["args"]
+    required = len(args)
+    for i, x in enumerate(args):
+        if x[2] is not None:
+            required = i
+            break
+    signature = "{}({}) -> {}".format(name, ", ".join(["{}: {}{}".format(x[1], t, " = {}".format(x[2]) if x[2] is not None else "") for x, t in zip(args, arg_types)]), ret_type)
+    signature = signature.replace("\\", "\\\\").replace('"', '\\"')
+    lines = []
+    if instrument:
+        lines.append('static autobind::instrument::Stats &{}_stats = autobind::instrument::stats("{}");'.format(c_name, instrument))
+    if alloc_heap:
+        lines.append('static autobind::alloc::Counter &{}_heap = autobind::alloc::heap("{}");'.format(c_name, alloc_heap))
+    lines += ["static PyObject *{}(PyObject *, PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames)".format(c_name), "{"]
+    if instrument:
+        lines.append("    autobind::instrument::CallScope scope({}_stats);".format(c_name))
+    if trace:
+        lines.append('    autobind::trace::Scope traced("{}");'.format(trace))
+    if alloc_heap:
+        lines.append("    autobind::alloc::HeapScope heap(&{}_heap);".format(c_name))
+    if args:
+        lines.append("    static const char *const names[] = {{{}}};".format(", ".join(['"{}"'.format(x[1]) for x in args])))
+        lines.append("    PyObject *argv[{}] = {{}};".format(len(args)))
+        lines.append('    if (!autobind::fastcall::parse_args("{}", names, {}, {}, args, nargs, kwnames, argv))'.format(name, len(args), required))
+        lines.append("        return nullptr;")
+        for i, x in enumerate(args):
+            lines.append("    std::decay_t<{}> arg_{}{};".format(x[0], x[1], " = {}".format(x[2]) if x[2] is not None else ""))
+        for i, x in enumerate(args):
+            lines.append('    if ({}!autobind::fastcall::load(argv[{}], arg_{}, "{}", "{}"))'.format("argv[{}] && ".format(i) if i >= required else "", i, x[1], name, x[1]))
+            lines.append("        return nullptr;")
+    else:
+        lines.append('    if (!autobind::fastcall::parse_args("{}", nullptr, 0, 0, args, nargs, kwnames, nullptr))'.format(name))
+        lines.append("        return nullptr;")
+    timer = "autobind::instrument::CppScope cpp; " if instrument else ""
+    lines.append("    return autobind::fastcall::call([&] {{ {}return {}({}); }});".format(timer, func_ref, ", ".join(["arg_" + x[1] for x in args])))
+    lines.append("}")
+    ml_doc = '"{}\\n\\n{}"'.format(signature, doc) if doc is not None else "nullptr"
+    lines.append('static PyMethodDef {}_def = {{"{}", (PyCFunction)(void (*)(void)){}, METH_FASTCALL | METH_KEYWORDS, {}}};'.format(c_name, name, c_name, ml_doc))
+    return "\n".join(lines)
+
+def _py_signature(name, func, method=False):
+    """
+    Python signature of func in the format of pybind11, e.g. "add(a: int, b: int = 10) -> int",
+    for the sidecar docs of `--strip-docs` which disables pybind11's generated signatures.
+    """
+    defaults = {"true": "True", "false": "False", "nullptr": "None", "NULL": "None"}
+    def py_type(cpp_type, ret=False):
+        t = _fastcall_type(cpp_type, ret)
+        if t:
+            return t
+        # bound classes, e.g. "const add::Vec &" => "add.Vec"
+        t = _operand_type(cpp_type)
+        if t.startswith("Eigen::"):
+            return "numpy.ndarray"
+        return t if t.startswith("std::") else t.replace("::", ".")
+    args = ["self"] if method else []
+    args += ["{}: {}{}".format(x[1], py_type(x[0]), " = {}".format(defaults.get(x[2], x[2])) if x[2] is not None else "") for x in func["args"]]
+    ret = "ShmBuffer" if func.get("kv", {}).get("shm") else py_type(func["ret_type"], ret=True)
+    return "{}({}) -> {}".format(name, ", ".join(args), ret)
+
+def _eigen_col_major_2d(cpp_type):
+    """
+    If the Eigen dense type is a column-major matrix (2 dimensions), the storage order of the typedefs
+    (MatrixXf, ArrayXXd, ...) and of Matrix<...>/Array<...> without RowMajor option.
+    """
+    t = cpp_type.replace(" ", "")
+    if t.startswith("const"):
+        t = t[len("const"):]
+    if re.match(r"^Eigen::Matrix[X\d]+[a-z]+$", t) or re.match(r"^Eigen::Array[X\d]{2}[a-z]+$", t):
+        return True
+    m = re.match(r"^Eigen::(Matrix|Array)<(.*)>$", t)
+    if m:
+        params = m.group(2).split(",")
+        if len(params) < 3 or "1" in params[1:3]:
+            return False
+        return not any("RowMajor" in x for x in params[3:])
+    return False
+
+def _eigen_warnings(full_name, func):
+    """
+    Generation time warnings about Eigen arguments pybind11/eigen.h copies (or rejects) instead of
+    sharing the memory of the NumPy array passed in.
+    """
+    warnings = []
+    for arg_type, arg_name, _ in func["args"]:
+        t = arg_type.replace(" ", "")
+        if "Eigen::" not in t:
+            continue
+        where = "{} argument `{}` ({})".format(full_name, arg_name, arg_type)
+        if t.startswith(("Eigen::Map<", "constEigen::Map<")):
+            raise Exception("{}: Eigen::Map arguments are not supported by pybind11, use Eigen::Ref<const T>".format(where))
+        if t.startswith(("Eigen::Ref<", "constEigen::Ref<")):
+            inner = t[t.find("<") + 1:t.rfind(">")]
+            # Ref<T, 0, Stride<Dynamic, Dynamic>> accepts any layout
+            if "Stride<" in inner:
+                continue
+            # NumPy arrays are C-ordered (row-major) by default
+            if _eigen_col_major_2d(re.split(r",(?![^<]*>)", inner)[0]):
+                warnings.append("{}: column-major matrix, C-ordered NumPy arrays are {}, use a RowMajor matrix type or pass Fortran-ordered arrays".format(
+                    where, "copied" if inner.startswith("const") else "rejected"))
+        elif re.search(r"Eigen::(Matrix|Array|Vector|RowVector)", t):
+            if t.endswith("&") and not t.startswith("const"):
+                warnings.append("{}: bound to a temporary copy, changes are not visible in Python, use Eigen::Ref<T>".format(where))
+            else:
+                warnings.append("{}: copied from the NumPy array on every call, use Eigen::Ref<const T> to share its memory".format(where))
+    return warnings
+
+def _lazy_class_units(members, unit, cpp_namespace, out):
+    """
+    Collect C++ class name => dotted path of the submodule registering it (None for the root module).
+    """
+    for k, v in members.items():
+        if v["type"] == "module":
+            _lazy_class_units(v["members"], ".".join([x for x in [unit, k] if x]), cpp_namespace + [k], out)
+        elif v["type"] == "class":
+            out["::".join(cpp_namespace + [v["name"]])] = unit
+            _lazy_class_units(v["members"], unit, cpp_namespace + [v["name"]], out)
+    return out
+
+def _substitute_type(v, param, cpp_type):
+    """
+    Copy of the func/class/var node v with the template parameter param replaced by cpp_type in its types.
+    """
+    def sub(text):
+        return re.sub(r"(?<![\w:]){}(?!\w)".format(re.escape(param)), cpp_type, text) if isinstance(text, str) else text
+    v = dict(v)
+    if v["type"] == "func":
+        v["args"] = [[sub(x[0]), x[1], sub(x[2])] for x in v["args"]]
+        v["ret_type"] = sub(v["ret_type"])
+    elif v["type"] == "class":
+        v["members"] = {k: _substitute_type(x, param, cpp_type) for k, x in v["members"].items()}
+    if "def" in v:
+        v["def"] = sub(v["def"])
+    return v
+
+def _instantiate_templates(members, path):
+    """
+    Expand templates annotated `:instantiate T1,T2,...` to one member per type named `<name>_<type>`,
+    and a "dispatch" member under the template's name choosing the instantiation by argument dtype.
+    The members are not modified, a new dict is returned.
+    """
+    out = {}
+    for k, v in members.items():
+        if v["type"] in ["module", "class"]:
+            v = dict(v, members=_instantiate_templates(v["members"], path + [k]))
+        template = v.get("kv", {}).get("template")
+        if not template:
+            out[k] = v
+            continue
+        full_name = ".".join(path + [k])
+        types = v["kv"].get("instantiate")
+        if not types or types is True:
+            raise Exception("template must be annotated with `:instantiate T1,T2,...` to be bound, {}".format(full_name))
+        if len(template) != 1 or template[0][0] not in ["typename", "class"]:
+            raise Exception("`:instantiate` only support templates with one type parameter, {}".format(full_name))
+        instantiations = []
+        for cpp_type in [x.strip() for x in types.split(",") if x.strip()]:
+            name = "{}_{}".format(k, re.sub(r"\W+", "_", cpp_type).strip("_"))
+            node = _substitute_type(v, template[0][1], cpp_type)
+            node["name"] = "{}<{}>".format(v["name"], cpp_type)
+            node["kv"] = {x: y for x, y in v["kv"].items() if x not in ["template", "instantiate"]}
+            out[name] = node
+            instantiations.append([cpp_type, name])
+        out[k] = {
+            "type": "dispatch",
+            "name": v["name"],
+            "doc": v["doc"],
+            "static": v.get("static", False),
+            "instantiations": instantiations,
+            "kv": {},
+        }
+    return out
+
+def _lazy_requires(members, unit, class_units):
+    """
+    Lazy submodules whose classes are used by members (not including submodules), they must be loaded first.
+    """
+    types = []
+    def collect(members):
+        for v in members.values():
+            if v["type"] == "class":
+                collect(v["members"])
+            elif v["type"] == "func":
+                types.extend([x[0] for x in v["args"]] + [v["ret_type"]])
+            elif v["type"] == "var":
+                types.append(v["def"])
+    collect(members)
+    requires = []
+    for name, name_unit in class_units.items():
+        if not name_unit or name_unit == unit or (unit and unit.startswith(name_unit + ".")) or name_unit in requires:
+            continue
+        if any(re.search(r"(?<![\w:]){}(?!\w)".format(re.escape(name)), t) for t in types):
+            requires.append(name_unit)
+    return requires
+
+def generate_api_cpp(api_tree, header_path, module_name, out_path=None, fastcall=False, lazy=False, strip_docs=False, instrument=False, trace=False, alloc_stats=False, alloc_heap=False):
     """
     Generate pybind11 binding code for a single header file.
     
@@ -17,38 +342,112 @@ def generate_api_cpp(api_tree, header_path, module_name, out_path=None):
         header_path: Path to the header file
         module_name: The root module name (derived from header filename)
         out_path: Output file path
+        fastcall: Emit functions with only int/float/bool/str arguments and return value
+                  as plain CPython METH_FASTCALL functions instead of pybind11 bindings
+        lazy: Register submodules on first attribute access instead of at import time
+        strip_docs: Emit no docstrings and disable pybind11 function signatures, the docs are written
+                    to the sidecar file `<module_name>_docs.json.gz` next to out_path and loaded on demand
+        instrument: Count calls and record latency histograms of conversion and C++ time for every
+                    bound function, read by `<module_name>.__stats__()`
+        trace: Record the calls of every bound function while `<module_name>.trace_start()` is recording,
+               written as Chrome trace event JSON by `<module_name>.trace_dump(path)`
+        alloc_stats: Count the live C++ objects owned by Python objects of every bound class,
+                     read by `<module_name>.__alloc_stats__()` and `<module_name>.__alloc_snapshot__()`
+        alloc_heap: Also count the C++ heap bytes allocated while the bindings run, implies alloc_stats
     
     Returns:
         Generated C++ code string
     """
+    alloc_stats = alloc_stats or alloc_heap
     content = '''
 // This file is generated by gen_api.py,
 // !! DO NOT edit this file manually
 
-#include <pybind11/pybind11.h>
-#include <pybind11/stl.h>
-#include <pybind11/complex.h>
-#include <pybind11/functional.h>
-#include <pybind11/chrono.h>
+{includes}
 
 #include "{header_name}"
 
 
 namespace py = pybind11;
 
-
+{defs}
 PYBIND11_MODULE({module_name}, m) {{
     {code}
 }}
 '''
     code = []
+    includes = [
+        "pybind11/pybind11.h",
+        "pybind11/stl.h",
+        "pybind11/complex.h",
+        "pybind11/functional.h",
+        "pybind11/chrono.h",
+    ]
+
+    def add_include(name):
+        if name not in includes:
+            includes.append(name)
+
+    # "module.func" names registered to parallel_map
+    parallel_funcs = []
+    # "module.func" names wrapped by LRU cache, index is the LruFunction ID
+    memoize_funcs = []
+    # "module.func" names returning their result in the shared memory arena
+    shm_funcs = []
+    # C++ names of `:freelist` classes, their objects are allocated from a per-type slab allocator
+    freelist_classes = []
+    # C++ definitions placed before PYBIND11_MODULE, e.g. fastcall functions
+    defs = []
+    # dotted path relative to the root module => doc, written to the sidecar docs file with strip_docs
+    docs = {}
+    # no docstrings and signatures in the module, the options must be alive while functions are defined
+    options_code = [
+        'py::options options;',
+        'options.disable_function_signatures();',
+        'options.disable_user_defined_docstrings();',
+    ]
+
+    def doc_literal(path, doc, signature=None):
+        """
+        Content of the C string literal of doc, recorded to docs and empty with strip_docs.
+        """
+        if not strip_docs:
+            return doc.replace("\n", "\\n").replace('"', '\\"')
+        if signature:
+            doc = signature + "\n\n" + doc if doc else signature
+        if doc:
+            docs[path] = docs[path] + "\n\n" + doc if path in docs else doc
+        return ""
+
+    # "module.func" names timed with instrument or recorded with trace
+    instrumented = []
+
+    def call_attrs(path):
+        """
+        Binding attributes timing (instrument), recording (trace) and counting the heap allocations (alloc_heap)
+        of the calls of path, empty without all.
+        """
+        attrs = ""
+        if instrument:
+            add_include("autobind/instrument.hpp")
+            attrs += ', AUTOBIND_INSTRUMENT("{}.{}")'.format(module_name, path)
+        if trace:
+            add_include("autobind/trace.hpp")
+            attrs += ', AUTOBIND_TRACE("{}.{}")'.format(module_name, path)
+        if alloc_heap:
+            attrs += ', AUTOBIND_ALLOC_HEAP("{}")'.format(module_name)
+        if attrs:
+            instrumented.append(path)
+        return attrs
     
     if module_name not in api_tree.get("members", {}):
         # No API found for this module
         return None
     
     root_module = api_tree["members"][module_name]
-    code.append('m.doc() = "{}";'.format(_get_doc_string(root_module)))
+    root_module = dict(root_module, members=_instantiate_templates(root_module["members"], [module_name]))
+    class_units = _lazy_class_units(root_module["members"], None, [module_name], {}) if lazy else {}
+    code.append('m.doc() = "{}";'.format(doc_literal("", _get_doc_string(root_module))))
     
     def gen_members(members, _code, parent_var, parent_name, parent_type, parent_names, cpp_namespace):
         """
@@ -64,36 +463,102 @@ PYBIND11_MODULE({module_name}, m) {{
             cpp_namespace: List of C++ namespace parts (for actual C++ symbols)
         """
         for k, v in members.items():
-            doc = _get_doc_string(v)
-            doc = doc.replace("\n", "\\n").replace('"', '\\"')
+            path = ".".join(parent_names + [k])
+            if v["type"] == "func" and k not in ["__init__", "__iter__"]:
+                method = parent_type == "class" and not v["static"]
+                doc = doc_literal(path, _get_doc_string(v), _py_signature(k, v, method))
+            elif v["type"] == "module":
+                doc = doc_literal(path, _get_doc_string(v))
+            elif v["type"] == "dispatch":
+                doc = _get_doc_string(v)
+                doc += "\n\nInstantiations by dtype: {}\n".format(", ".join("{} ({})".format(x[1], x[0]) for x in v["instantiations"]))
+                doc = doc_literal(path, doc, "{}(*args, dtype=None, **kwargs)".format(k))
+            else:
+                doc = _get_doc_string(v).replace("\n", "\\n").replace('"', '\\"')
             
             if v["type"] == "module":
                 sub_m_name = "m_{}".format(k)
+                if lazy:
+                    # submodule members are registered by the lambda on first access of parent.<k>
+                    unit = ".".join(parent_names + [k])
+                    sub_code = options_code[:] if strip_docs else []
+                    sub_code += ['lazy->require("{}");'.format(x) for x in _lazy_requires(v["members"], unit, class_units)]
+                    gen_members(v["members"], sub_code, sub_m_name, k, v["type"], parent_names + [k], cpp_namespace + [k])
+                    _code.append('lazy->add({}, "{}", "{}", [=](py::module_ &{}, autobind::LazyModules *lazy) {{'.format(parent_var, k, doc, sub_m_name))
+                    _code.extend(["    " + x for x in sub_code])
+                    _code.append('});')
+                    continue
                 _code.append('auto {} = {}.def_submodule("{}", "{}");'.format(sub_m_name, parent_var, k, doc))
                 # 模块名同时也是 C++ 命名空间的一部分
                 gen_members(v["members"], _code, sub_m_name, k, v["type"], parent_names + [k], cpp_namespace + [k])
             
             elif v["type"] == "class":
                 sub_obj_name = "class_{}_{}".format("_".join(parent_names) if parent_names else "root", k)
-                cpp_class_name = "::".join(cpp_namespace + [k])
-                _code.append('auto {} = py::class_<{}>({}, "{}");'.format(sub_obj_name, cpp_class_name, parent_var, k))
-                gen_members(v["members"], _code, sub_obj_name, k, v["type"], parent_names + [k], cpp_namespace + [k])
+                cpp_class_name = "::".join(cpp_namespace + [v["name"]])
+                # :freelist, allocate objects from a slab allocator, also for values returned to Python
+                freelist = v.get("kv", {}).get("freelist")
+                if freelist:
+                    add_include("autobind/freelist.hpp")
+                    defs.append("AUTOBIND_FREELIST_CASTER({})".format(cpp_class_name))
+                    freelist_classes.append(cpp_class_name)
+                holder = ", autobind::FreelistHolder<{}>".format(cpp_class_name) if freelist else ""
+                _code.append('auto {} = py::class_<{}{}>({}, "{}");'.format(sub_obj_name, cpp_class_name, holder, parent_var, k))
+                if alloc_stats:
+                    _code.append('autobind::alloc::track({}, "{}.{}");'.format(sub_obj_name, module_name, path))
+                members = v["members"]
+                if v.get("kv", {}).get("sequence"):
+                    # def_sequence binds the bounds checked __getitem__/__setitem__, pybind11 tries overloads in
+                    # registration order, so operator[] bound to them would take every non-negative index unchecked
+                    members = {name: x for name, x in members.items()
+                               if not (name in ["__getitem__", "__setitem__"] and x["type"] == "func" and x["name"].replace(" ", "") == "operator[]")}
+                gen_members(members, _code, sub_obj_name, k, v["type"], parent_names + [k], cpp_namespace + [v["name"]])
+                # __eq__ makes the class unhashable, use std::hash<T> if exists
+                eq = v["members"].get("__eq__")
+                if eq and eq["type"] == "func" and eq["name"].replace(" ", "") == "operator==" and "__hash__" not in v["members"]:
+                    add_include("autobind/operators.hpp")
+                    _code.append('autobind::def_hash({});'.format(sub_obj_name))
+                # :sequence, __len__, __getitem__/__setitem__ with negative index and slice views
+                if v.get("kv", {}).get("sequence"):
+                    add_include("autobind/sequence.hpp")
+                    _code.append('autobind::def_sequence({});'.format(sub_obj_name))
+                if freelist:
+                    _code.append('autobind::def_freelist_stats({});'.format(sub_obj_name))
+                # :pickle, binary state of the bound fields, raw bytes for trivially copyable classes
+                if v.get("kv", {}).get("pickle"):
+                    add_include("autobind/pickle.hpp")
+                    fields = ["&{}::{}".format(cpp_class_name, x["name"]) for x in v["members"].values() if x["type"] == "var" and not x["static"] and not x["readonly"]]
+                    _code.append('autobind::def_pickle({});'.format(", ".join([sub_obj_name] + fields)))
             
             elif v["type"] == "func":
+                # Eigen types, converted from/to NumPy arrays by pybind11/eigen.h
+                if "Eigen::" in " ".join([v["ret_type"]] + [x[0] for x in v["args"]]):
+                    add_include("pybind11/eigen.h")
+                    for warning in _eigen_warnings("{}.{}".format(module_name, path), v):
+                        print("-- Warning: {}".format(warning))
                 kwargs_str = ", ".join(['py::arg("{}") {}'.format(x[1], '= {}'.format(x[2]) if x[2] is not None else "") for x in v["args"]])
                 if kwargs_str:
                     kwargs_str = ", " + kwargs_str
+                op_code = _gen_operator(k, v, parent_var, parent_type, "::".join(cpp_namespace), doc)
                 
-                if k == "__init__":
-                    _code.append('{}.def(py::init<{}>(){});'.format(parent_var, ", ".join([x[0] for x in v["args"]]), kwargs_str))
+                if k == "__init__" and "::".join(cpp_namespace) in freelist_classes:
+                    _code.append('{}.def(autobind::freelist_init<{}>(){}{});'.format(parent_var, ", ".join(["::".join(cpp_namespace)] + [x[0] for x in v["args"]]), kwargs_str, call_attrs(path)))
+                elif k == "__init__":
+                    _code.append('{}.def(py::init<{}>(){}{});'.format(parent_var, ", ".join([x[0] for x in v["args"]]), kwargs_str, call_attrs(path)))
                 elif k == "__iter__":
                     cpp_class_name = "::".join(cpp_namespace)
                     _code.append('{}.def("__iter__", []({} &c){{return py::make_iterator(c.begin(), c.end());}}, py::keep_alive<0, 1>());'.format(parent_var, cpp_class_name))
                 elif k == "__del__":
                     raise Exception("not support __del__ yet")
+                elif op_code:
+                    add_include("autobind/operators.hpp")
+                    # attributes go before the closing `);`
+                    _code.append(op_code[:-2] + call_attrs(path) + ");")
                 else:
                     func_name = v["name"]
                     ret_policy = "reference" if v["ret_type"].endswith("&") else "take_ownership"
+                    # arrays viewing Eigen members keep their object alive
+                    if ret_policy == "reference" and "Eigen::" in v["ret_type"] and parent_type == "class" and not v["static"]:
+                        ret_policy = "reference_internal"
                     
                     # 构建完整的 C++ 函数引用
                     if parent_type == "class" and not v["static"]:
@@ -108,20 +573,146 @@ PYBIND11_MODULE({module_name}, m) {{
                             cpp_func_ref = "&{}".format(func_name)
                         cast_class = "*"
                     
-                    _code.append('{}.def{}("{}", static_cast<{} ({})({})>({}), py::return_value_policy::{}, "{}"{});'.format(
-                        parent_var, 
-                        "_static" if v["static"] else "", 
-                        k,
-                        v["ret_type"],
-                        cast_class,
-                        ", ".join([x[0] for x in v["args"]]),
-                        cpp_func_ref,
-                        ret_policy,
-                        doc, 
-                        kwargs_str
-                    ))
+                    cpp_func_cast = "static_cast<{} ({})({}){}>({})".format(v["ret_type"], cast_class, ", ".join([x[0] for x in v["args"]]), " const" if cast_class != "*" and v.get("const") else "", cpp_func_ref)
+                    memoize = v.get("kv", {}).get("memoize")
+                    shm = v.get("kv", {}).get("shm")
+                    fastcall_name = "fastcall_{}".format("_".join(parent_names + [k]))
+                    fastcall_code = None
+                    if fastcall and cast_class == "*" and not memoize and not shm:
+                        fastcall_code = _gen_fastcall(k, v, cpp_func_ref[1:], fastcall_name, None if strip_docs else doc,
+                                                      "{}.{}".format(module_name, path) if instrument else None,
+                                                      "{}.{}".format(module_name, path) if trace else None,
+                                                      module_name if alloc_heap else None)
+                        if fastcall_code:
+                            call_attrs(path)
+                    if shm:
+                        # :shm, copy the result to the shared memory arena and return a ShmBuffer handle
+                        full_name = ".".join(cpp_namespace + [func_name])
+                        ret_type = _operand_type(v["ret_type"])
+                        if not ret_type.startswith("std::vector<") and ret_type != "std::string":
+                            raise Exception("`:shm` function must return std::vector<T> or std::string, {}".format(full_name))
+                        if memoize:
+                            raise Exception("`:shm` can not be used with `:memoize`, {}".format(full_name))
+                        add_include("autobind/shm.hpp")
+                        shm_funcs.append(".".join(parent_names + [k]))
+                        _code.append('{}.def{}("{}", autobind::shm::wrap({}), "{}"{}{});'.format(
+                            parent_var,
+                            "_static" if v["static"] else "",
+                            k,
+                            cpp_func_cast,
+                            doc,
+                            kwargs_str,
+                            call_attrs(path)
+                        ))
+                    elif memoize:
+                        # :memoize max=N, replace the function with a callable object holding a LRU cache
+                        full_name = ".".join(cpp_namespace + [func_name])
+                        if cast_class != "*":
+                            raise Exception("`:memoize` only support functions and static methods, {}".format(full_name))
+                        if v["ret_type"] == "void":
+                            raise Exception("`:memoize` function must return a value, {}".format(full_name))
+                        # the cache keeps the result, a pointer or reference would be owned by (or alias) the first Python result
+                        if v["ret_type"].strip().endswith(("*", "&")):
+                            raise Exception("`:memoize` function must return by value, not pointer or reference, {}".format(full_name))
+                        if v.get("kv", {}).get("parallel"):
+                            raise Exception("`:memoize` can not be used with `:parallel`, {}".format(full_name))
+                        maxsize = 128
+                        if memoize is not True:
+                            opt = memoize.strip().split("=", 1)
+                            if len(opt) != 2 or opt[0].strip() != "max" or not opt[1].strip().isdigit() or int(opt[1]) <= 0:
+                                raise Exception("`:memoize` value should be `max=N` with N > 0, got `{}`, {}".format(memoize, full_name))
+                            maxsize = int(opt[1])
+                        add_include("autobind/lru_cache.hpp")
+                        lru_type = "autobind::LruFunction<{}, {}>".format(len(memoize_funcs), ", ".join([v["ret_type"]] + [x[0] for x in v["args"]]))
+                        memoize_funcs.append(".".join(parent_names + [k]))
+                        _code.append('{}::bind({}, "_lru_cache_wrapper_{}", "{}").def("__call__", &{}::operator(), "{}"{}{});'.format(
+                            lru_type,
+                            parent_var,
+                            k,
+                            doc,
+                            lru_type,
+                            doc,
+                            kwargs_str,
+                            call_attrs(path)
+                        ))
+                        _code.append('{}.attr("{}") = py::cast(new {}({}, {}, py::return_value_policy::{}), py::return_value_policy::take_ownership);'.format(
+                            parent_var,
+                            k,
+                            lru_type,
+                            cpp_func_cast,
+                            maxsize,
+                            ret_policy
+                        ))
+                    elif fastcall_code:
+                        add_include("autobind/fastcall.hpp")
+                        defs.append(fastcall_code)
+                        _code.append('autobind::fastcall::add_function({}, &{}_def);'.format(parent_var, fastcall_name))
+                    else:
+                        _code.append('{}.def{}("{}", {}, py::return_value_policy::{}, "{}"{}{});'.format(
+                            parent_var, 
+                            "_static" if v["static"] else "", 
+                            k,
+                            cpp_func_cast,
+                            ret_policy,
+                            doc, 
+                            kwargs_str,
+                            call_attrs(path)
+                        ))
+
+                    # C++ default values of the trailing arguments, for argument tuples of :batch and :parallel omitting them
+                    defaults = [x[2] for x in v["args"] if x[2] is not None]
+                    defaults_code = ", py::make_tuple({})".format(", ".join(defaults)) if defaults else ""
+
+                    # :batch, add <name>_batch(iterable_of_arg_tuples) calling the C++ loop once without GIL
+                    if v.get("kv", {}).get("batch"):
+                        if cast_class != "*":
+                            raise Exception("`:batch` only support functions and static methods, {}".format(".".join(cpp_namespace + [func_name])))
+                        # arguments are converted to copies before the loop, changes through references would be lost
+                        if any(_is_mutable_ref(x[0]) for x in v["args"]):
+                            raise Exception("`:batch` function can not take non-const reference arguments, {}".format(".".join(cpp_namespace + [func_name])))
+                        add_include("autobind/batch.hpp")
+                        _code.append('{}.def{}("{}_batch", [](py::iterable inputs) {{ return autobind::batch_call({}, inputs, py::return_value_policy::{}{}); }}, "{}", py::arg("inputs"){});'.format(
+                            parent_var,
+                            "_static" if v["static"] else "",
+                            k,
+                            cpp_func_cast,
+                            ret_policy,
+                            defaults_code,
+                            doc_literal(path + "_batch", "Batched {}, call it once per argument tuple of inputs, return list of results".format(k), "{}_batch(inputs: Iterable) -> list".format(k)),
+                            call_attrs(path + "_batch")
+                        ))
+
+                    # :parallel, register to the module's parallel_map(func, inputs, workers, chunk)
+                    if v.get("kv", {}).get("parallel"):
+                        if cast_class != "*":
+                            raise Exception("`:parallel` only support functions and static methods, {}".format(".".join(cpp_namespace + [func_name])))
+                        # arguments are converted to copies before the threads run, changes through references would be lost
+                        if any(_is_mutable_ref(x[0]) for x in v["args"]):
+                            raise Exception("`:parallel` function can not take non-const reference arguments, {}".format(".".join(cpp_namespace + [func_name])))
+                        add_include("autobind/parallel.hpp")
+                        parallel_funcs.append(".".join(parent_names + [k]))
+                        _code.append('parallel_map->add({}.attr("{}"), {}, py::return_value_policy::{}{});'.format(
+                            parent_var,
+                            k,
+                            cpp_func_cast,
+                            ret_policy,
+                            defaults_code
+                        ))
             
+            elif v["type"] == "dispatch":
+                # :instantiate, front function calling the instantiation matching the dtype of the arguments
+                add_include("autobind/dispatch.hpp")
+                _code.append('autobind::def_dispatch({}, "{}", {{{}}}, "{}"{});'.format(
+                    parent_var,
+                    k,
+                    ", ".join(['{{autobind::dispatch::dtype_of<{}>(), "{}"}}'.format(x[0], x[1]) for x in v["instantiations"]]),
+                    doc,
+                    ", true" if v["static"] else ""
+                ))
+
             elif v["type"] == "var":
+                if "Eigen::" in v["def"]:
+                    add_include("pybind11/eigen.h")
                 if parent_type == "class":
                     cpp_var_name = "::".join(cpp_namespace + [k])
                     if v["readonly"]:
@@ -143,19 +734,343 @@ PYBIND11_MODULE({module_name}, m) {{
     # 从根模块开始，cpp_namespace 初始为根模块名（即 C++ 命名空间）
     gen_members(root_module["members"], code, parent_var="m", parent_name=module_name, parent_type="module", parent_names=[], cpp_namespace=[module_name])
 
+    if lazy and any(x["type"] == "module" for x in root_module["members"].values()):
+        add_include("autobind/lazy.hpp")
+        code.insert(1, 'auto lazy = autobind::LazyModules::create(m);')
+        code.extend(['lazy->require("{}");'.format(x) for x in _lazy_requires(root_module["members"], None, class_units)])
+
+    if shm_funcs:
+        code.insert(1, 'autobind::shm::install(m);')
+
+    if instrumented and instrument:
+        code.insert(1, 'autobind::instrument::install(m, "{}");'.format(module_name))
+
+    if instrumented and trace:
+        code.insert(1, 'autobind::trace::install(m);')
+
+    if alloc_stats:
+        add_include("autobind/alloc.hpp")
+        if alloc_heap:
+            defs.append("AUTOBIND_ALLOC_OPERATORS")
+        code.insert(1, 'autobind::alloc::install(m, "{}"{});'.format(module_name, ", true" if alloc_heap else ""))
+
+    if parallel_funcs:
+        code.insert(1, 'auto parallel_map = std::make_shared<autobind::ParallelMap>();')
+        code.append('m.def("parallel_map", [parallel_map](py::handle func, py::iterable inputs, std::optional<size_t> workers, size_t chunk) {{ return (*parallel_map)(func, inputs, workers, chunk); }}, "{}", py::arg("func"), py::arg("inputs"), py::arg("workers") = py::none(), py::arg("chunk") = 0{});'.format(doc_literal(
+            "parallel_map",
+            "Call func once per argument tuple of inputs on the module's C++ thread pool without GIL, return list of results in input order.\n\n"
+            "Args:\n  - func: function marked `:parallel`, one of: {}\n  - inputs: iterable of argument tuples\n"
+            "  - workers: max thread count, None means CPU count\n  - chunk: inputs per task, 0 means auto\n".format(", ".join(parallel_funcs)),
+            "parallel_map(func: Callable, inputs: Iterable, workers: Optional[int] = None, chunk: int = 0) -> list"
+        ), call_attrs("parallel_map")))
+
+    docs_path = os.path.join(os.path.dirname(out_path), "{}_docs.json.gz".format(module_name)) if out_path else None
+    if strip_docs:
+        add_include("autobind/docs.hpp")
+        code[0:1] = options_code
+        code.append('autobind::docs::install(m, "{}_docs.json.gz");'.format(module_name))
+
     code_str = "\n    ".join(code)
     header_name = os.path.basename(header_path)
-    content = content.format(header_name=header_name, module_name=module_name, code=code_str)
+    includes_str = "\n".join(["#include <{}>".format(x) for x in includes])
+    defs_str = "".join([x + "\n\n" for x in defs])
+    content = content.format(includes=includes_str, defs=defs_str, header_name=header_name, module_name=module_name, code=code_str)
     
     if out_path:
         if os.path.dirname(out_path):
             os.makedirs(os.path.dirname(out_path), exist_ok=True)
         with open(out_path, "w", encoding="utf-8") as f:
             f.write(content)
+        if strip_docs:
+            # mtime=0 so the same docs give the same file
+            with open(docs_path, "wb") as f:
+                f.write(gzip.compress(json.dumps(docs, ensure_ascii=False, sort_keys=True).encode("utf-8"), mtime=0))
+        elif os.path.exists(docs_path):
+            os.remove(docs_path)
     
     return content
 
 
+# representative argument values of the benchmarks: Python type => (C++ value, Python value)
+_BENCH_VALUES = {"int": ("1", "1"), "float": ("1.5", "1.5"), "bool": ("true", "True"), "str": ('"hello"', '"hello"')}
+
+def _bench_value(cpp_type, classes):
+    """
+    Representative argument of cpp_type for the benchmarks as (type label, C++ value, Python value),
+    None if not supported (pointers, rvalue references, classes not constructible from Python, ...).
+    """
+    if "&&" in cpp_type:
+        return None
+    if _fastcall_type(cpp_type) == "str" or _operand_type(cpp_type) == "std::string":
+        return ("str",) + _BENCH_VALUES["str"]
+    t = _operand_type(cpp_type)
+    if "*" in t:
+        return None
+    kind = _fastcall_type(t)
+    if kind in _BENCH_VALUES:
+        return (kind,) + _BENCH_VALUES[kind]
+    m = re.match(r"^std::vector<\s*(.+?)\s*>$", t)
+    if m:
+        item = _bench_value(m.group(1), {})
+        if item and item[0] in _BENCH_VALUES:
+            return ("list[{}]".format(item[0]), "std::vector<{}>(16, {})".format(m.group(1), item[1]), "[{}] * 16".format(item[2]))
+        return None
+    if t in classes:
+        py_path, args = classes[t]
+        return (py_path, "{}({})".format(t, ", ".join(x[1] for x in args)), "{}({})".format(py_path, ", ".join(x[2] for x in args)))
+    return None
+
+def _bench_entries(members, module_name):
+    """
+    Benchmarks of the functions and methods of a module callable with representative arguments:
+    [(full name, [(C++ type, type label, C++ value, Python value)], C++ call, Python function, instance)],
+    instance is the (C++ type, C++ value, Python value) of the object methods are called on, None for functions.
+    """
+    # C++ class name => (Python path, constructor argument values), classes constructible with representative arguments
+    classes = {}
+    def collect_classes(members, names, cpp_namespace):
+        for k, v in members.items():
+            if v["type"] == "module":
+                collect_classes(v["members"], names + [k], cpp_namespace + [k])
+            elif v["type"] == "class":
+                init = v["members"].get("__init__")
+                if init and init["type"] == "func":
+                    args = [_bench_value(x[0], {}) for x in init["args"]]
+                    if None not in args:
+                        classes["::".join(cpp_namespace + [v["name"]])] = (".".join(names + [k]), args)
+                collect_classes(v["members"], names + [k], cpp_namespace + [v["name"]])
+    collect_classes(members, [module_name], [module_name])
+
+    entries = []
+    def collect(members, names, cpp_namespace, cls):
+        for k, v in members.items():
+            if v["type"] == "module":
+                collect(v["members"], names + [k], cpp_namespace + [k], None)
+            elif v["type"] == "class":
+                collect(v["members"], names + [k], cpp_namespace + [v["name"]], "::".join(cpp_namespace + [v["name"]]))
+            elif v["type"] == "func":
+                kv = v.get("kv", {})
+                # dunders are operators and protocols, cached and shared memory results don't measure the binding
+                if k.startswith("__") or kv.get("memoize") or kv.get("shm"):
+                    continue
+                ret = v["ret_type"].replace(" ", "")
+                if "*" in ret and ret != "constchar*":
+                    continue
+                values = [_bench_value(x[0], classes) for x in v["args"]]
+                if None in values:
+                    continue
+                args = [(x[0],) + value for x, value in zip(v["args"], values)]
+                call_args = ", ".join("a{}".format(i) for i in range(len(args)))
+                full_name = ".".join(names + [k])
+                if cls and not v["static"]:
+                    if cls not in classes:
+                        continue
+                    instance = (cls,) + _bench_value(cls, classes)[1:]
+                    entries.append((full_name, args, "obj.{}({})".format(v["name"], call_args), "obj.{}".format(k), instance))
+                else:
+                    entries.append((full_name, args, "{}({})".format("::".join(cpp_namespace + [v["name"]]), call_args), full_name, None))
+    collect(members, [module_name], [module_name], None)
+    return entries
+
+# body of bench_<module>.py, after the generated MODULE, INCLUDE_DIRS, HARNESS and BENCHES
+_BENCH_MAIN = r'''
+
+
+def time_python(stmt, setup, min_time, repeat):
+    timer = timeit.Timer(stmt, setup)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / repeat / elapsed)) if elapsed > 0 else number
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def build_native(out_dir, cxx, cxxflags):
+    """
+    Compile the native harness, linking libmain.so next to the imported module if exists.
+    """
+    module = importlib.import_module(MODULE)
+    module_dir = os.path.dirname(os.path.abspath(module.__file__))
+    exe = os.path.join(out_dir, "bench_" + MODULE)
+    cmd = [cxx, "-O2", "-std=c++17"] + ["-I" + x for x in INCLUDE_DIRS] + [HARNESS, "-o", exe]
+    if os.path.exists(os.path.join(module_dir, "libmain.so")):
+        cmd += ["-L" + module_dir, "-lmain", "-Wl,-rpath," + module_dir]
+    subprocess.run(cmd + cxxflags, check=True)
+    return exe
+
+
+def time_native(exe, names, min_time, repeat):
+    out = subprocess.run([exe, "--min-time", str(min_time), "--repeat", str(repeat)] + names, check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def conversion_costs(results):
+    """
+    Estimated conversion cost per argument type: overhead of each call above the smallest overhead of the
+    calls without arguments of the same kind (free functions, or methods which also convert self), which is
+    the dispatch and result conversion, shared equally by its arguments.
+    Returns ({type: ns per argument}, whether dispatch is included as a kind has no call without arguments,
+    types whose estimate was below zero and is reported as 0).
+    """
+    base = {}
+    for x in results:
+        if not x["args"] and x["overhead_ns"] is not None:
+            base[x["method"]] = min(base.get(x["method"], x["overhead_ns"]), x["overhead_ns"])
+    samples = {}
+    with_dispatch = False
+    for x in results:
+        if x["args"] and x["overhead_ns"] is not None:
+            with_dispatch = with_dispatch or x["method"] not in base
+            for t in x["args"]:
+                samples.setdefault(t, []).append((x["overhead_ns"] - base.get(x["method"], 0)) / len(x["args"]))
+    costs = {t: statistics.median(v) for t, v in sorted(samples.items())}
+    clamped = [t for t, v in costs.items() if v < 0]
+    return {t: max(v, 0.0) for t, v in costs.items()}, with_dispatch, clamped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Call overhead of the bindings of module {}, Python vs native C++".format(MODULE))
+    parser.add_argument("names", nargs="*", help="full names of the functions to run (default all)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds timing each function")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs, best one is reported")
+    parser.add_argument("--native", type=str, default="", help="prebuilt native harness (e.g. cross compiled for the device), default compile " + os.path.basename(HARNESS))
+    parser.add_argument("--no-native", action="store_true", help="only time the Python calls")
+    parser.add_argument("--cxx", type=str, default=os.environ.get("CXX", "c++"), help="C++ compiler of the native harness")
+    parser.add_argument("--cxxflags", type=str, default="", help="extra flags compiling the native harness")
+    parser.add_argument("--json", type=str, default="", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    benches = [x for x in BENCHES if not args.names or x[0] in args.names]
+    if not benches:
+        print("-- No function of {} callable with representative arguments".format(MODULE))
+        return
+    native = {}
+    if not args.no_native:
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                exe = args.native or build_native(tmp, args.cxx, args.cxxflags.split())
+                native = time_native(exe, [x[0] for x in benches], args.min_time, args.repeat)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print("-- Warning: native harness failed, only the Python calls are timed: {}".format(e))
+
+    results = []
+    for name, setup, stmt, arg_types, method in benches:
+        py_ns = time_python(stmt, setup, args.min_time, args.repeat)
+        cpp_ns = native.get(name)
+        results.append({
+            "name": name,
+            "args": arg_types,
+            "method": method,
+            "python_ns": py_ns,
+            "native_ns": cpp_ns,
+            "overhead_ns": py_ns - cpp_ns if cpp_ns is not None else None,
+            "ratio": py_ns / cpp_ns if cpp_ns else None,
+        })
+    costs, with_dispatch, clamped = conversion_costs(results)
+
+    def fmt(v, spec=".1f"):
+        return "-" if v is None else format(v, spec)
+    print("\n| function | args | python ns | native ns | overhead ns | ratio |")
+    print("| --- | --- | --- | --- | --- | --- |")
+    for x in results:
+        print("| {} | {} | {} | {} | {} | {} |".format(x["name"], ", ".join(x["args"]), fmt(x["python_ns"]), fmt(x["native_ns"]), fmt(x["overhead_ns"]), fmt(x["ratio"], ".2f")))
+    if costs:
+        print("\n| argument type | conversion ns/arg (estimated{}) |".format(", dispatch included" if with_dispatch else ""))
+        print("| --- | --- |")
+        for t, ns in costs.items():
+            print("| {} | {:.1f}{} |".format(t, ns, " (below the calls without arguments, noise)" if t in clamped else ""))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"module": MODULE, "results": results, "conversion_ns": costs, "conversion_clamped": clamped}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+def generate_bench(api_tree, module_name, header_path, bench_out_dir, include_dirs):
+    """
+    Generate the call overhead microbenchmark of a module: `bench_<module_name>.py` times every function and method
+    callable with representative arguments through the bindings, `bench_<module_name>.cpp` is the native harness
+    calling the same functions with the same arguments from C++, compiled and run by the script.
+
+    Args:
+        api_tree: The parsed API tree
+        module_name: The root module name
+        header_path: Path to the header file
+        bench_out_dir: Output directory of the two files
+        include_dirs: Include directories compiling the harness, the header's and autobind/bench.hpp's
+    """
+    if module_name not in api_tree.get("members", {}):
+        return
+    members = _instantiate_templates(api_tree["members"][module_name]["members"], [module_name])
+
+    cpp = [
+        "// Generated by cpp_bind_python.py --bench, do not edit",
+        "",
+        "#include <autobind/bench.hpp>",
+        "",
+        '#include "{}"'.format(os.path.basename(header_path)),
+        "",
+        "int main(int argc, char *argv[])",
+        "{",
+        "    autobind::bench::Runner runner(argc, argv);",
+    ]
+    # (full name, timeit setup, timeit statement, argument types, is method)
+    benches = []
+    for name, args, cpp_call, py_func, instance in _bench_entries(members, module_name):
+        setup = ["import {}".format(module_name)]
+        names = []
+        cpp.append("    {")
+        if instance:
+            cpp.append("        {} obj = {};".format(instance[0], instance[1]))
+            setup.append("obj = {}".format(instance[2]))
+            names.append("obj")
+        for i, x in enumerate(args):
+            cpp.append("        std::decay_t<{}> a{} = {};".format(x[0], i, x[2]))
+            setup.append("a{} = {}".format(i, x[3]))
+            names.append("a{}".format(i))
+        setup.append("f = {}".format(py_func))
+        cpp.append('        runner.run("{}", [&]() -> decltype(auto) {{ return {}; }}{});'.format(name, cpp_call, "".join(", " + x for x in names)))
+        cpp.append("    }")
+        benches.append((name, "\n".join(setup), "f({})".format(", ".join("a{}".format(i) for i in range(len(args)))), [x[1] for x in args], instance is not None))
+    cpp += ["    return runner.finish();", "}", ""]
+
+    py = [
+        "'''",
+        "    @brief Call overhead of the bindings of module {}, generated by cpp_bind_python.py --bench, do not edit".format(module_name),
+        "",
+        "    Times every function and method callable with representative arguments through the bindings",
+        "    and natively (bench_{}.cpp, compiled with --cxx or given by --native), reports ns per call,".format(module_name),
+        "    binding overhead, the ratio to native and the estimated conversion cost per argument type.",
+        "",
+        "    Usage:",
+        "        python3 bench_{}.py [names ...] [--min-time 0.2] [--repeat 5] [--native EXE | --no-native] [--json FILE]".format(module_name),
+        "'''",
+        "",
+        "import os",
+        "import json",
+        "import timeit",
+        "import argparse",
+        "import importlib",
+        "import statistics",
+        "import subprocess",
+        "import tempfile",
+        "",
+        "MODULE = {!r}".format(module_name),
+        "INCLUDE_DIRS = {!r}".format([os.path.abspath(x) for x in include_dirs]),
+        'HARNESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_{}.cpp")'.format(module_name),
+        "# (full name, timeit setup, timeit statement, argument types, is method)",
+        "BENCHES = [",
+    ]
+    py += ["    {!r},".format(x) for x in benches]
+    py.append("]")
+
+    os.makedirs(bench_out_dir, exist_ok=True)
+    with open(os.path.join(bench_out_dir, "bench_{}.cpp".format(module_name)), "w", encoding="utf-8") as f:
+        f.write("\n".join(cpp))
+    with open(os.path.join(bench_out_dir, "bench_{}.py".format(module_name)), "w", encoding="utf-8") as f:
+        f.write("\n".join(py) + _BENCH_MAIN)
+
+
 def generate_docs(api_tree, module_name, doc_out_dir, module_to_md=None):
     """
     Generate documentation for a module.
@@ -404,6 +1319,14 @@ if __name__ == "__main__":
     parser.add_argument('--sdk_path', type=str, default="./", help="SDK path")
     parser.add_argument('--sdk_tag', type=str, default="module", help="SDK tag to search for in comments (default: module)")
     parser.add_argument('--doc', type=str, default="", help="Output directory for documentation (optional, no doc generated if not specified)")
+    parser.add_argument('--fastcall', action='store_true', help="Bind functions with only int/float/bool/str arguments and return value as plain CPython METH_FASTCALL functions")
+    parser.add_argument('--lazy', action='store_true', help="Register submodules on first attribute access (PEP 562 __getattr__) instead of at import time")
+    parser.add_argument('--strip-docs', action='store_true', help="Emit no docstrings and function signatures, write docs to <module>_docs.json.gz loaded on demand by __doc__/help()")
+    parser.add_argument('--instrument', action='store_true', help="Count calls and record conversion/C++ latency histograms of every bound function, read by <module>.__stats__()")
+    parser.add_argument('--trace', action='store_true', help="Record calls of bound functions and GIL waits between <module>.trace_start() and trace_dump(path) as Chrome trace JSON")
+    parser.add_argument('--alloc-stats', action='store_true', help="Count live C++ objects of every bound class, read by <module>.__alloc_stats__() and __alloc_snapshot__()")
+    parser.add_argument('--alloc-heap', action='store_true', help="Also count C++ heap bytes allocated by the bindings of each module (implies --alloc-stats)")
+    parser.add_argument('--bench', type=str, default="", help="Output directory for the call overhead microbenchmarks bench_<module>.py/.cpp (optional, none generated if not specified)")
     args = parser.parse_args()
 
     t = time.time()
@@ -478,7 +1401,7 @@ if __name__ == "__main__":
         
         # Generate binding file
         output_file = os.path.join(args.output, f"bind_{module_name}.cpp")
-        content = generate_api_cpp(api_tree, header, module_name, output_file)
+        content = generate_api_cpp(api_tree, header, module_name, output_file, fastcall=args.fastcall, lazy=args.lazy, strip_docs=args.strip_docs, instrument=args.instrument, trace=args.trace, alloc_stats=args.alloc_stats, alloc_heap=args.alloc_heap)
         
         if content:
             generated_modules.append({
@@ -493,6 +1416,11 @@ if __name__ == "__main__":
         if args.doc and content:
             generate_docs(api_tree, module_name, args.doc, module_to_md)
 
+        # Generate benchmarks if --bench is specified, autobind/bench.hpp is in the SDK's pybind11 component
+        if args.bench and content:
+            sdk_root = os.environ.get("MY_SDK_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+            generate_bench(api_tree, module_name, header, args.bench, [os.path.dirname(header), os.path.join(sdk_root, "components", "pybind11", "include")])
+
     # Generate summary
     print(f"\n-- Summary: Generated {len(generated_modules)} module(s) in {time.time() - t:.2f}s")
     for mod in generated_modules:
@@ -500,6 +1428,8 @@ if __name__ == "__main__":
     
     if args.doc:
         print(f"\n-- Documentation generated in: {args.doc}")
+    if args.bench:
+        print(f"-- Benchmarks generated in: {args.bench}")
     
     print(f"\n-- To use in Python:")
     for mod in generated_modules:
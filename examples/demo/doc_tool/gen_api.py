@@ -81,6 +81,37 @@ def find_func_name_start(first_line):
         last = line[i]
     return func_var_start
 
+def get_template_params(code):
+    '''
+        find template parameter list at the start of code
+        @param code e.g. 'template <typename T, int N = 3>\nT scale(T x)'
+        @return [['typename', 'T'], ['int', 'N']], index of code after the parameter list,
+                [] and 0 if code is not a template
+    '''
+    m = re.match(r'\s*template\s*<', code)
+    if not m:
+        return [], 0
+    depth = 1
+    idx = m.end()
+    start = idx
+    params = []
+    while idx < len(code) and depth > 0:
+        c = code[idx]
+        if c in "<([{":
+            depth += 1
+        elif c in ">)]}":
+            depth -= 1
+        if (c == "," and depth == 1) or depth == 0:
+            param = code[start:idx].split("=", 1)[0].strip()
+            if param:
+                kind, name = param.rsplit(None, 1) if " " in param else (param, "")
+                params.append([kind.strip(), name.strip()])
+            start = idx + 1
+        idx += 1
+    if depth != 0:
+        raise Exception("get_template_params error: template parameter list not closed: {}".format(code[:m.end()]))
+    return params, idx
+
 def get_code_def(code):
     '''
         find type and definition end of code
@@ -153,10 +184,11 @@ def get_code_def(code):
         if "operator" in first_line or "(" in first_line[idx:].strip().split(" ", 1)[0]:
             def_type = "func"
             idx2 = code.find(";")
-            matche1 = re.search(r'\)\s*\{', code)
+            # bool operator==(const Vec &other) const {
+            matche1 = re.search(r'\)\s*(?:(?:const|noexcept|override|final)\b\s*)*\{', code)
             matche2 = re.search(r'\)\s*\:', code)
             if matche1:
-                idx3 = matche1.start() + 1
+                idx3 = matche1.end() - 1
             else:
                 idx3 = -1
             if matche2:
@@ -343,9 +375,13 @@ def get_func_def_info(code):
 
     args = []
     # ret_code, params_code = find_parentheses_pair(code)
+    # remove qualifiers after parameters, e.g. `) const`, `) const override`
+    code = re.sub(r'\)\s*(?:(?:const|noexcept|override|final)\b\s*)+$', ')', code.strip())
     first_line = code.split("\n", 1)[0]
     idx = find_func_name_start(first_line)
     idx_param = code[idx:].find("(") + idx
+    if code[idx:].lstrip("*& ").startswith("operator()"): # int operator()(int a)
+        idx_param = code[idx:].find("(", code[idx:].find("operator()") + len("operator()")) + idx
     return_type = code[:idx].strip()
     func_name = code[idx:idx_param].strip()
     if func_name[0] in ["*", "&"]:
@@ -503,6 +539,11 @@ def parse_api(code, apis, sdks = ["module"], header_name = None, module_name = "
         idx = def_code.find(api)
         idx = def_code.find("*/", idx) + 2
         idx = def_code.find("\n", idx) + 1
+        # template <typename T>, bound per type listed by :instantiate
+        template, offset = get_template_params(def_code[idx:])
+        if template:
+            item["kv"]["template"] = template
+            idx += offset
         item["type"], definition, (idx, idx2) = get_code_def(def_code[idx:])
         # parse args values flags etc.
         if item["type"] == "class":
@@ -531,6 +572,8 @@ def parse_api(code, apis, sdks = ["module"], header_name = None, module_name = "
             raise Exception("item type no valid: {}, {}".format(item["type"], definition))
         if definition.startswith("static"):
             item["kv"]["static"] = True
+        if item["type"] == "func" and re.search(r'\)\s*(?:(?:noexcept|override|final)\b\s*)*const\b(?:\s*(?:noexcept|override|final)\b)*\s*$', definition):
+            item["kv"]["const"] = True
         # item["def_idx"] = [idx, idx2]
         item["def"] = definition
 
@@ -752,6 +795,7 @@ def parse_api(code, apis, sdks = ["module"], header_name = None, module_name = "
                         "name": item["name"],
                         "doc": item["doc"],
                         "members": {},
+                        "kv": item["kv"],
                         "def": item["def"],
                         "header_path": header_path
                     }
@@ -764,6 +808,8 @@ def parse_api(code, apis, sdks = ["module"], header_name = None, module_name = "
                         "args": item["args"], # [["const char *", "i", None], ["int", "j", "10"]]
                         "ret_type": item["ret_type"],
                         "static": item["kv"].get("static", False),
+                        "const": item["kv"].get("const", False),
+                        "kv": item["kv"],
                         "def": item["def"],
                         "header_path": header_path
                     }
@@ -778,6 +824,8 @@ def parse_api(code, apis, sdks = ["module"], header_name = None, module_name = "
                             "args": overload["args"], # [["const char *", "i", None], ["int", "j", "10"]]
                             "ret_type": overload["ret_type"],
                             "static": overload["kv"].get("static", False),
+                            "const": overload["kv"].get("const", False),
+                            "kv": overload["kv"],
                             "def": overload["def"],
                             "header_path": header_path
                         })
@@ -0,0 +1,140 @@
+'''
+Freeze the pure-Python files of a directory into a C++ source for the embedded interpreter runner (EMBED_RUNNER),
+the source defines the built-in module `_autobind_frozen` whose `modules` dict maps module names to
+(is_package, is_source, data, filename), and whose `install()` adds the meta path finder importing them from memory,
+called by autobind::embed::run() (autobind/embed.hpp).
+Files are frozen as bytecode if this Python's version is the target's, otherwise as source.
+'''
+
+import os
+import sys
+import marshal
+import argparse
+
+
+# meta path finder of the frozen modules, installed by autobind::embed::run()
+FINDER = '''
+import sys
+import marshal
+import _frozen_importlib
+
+class FrozenFinder:
+    def __init__(self, modules):
+        self.modules = modules
+
+    def find_spec(self, name, path=None, target=None):
+        entry = self.modules.get(name)
+        if entry is None:
+            return None
+        return _frozen_importlib.ModuleSpec(name, self, origin=entry[3], is_package=entry[0])
+
+    def create_module(self, spec):
+        return None
+
+    def is_package(self, name):
+        return self.modules[name][0]
+
+    def get_code(self, name):
+        is_package, is_source, data, filename = self.modules[name]
+        return compile(bytes(data), filename, "exec") if is_source else marshal.loads(data)
+
+    def get_source(self, name):
+        return None
+
+    def exec_module(self, module):
+        module.__file__ = self.modules[module.__spec__.name][3]
+        exec(self.get_code(module.__spec__.name), module.__dict__)
+
+def install():
+    finders = [type(finder).__name__ for finder in sys.meta_path]
+    index = finders.index("PathFinder") if "PathFinder" in finders else len(finders)
+    sys.meta_path.insert(index, FrozenFinder(modules))
+'''
+
+
+def to_array(name, data):
+    lines = []
+    for i in range(0, len(data), 32):
+        lines.append("    " + ",".join(str(b) for b in data[i:i + 32]) + ",")
+    return "static const unsigned char {}[] = {{\n{}\n}};".format(name, "\n".join(lines) or "    0")
+
+
+def freeze(source, filename, bytecode):
+    return marshal.dumps(compile(source, filename, "exec", dont_inherit=True)) if bytecode else source
+
+
+def collect_modules(src_dir):
+    modules = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__" and not d.startswith("."))
+        for name in sorted(files):
+            if not name.endswith(".py"):
+                continue
+            path = os.path.join(root, name)
+            parts = os.path.relpath(path, src_dir)[:-3].split(os.sep)
+            is_package = parts[-1] == "__init__"
+            if is_package:
+                parts = parts[:-1]
+            if not parts:
+                continue
+            modules.append((".".join(parts), is_package, path))
+    return modules
+
+
+def gen_frozen_cpp(modules, src_dir, bytecode):
+    arrays = []
+    entries = []
+    for i, (name, is_package, path) in enumerate(modules):
+        with open(path, "rb") as f:
+            source = f.read()
+        filename = "<frozen {}>".format(os.path.relpath(path, src_dir).replace(os.sep, "/"))
+        data = freeze(source, filename, bytecode)
+        arrays.append(to_array("frozen_{}".format(i), data))
+        entries.append('    modules["{}"] = py::make_tuple({}, {}, py::memoryview::from_memory(frozen_{}, {}), "{}");'.format(
+            name, "true" if is_package else "false", "false" if bytecode else "true", i, len(data), filename))
+    finder = freeze(FINDER.encode(), "<frozen _autobind_frozen>", bytecode)
+    arrays.append(to_array("frozen_finder", finder))
+    if bytecode:
+        load_finder = 'py::module_::import("marshal").attr("loads")(py::memoryview::from_memory(frozen_finder, {}))'.format(len(finder))
+    else:
+        load_finder = 'builtins.attr("compile")(py::bytes(reinterpret_cast<const char *>(frozen_finder), {}), "<frozen _autobind_frozen>", "exec")'.format(len(finder))
+    return '''// Generated by freeze_python.py, do not edit
+
+#include <pybind11/embed.h>
+
+namespace py = pybind11;
+
+{}
+
+PYBIND11_EMBEDDED_MODULE(_autobind_frozen, m)
+{{
+    py::dict modules;
+{}
+    m.attr("modules") = modules;
+    py::module_ builtins = py::module_::import("builtins");
+    builtins.attr("exec")({}, m.attr("__dict__"));
+}}
+'''.format("\n\n".join(arrays), "\n".join(entries), load_finder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Freeze pure-Python files into a C++ source for the embedded interpreter runner')
+    parser.add_argument('-i', '--input', type=str, required=True, help="Directory of the pure-Python modules and packages to freeze")
+    parser.add_argument('-o', '--output', type=str, required=True, help="Output C++ source file")
+    parser.add_argument('--python-version', type=str, default="", help="Python version of the target (e.g. 3.11), bytecode only frozen if it's this Python's version (default: this Python's version)")
+    args = parser.parse_args()
+
+    host_version = "{}.{}".format(sys.version_info.major, sys.version_info.minor)
+    bytecode = not args.python_version or args.python_version == host_version
+    modules = collect_modules(args.input)
+    content = gen_frozen_cpp(modules, args.input, bytecode)
+    # only rewrite on change, avoid rebuilding the executable
+    old = None
+    if os.path.exists(args.output):
+        with open(args.output, "r", encoding="utf-8") as f:
+            old = f.read()
+    if old != content:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(content)
+    print("-- Frozen {} Python modules ({}) to {}".format(len(modules), "bytecode" if bytecode else "source", args.output))
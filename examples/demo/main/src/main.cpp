@@ -1,9 +1,19 @@
 #include <pybind11/embed.h> // everything needed for embedding
+#include "global_config.h"
+
+#ifdef CONFIG_EMBED_RUNNER
+#include <autobind/embed.hpp>
+#endif
 
 namespace py = pybind11;
 
 
 int main(int argc, char* argv[])
 {
+#ifdef CONFIG_EMBED_RUNNER
+    // run scripts with the modules built in, see autobind/embed.hpp
+    return autobind::embed::run(argc, argv);
+#else
     return 0;
+#endif
 }
\ No newline at end of file
@@ -6,6 +6,7 @@ Handles configuration setup and delegates to project.py for actual build.
 
 import sys
 import os
+from contextlib import nullcontext
 from pathlib import Path
 
 # === Constants ===
@@ -20,6 +21,17 @@ ARCH_CMAKE_MAP = {
     "CONFIG_TARGET_ARCH_RISCV64": "MaixCam",
 }
 
+# Binding generator config to cpp_bind_python.py args mapping
+BIND_ARGS_MAP = {
+    "CONFIG_BIND_FASTCALL": "--fastcall",
+    "CONFIG_BIND_LAZY": "--lazy",
+    "CONFIG_BIND_STRIP_DOCS": "--strip-docs",
+    "CONFIG_BIND_INSTRUMENT": "--instrument",
+    "CONFIG_BIND_TRACE": "--trace",
+    "CONFIG_BIND_ALLOC_STATS": "--alloc-stats",
+    "CONFIG_BIND_ALLOC_HEAP": "--alloc-heap",
+}
+
 
 def get_current_dir():
     """Get directory where this script is located."""
@@ -82,6 +94,11 @@ def get_platform_cmake_args(config):
     return []
 
 
+def get_bind_args(config):
+    """Generate cpp_bind_python.py args list based on binding generator config."""
+    return [arg for key, arg in BIND_ARGS_MAP.items() if config.get(key, '') == 'y']
+
+
 def exec_script(script_path, script_globals=None, work_dir=None):
     """Execute a Python script with proper namespace and working directory."""
     # 保存原始状态
@@ -109,18 +126,28 @@ def exec_script(script_path, script_globals=None, work_dir=None):
         sys.path[0] = original_sys_path_0
 
 
-def build_whl_package(current_dir, sdk_path, extra_cmake_args):
+def load_timings(sdk_path):
+    """Import tools/cmake/timings.py of the SDK and start recording for `build --timings`."""
+    sys.path.insert(1, str(sdk_path / "tools" / "cmake"))
+    import timings
+    timings.start(get_current_dir() / "build")
+    return timings
+
+
+def build_whl_package(current_dir, sdk_path, extra_cmake_args, bind_args=None, timings=None):
     """Build wheel package workflow."""
     # 保存原始 sys.argv
     original_argv = sys.argv.copy()
+    phase = timings.phase if timings else lambda name: nullcontext()
     
     # Run cpp_bind_python.py (独立命名空间，在项目目录执行)
     cpp_bind_path = current_dir / "cpp_bind_python.py"
     if not cpp_bind_path.exists():
         print(f"-- Error: cpp_bind_python.py not found")
         return 1
-    sys.argv = ['cpp_bind_python.py']
-    exec_script(cpp_bind_path, work_dir=current_dir)
+    sys.argv = ['cpp_bind_python.py'] + (bind_args or [])
+    with phase("binding generation"):
+        exec_script(cpp_bind_path, work_dir=current_dir)
     
     # Run project.py from SDK (需要传入特定变量，在项目目录执行)
     sys.argv = original_argv
@@ -145,7 +172,8 @@ def build_whl_package(current_dir, sdk_path, extra_cmake_args):
         print(f"-- Error: setup.py not found")
         return 1
     sys.argv = ['setup.py', 'bdist_wheel']
-    exec_script(setup_path, work_dir=current_dir)
+    with phase("setup.py bdist_wheel"):
+        exec_script(setup_path, work_dir=current_dir)
     
     # 恢复原始 sys.argv
     sys.argv = original_argv
@@ -192,6 +220,7 @@ def main():
     
     build_whl = get_build_whl_flag(config)
     extra_cmake_args = get_platform_cmake_args(config)
+    bind_args = get_bind_args(config)
     
     # Print info
     print(f"CONFIG_BUILD_WHL_PACKAGE={1 if build_whl else 0}")
@@ -199,13 +228,22 @@ def main():
     print(f"-- CUSTOM_COMPONENTS_PATH: {custom_components_path}")
     if extra_cmake_args:
         print(f"-- Extra CMake args: {' '.join(extra_cmake_args)}")
+    if bind_args:
+        print(f"-- Binding generator args: {' '.join(bind_args)}")
     
     # Get command
     command = sys.argv[1] if len(sys.argv) >= 2 else None
     
     # Execute appropriate workflow
     if command in ('build', 'rebuild') and build_whl:
-        sys.exit(build_whl_package(current_dir, sdk_path, extra_cmake_args))
+        timings = load_timings(sdk_path) if '--timings' in sys.argv else None
+        try:
+            ret = build_whl_package(current_dir, sdk_path, extra_cmake_args, bind_args, timings)
+        finally:
+            # also report the phases of a failed build
+            if timings:
+                timings.report()
+        sys.exit(ret)
     else:
         run_project(sdk_path, custom_components_path, extra_cmake_args, current_dir)
 
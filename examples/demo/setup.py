@@ -61,11 +61,11 @@ AUTHOR = mk_config.get("CONFIG_WHL_AUTHOR", "Tao")
 DESCRIPTION = mk_config.get("CONFIG_WHL_DESCRIPTION", "Auto bind Python from C/C++")
 
 # 2. 路径配置（目标目录为 build/模块名）
-SO_FILE_PATH = os.path.join("build", "main", "libmain.so")  # 原始.so文件路径
+CORE_SO_PATH = os.path.join("build", "main", "libmain.so")  # 核心库(用户C++源码)，所有模块链接到它
+MODULES_DIR = os.path.join("build", "python_modules")       # 每个头文件一个扩展模块 <模块名>.so
+DOCS_DIR = os.path.join("main", "src")                      # --strip-docs 生成的文档文件 <模块名>_docs.json.gz
 # 新的包目录：根目录/build/模块名
 PACKAGE_DIR = os.path.join("build", PACKAGE_NAME)          
-TARGET_SO_NAME = f"{PACKAGE_NAME}.so"                       # 重命名后的.so文件名
-TARGET_SO_PATH = os.path.join(PACKAGE_DIR, TARGET_SO_NAME)  # .so文件最终位置
 INIT_FILE_PATH = os.path.join(PACKAGE_DIR, "__init__.py")   # __init__.py路径
 
 # 3. 核心自动化函数
@@ -76,14 +76,59 @@ def prepare_package():
         os.makedirs(PACKAGE_DIR)
         print(f"✅ 已创建包目录：{PACKAGE_DIR}")
 
+    if not os.path.exists(CORE_SO_PATH) or not os.path.isdir(MODULES_DIR):
+        raise FileNotFoundError(
+            f"❌ 错误：找不到.so文件！路径：{CORE_SO_PATH}, {MODULES_DIR}\n"
+            "请先编译生成libmain.so和扩展模块，再执行打包命令。"
+        )
+    modules = sorted(name[:-3] for name in os.listdir(MODULES_DIR) if name.endswith(".so"))
+
     # 第二步：自动生成__init__.py文件
     init_content = f'''"""
 {PACKAGE_NAME} 包 - {DESCRIPTION}
 作者：{AUTHOR}
 版本：{VERSION}
 """
-# 自动生成的__init__.py，用于导入.so模块的核心功能
-from .{PACKAGE_NAME} import *
+# 自动生成的__init__.py，按需从.so模块获取属性(PEP 562)，不再 import *，
+# 这样 --lazy 生成的子模块在第一次访问时才注册。
+# 每个头文件是一个独立的扩展模块，只在第一次访问 {PACKAGE_NAME}.<模块名> 时加载
+# 导入的模块使用 _ 开头的名字，不会被 from {PACKAGE_NAME} import * 导出
+import importlib as _importlib
+import sys as _sys
+import types as _types
+
+_MODULES = {modules!r}
+_native = _importlib.import_module(".{PACKAGE_NAME}", __name__) if "{PACKAGE_NAME}" in _MODULES else None
+_DOC = __doc__
+
+# from {PACKAGE_NAME} import * 导出与 {PACKAGE_NAME} 同名模块的公开成员和其它模块
+__all__ = sorted(set(x for x in (dir(_native) if _native is not None else []) if not x.startswith("_")) |
+                 set(x for x in _MODULES if x != "{PACKAGE_NAME}"))
+
+
+class _Package(_types.ModuleType):
+    # 读取 __doc__ 时才从.so模块获取，--strip-docs 时第一次读取才加载文档文件
+    @property
+    def __doc__(self):
+        return (_native.__doc__ if _native is not None else None) or _DOC
+
+
+_sys.modules[__name__].__class__ = _Package
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        value = _importlib.import_module("." + name, __name__)
+    elif _native is not None:
+        value = getattr(_native, name)
+    else:
+        raise AttributeError(f"module {{__name__!r}} has no attribute {{name!r}}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES) | (set(dir(_native)) if _native is not None else set()))
 
 # 暴露版本信息，方便用户查看
 __version__ = "{VERSION}"
@@ -94,14 +139,17 @@ __author__ = "{AUTHOR}"
         f.write(init_content)
     print(f"✅ 已自动生成 {INIT_FILE_PATH}")
 
-    # 第三步：复制并重命名.so文件到包目录
-    if not os.path.exists(SO_FILE_PATH):
-        raise FileNotFoundError(
-            f"❌ 错误：找不到.so文件！路径：{SO_FILE_PATH}\n"
-            "请先编译生成libmain.so，再执行打包命令。"
-        )
-    shutil.copy(SO_FILE_PATH, TARGET_SO_PATH)
-    print(f"✅ 已复制.so文件到：{TARGET_SO_PATH}")
+    # 第三步：复制核心库、所有扩展模块和文档文件到包目录(先删除旧的文件，避免打包已删除的模块)
+    for name in os.listdir(PACKAGE_DIR):
+        if name.endswith(".so") or name.endswith("_docs.json.gz"):
+            os.remove(os.path.join(PACKAGE_DIR, name))
+    shutil.copy(CORE_SO_PATH, PACKAGE_DIR)
+    for name in modules:
+        shutil.copy(os.path.join(MODULES_DIR, name + ".so"), PACKAGE_DIR)
+        docs_path = os.path.join(DOCS_DIR, f"{name}_docs.json.gz")
+        if os.path.exists(docs_path):
+            shutil.copy(docs_path, PACKAGE_DIR)
+    print(f"✅ 已复制.so文件到：{PACKAGE_DIR} (libmain.so, 模块: {', '.join(modules)})")
 
 # 4. 执行前置准备（创建目录、生成__init__.py、复制.so）
 prepare_package()
@@ -116,9 +164,9 @@ setup(
     package_dir={"": "build"},
     # 仅打包声明的目录包（从build目录下找PACKAGE_NAME）
     packages=find_packages(where="build"),
-    # 打包包内的.so文件
+    # 打包包内的.so文件(核心库libmain.so和每个模块的<模块名>.so)和 --strip-docs 的文档文件
     package_data={
-        PACKAGE_NAME: [TARGET_SO_NAME]  # 相对于包目录（build/add）的路径
+        PACKAGE_NAME: ["*.so", "*_docs.json.gz"]  # 相对于包目录（build/add）的路径
     },
     # 兼容配置
     classifiers=[
@@ -126,7 +174,7 @@ setup(
         "Operating System :: Linux",
         "Programming Language :: C++",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.7",  # 模块 __getattr__ (PEP 562)
 )
 
 
@@ -0,0 +1,204 @@
+'''
+    @brief Tests of the annotation runtime helpers, on a package built through the normal pipeline
+
+    Copies this project to a temporary directory, replaces main/include with HEADER,
+    builds it with project.py build (cpp_bind_python.py -> CMake -> setup.py) once per
+    session and imports the package directory build/<package> (the content of the wheel).
+
+    Usage:
+        python3 -m pytest test
+'''
+
+import os
+import sys
+import math
+import pickle
+import shutil
+import subprocess
+
+import pytest
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(curr_dir)
+sdk_path = os.path.abspath(os.environ.get("MY_SDK_PATH") or os.path.join(project_dir, "..", ".."))
+
+PACKAGE_NAME = "annotest"
+
+HEADER = '''
+#pragma once
+
+#include <vector>
+#include <cstddef>
+
+namespace anno
+{
+    /**
+     * Fixed size buffer.
+     * @module anno.Buf
+     * :sequence
+     */
+    class Buf
+    {
+    public:
+        /**
+         * Make a buffer of n items.
+         * @param n item count
+         * @module anno.Buf.__init__
+         */
+        Buf(int n) : _items(n, 1) {}
+
+        size_t size() const { return _items.size(); }
+
+        /**
+         * Item at i, not checked.
+         * @param i index
+         * @return item
+         * @module anno.Buf.__getitem__
+         */
+        int &operator[](size_t i) { return _items[i]; }
+
+    private:
+        std::vector<int> _items;
+    };
+
+    /**
+     * Square of x.
+     * @param x value
+     * @return x * x
+     * @module anno.square
+     * :memoize max=4
+     */
+    inline double square(double x) { return x * x; }
+
+    /**
+     * Add b to a.
+     * @param a first
+     * @param b second
+     * @return a + b
+     * @module anno.add
+     * :batch
+     * :parallel
+     */
+    inline int add(int a, int b = 10) { return a + b; }
+
+    /**
+     * n copies of value.
+     * @param n count
+     * @param value item
+     * @return items
+     * @module anno.fill
+     * :shm
+     */
+    inline std::vector<int> fill(int n, int value) { return std::vector<int>(n, value); }
+}
+'''
+
+
+@pytest.fixture(scope="session")
+def package(tmp_path_factory):
+    work_dir = str(tmp_path_factory.mktemp("project") / "project")
+    shutil.copytree(project_dir, work_dir, ignore=shutil.ignore_patterns("build", "dist", "*.egg-info", "__pycache__", "bench", "test"))
+    include_dir = os.path.join(work_dir, "main", "include")
+    src_dir = os.path.join(work_dir, "main", "src")
+    shutil.rmtree(include_dir)
+    os.makedirs(include_dir)
+    for name in os.listdir(src_dir):
+        if name != "main.cpp":
+            os.remove(os.path.join(src_dir, name))
+    with open(os.path.join(include_dir, "anno.hpp"), "w") as f:
+        f.write(HEADER)
+    config_path = os.path.join(work_dir, "build", "config", "global_config.mk")
+    os.makedirs(os.path.dirname(config_path))
+    with open(config_path, "w") as f:
+        f.write("CONFIG_TARGET_ARCH_X86=y\nCONFIG_BUILD_WHL_PACKAGE=y\nCONFIG_WHL_PACKAGE_NAME=\"{}\"\n".format(PACKAGE_NAME))
+
+    log_path = os.path.join(work_dir, "build.log")
+    with open(log_path, "w") as log:
+        # project.py always exits 1 after building the wheel, success is the package directory with the .so files
+        subprocess.run([sys.executable, "project.py", "build"], cwd=work_dir, env=dict(os.environ, MY_SDK_PATH=sdk_path),
+                       stdout=log, stderr=subprocess.STDOUT)
+    package_dir = os.path.join(work_dir, "build", PACKAGE_NAME)
+    if not os.path.exists(os.path.join(package_dir, "anno.so")):
+        pytest.fail("building {} failed, see {}".format(work_dir, log_path))
+    sys.path.insert(0, os.path.dirname(package_dir))
+    yield __import__(PACKAGE_NAME + ".anno").anno
+    sys.path.remove(os.path.dirname(package_dir))
+
+
+def test_sequence_index(package):
+    buf = package.Buf(3)
+    buf[-1] = 5
+    assert len(buf) == 3
+    assert [buf[0], buf[-1]] == [1, 5]
+    for index in [3, 10 ** 8, -4]:
+        with pytest.raises(IndexError):
+            buf[index]
+
+
+def test_sequence_view(package):
+    buf = package.Buf(4)
+    view = buf[1::2]
+    assert type(view).__name__ == "View"
+    assert len(view) == 2
+    with pytest.raises(IndexError):
+        view[2]
+    assert "autobind::" not in package.Buf.__getitem__.__doc__
+
+
+def test_memoize_nan(package):
+    package.square.cache_clear()
+    assert package.square(3.0) == 9.0
+    assert math.isnan(package.square(float("nan")))
+    assert math.isnan(package.square(float("nan")))
+    assert package.square(3.0) == 9.0
+    assert package.square(7.0) == 49.0
+    info = package.square.cache_info()
+    assert (info.hits, info.currsize) == (1, 2)
+
+
+def test_memoize_type_not_in_module(package):
+    assert not [name for name in dir(package) if name.startswith("_lru_cache_wrapper")]
+    assert type(package.square).__name__ == "_lru_cache_wrapper_square"
+
+
+def test_batch_defaults(package):
+    assert package.add_batch([(1,), (2, 3), 4]) == [11, 5, 14]
+    with pytest.raises(TypeError):
+        package.add_batch([()])
+
+
+def test_parallel_defaults(package):
+    assert package.parallel_map(package.add, [(1,), (2, 3), 4], workers=2) == [11, 5, 14]
+    with pytest.raises(TypeError):
+        package.parallel_map(package.add, [(1, 2, 3)])
+
+
+def test_package_star_import(package):
+    namespace = {}
+    exec("from {} import *".format(PACKAGE_NAME), namespace)
+    assert sorted(x for x in namespace if x != "__builtins__") == ["anno"]
+
+
+def test_shm_pickle_references(package):
+    handle = package.fill(4, 7)
+    data = pickle.dumps(handle)
+    first, second = pickle.loads(data), pickle.loads(data)
+    del handle, first
+    assert list(memoryview(second)) == [7] * 4
+    del second
+    # the block was freed with its last handle, the pickle holds no reference
+    with pytest.raises(ValueError):
+        pickle.loads(data)
+
+
+def test_shm_open_checks_block(package):
+    handle = package.fill(4, 7)
+    cls, (name, offset, generation, fmt, itemsize, count) = handle.__reduce__()
+    other = cls(name, offset, generation, fmt, itemsize, count)
+    del handle
+    assert list(memoryview(other)) == [7] * 4
+    for args in [(offset + 64, generation), (offset, generation + 1), (offset + 1, generation)]:
+        with pytest.raises(ValueError):
+            cls(name, args[0], args[1], fmt, itemsize, count)
+    with pytest.raises(ValueError):
+        cls(name, offset, generation, fmt, itemsize, count * 1000)
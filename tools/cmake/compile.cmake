@@ -15,6 +15,9 @@ get_filename_component(parent_dir_name ${parent_dir} NAME)
 #  global variables
 set(g_dynamic_libs "" CACHE INTERNAL "g_dynamic_libs")
 set(g_link_search_path "" CACHE INTERNAL "g_link_search_path")
+set(g_python_modules "" CACHE INTERNAL "g_python_modules")
+set(g_executable_objs "" CACHE INTERNAL "g_executable_objs")
+set(g_precompiled_headers "" CACHE INTERNAL "g_precompiled_headers")
 
 # Set project dir, so just projec can include this cmake file!!!
 set(PROJECT_SOURCE_DIR ${parent_dir})
@@ -111,6 +114,25 @@ function(register_component)
         target_link_options(${component_name} PRIVATE ${difinition})
     endforeach()
 
+    # Add precompiled headers, used only by the binding sources(ADD_PYTHON_MODULES and ADD_EXECUTABLE_SRCS)
+    # of all components, see project()
+    if(ADD_PRECOMPILED_HEADERS)
+        if(CMAKE_VERSION VERSION_LESS 3.16 OR NOT CMAKE_CXX_COMPILER_ID MATCHES "GNU|Clang")
+            message(STATUS "component ${component_name} precompiled headers ignored, need CMake >= 3.16 and GCC or Clang")
+        else()
+            set(precompiled_headers ${g_precompiled_headers})
+            foreach(header ${ADD_PRECOMPILED_HEADERS})
+                get_filename_component(abs_header ${header} ABSOLUTE BASE_DIR ${component_dir})
+                if(NOT EXISTS ${abs_header})
+                    message(FATAL_ERROR "${CMAKE_CURRENT_LIST_FILE}: ${header} not found!")
+                endif()
+                list(APPEND precompiled_headers ${abs_header})
+            endforeach()
+            list(REMOVE_DUPLICATES precompiled_headers)
+            set(g_precompiled_headers ${precompiled_headers}  CACHE INTERNAL "g_precompiled_headers")
+        endif()
+    endif()
+
     # Add lib search path
     if(ADD_LINK_SEARCH_PATH)
         foreach(path ${ADD_LINK_SEARCH_PATH})
@@ -169,6 +191,44 @@ function(register_component)
     # Add requirements
     target_link_libraries(${component_name} ${include_type} ${ADD_REQUIREMENTS})
 
+    # Add python extension modules, one module per source file(bind_<name>.cpp -> <name>.so),
+    # linked against this component as shared core lib, output to ${PROJECT_BINARY_DIR}/python_modules
+    if(ADD_PYTHON_MODULES)
+        if(NOT to_dynamic_lib)
+            message(FATAL_ERROR "${CMAKE_CURRENT_LIST_FILE}: ADD_PYTHON_MODULES set but component not registered as DYNAMIC, modules must share one core lib!")
+        endif()
+        set(python_modules ${g_python_modules})
+        foreach(src ${ADD_PYTHON_MODULES})
+            get_filename_component(src ${src} ABSOLUTE BASE_DIR ${component_dir})
+            get_filename_component(module_name ${src} NAME_WE)
+            string(REGEX REPLACE "^bind_" "" module_name ${module_name})
+            set(module_target ${component_name}_python_${module_name})
+            add_library(${module_target} MODULE ${src})
+            set_target_properties(${module_target} PROPERTIES
+                                  PREFIX ""
+                                  SUFFIX ${DL_EXT}
+                                  OUTPUT_NAME ${module_name}
+                                  LIBRARY_OUTPUT_DIRECTORY "${PROJECT_BINARY_DIR}/python_modules"
+                                  BUILD_RPATH "$ORIGIN"
+                                  INSTALL_RPATH "$ORIGIN"
+                                  )
+            target_link_libraries(${module_target} PRIVATE ${component_name})
+            list(APPEND python_modules ${module_target})
+        endforeach()
+        set(g_python_modules ${python_modules}  CACHE INTERNAL "g_python_modules")
+    endif()
+
+    # Add sources compiled into the project executable instead of this component's lib, with this component's
+    # requirements, e.g. PYBIND11_EMBEDDED_MODULE modules, whose static registration must run before main()
+    if(ADD_EXECUTABLE_SRCS)
+        set(executable_objs ${g_executable_objs})
+        set(objs_target ${component_name}_executable_objs)
+        add_library(${objs_target} OBJECT ${ADD_EXECUTABLE_SRCS})
+        target_link_libraries(${objs_target} PRIVATE ${component_name})
+        list(APPEND executable_objs ${objs_target})
+        set(g_executable_objs ${executable_objs}  CACHE INTERNAL "g_executable_objs")
+    endif()
+
     # Add file depends
     if(ADD_FILE_DEPENDS)
         add_custom_target(${component_name}_file_depends DEPENDS ${ADD_FILE_DEPENDS})
@@ -328,6 +388,11 @@ macro(project name)
                             --output cmake  ${PROJECT_BINARY_DIR}/config/global_config.cmake
                             --output header ${PROJECT_BINARY_DIR}/config/global_config.h
                             )
+    # project.py build --timings: genconfig.py, compiles and links are timed by tools/cmake/timings.py
+    if(BUILD_TIMINGS)
+        set(timings_launcher ${python} ${SDK_PATH}/tools/cmake/timings.py launch ${BUILD_TIMINGS})
+        set(generate_config_cmd ${timings_launcher} genconfig -- ${generate_config_cmd})
+    endif()
     execute_process(COMMAND ${generate_config_cmd} RESULT_VARIABLE cmd_res)
     if(NOT cmd_res EQUAL 0)
         message(FATAL_ERROR "Check Kconfig content")
@@ -411,6 +476,75 @@ macro(project name)
         # message("!!! RELEASE !!!")
     endif()
 
+    # Compiler cache(ccache/sccache) as CMAKE_<LANG>_COMPILER_LAUNCHER, one cache dir per toolchain,
+    # COMPILER_CACHE/COMPILER_CACHE_DIR from `project.py build --compiler-cache` override the Kconfig options
+    set(compiler_cache "")
+    if(COMPILER_CACHE)
+        set(compiler_cache ${COMPILER_CACHE})
+    elseif(CONFIG_COMPILER_CACHE_CCACHE)
+        set(compiler_cache ccache)
+    elseif(CONFIG_COMPILER_CACHE_SCCACHE)
+        set(compiler_cache sccache)
+    endif()
+    if(compiler_cache STREQUAL "none")
+        set(compiler_cache "")
+    endif()
+    # read even without a cache, project.py always passes COMPILER_CACHE_DIR
+    if(COMPILER_CACHE_DIR)
+        set(compiler_cache_root ${COMPILER_CACHE_DIR})
+    elseif(CONFIG_COMPILER_CACHE_DIR)
+        get_filename_component(compiler_cache_root ${CONFIG_COMPILER_CACHE_DIR} ABSOLUTE BASE_DIR ${PROJECT_PATH})
+    else()
+        set(compiler_cache_root "$ENV{HOME}/.cache/${compiler_cache}")
+    endif()
+    set(compiler_cache_program "")
+    set(compiler_cache_env "")
+    if(compiler_cache)
+        string(TOUPPER ${compiler_cache} compiler_cache_name)
+        find_program(${compiler_cache_name}_PROGRAM ${compiler_cache})
+        set(compiler_cache_program ${${compiler_cache_name}_PROGRAM})
+        if(NOT compiler_cache_program)
+            message(WARNING "compiler cache ${compiler_cache} not found, build without it")
+            set(compiler_cache_program "")
+        endif()
+    endif()
+    if(compiler_cache_program)
+        # objects of different toolchains never hit each other, keep them apart: <prefix><compiler>-<version>-<path hash>
+        string(MD5 compiler_hash "${CMAKE_CXX_COMPILER}")
+        string(SUBSTRING ${compiler_hash} 0 8 compiler_hash)
+        set(toolchain_id "${CONFIG_TOOLCHAIN_PREFIX}${CMAKE_CXX_COMPILER_ID}-${CMAKE_CXX_COMPILER_VERSION}-${compiler_hash}")
+        set(compiler_cache_dir "${compiler_cache_root}/${toolchain_id}")
+        file(MAKE_DIRECTORY ${compiler_cache_dir})
+        if(compiler_cache STREQUAL "sccache")
+            # the sccache server reads SCCACHE_DIR when started, so one server(port) per toolchain
+            string(SUBSTRING ${compiler_hash} 0 3 port_hash)
+            math(EXPR port "4300 + 0x${port_hash}")
+            set(compiler_cache_env "SCCACHE_DIR=${compiler_cache_dir}" "SCCACHE_SERVER_PORT=${port}")
+        else()
+            # precompiled headers(ADD_PRECOMPILED_HEADERS) are only cached with this sloppiness
+            set(compiler_cache_env "CCACHE_DIR=${compiler_cache_dir}" "CCACHE_SLOPPINESS=pch_defines,time_macros")
+        endif()
+        set(compiler_cache_launcher ${CMAKE_COMMAND} -E env ${compiler_cache_env} ${compiler_cache_program})
+        set(CMAKE_C_COMPILER_LAUNCHER ${compiler_cache_launcher})
+        set(CMAKE_CXX_COMPILER_LAUNCHER ${compiler_cache_launcher})
+        message(STATUS "compiler cache: ${compiler_cache_program}, dir: ${compiler_cache_dir}")
+    endif()
+    # read by project.py to print the cache stats after build
+    set(COMPILER_CACHE_PROGRAM "${compiler_cache_program}" CACHE INTERNAL "COMPILER_CACHE_PROGRAM")
+    set(COMPILER_CACHE_ENV "${compiler_cache_env}" CACHE INTERNAL "COMPILER_CACHE_ENV")
+
+    if(BUILD_TIMINGS)
+        string(REPLACE ";" " " timings_launcher "${timings_launcher}")
+        set_property(GLOBAL PROPERTY RULE_LAUNCH_COMPILE "${timings_launcher} compile --")
+        set_property(GLOBAL PROPERTY RULE_LAUNCH_LINK "${timings_launcher} link --")
+        # clang writes <object>.json trace files, aggregated per template family and header
+        include(CheckCXXCompilerFlag)
+        check_cxx_compiler_flag(-ftime-trace COMPILER_SUPPORTS_TIME_TRACE)
+        if(COMPILER_SUPPORTS_TIME_TRACE)
+            add_compile_options($<$<COMPILE_LANGUAGE:C,CXX>:-ftime-trace>)
+        endif()
+    endif()
+
     # Add dependence: update configfile, append time and git info for global config header file
     # we didn't generate build info for cmake and makefile for if we do, it will always rebuild cmake
     # everytime we execute make
@@ -445,6 +579,23 @@ macro(project name)
         endif()
     endforeach()
 
+    # Precompile headers(ADD_PRECOMPILED_HEADERS) once for the binding targets, the others reuse it,
+    # so they are compiled with the same flags: no per target <target>_EXPORTS define and all -fPIC
+    if(g_precompiled_headers)
+        set(pch_owner "")
+        foreach(pch_target ${g_python_modules} ${g_executable_objs})
+            set_target_properties(${pch_target} PROPERTIES DEFINE_SYMBOL "" POSITION_INDEPENDENT_CODE ON)
+            if(pch_owner)
+                set_target_properties(${pch_target} PROPERTIES PRECOMPILE_HEADERS_REUSE_FROM ${pch_owner})
+            else()
+                foreach(header ${g_precompiled_headers})
+                    target_precompile_headers(${pch_target} PRIVATE "$<$<COMPILE_LANGUAGE:CXX>:${header}>")
+                endforeach()
+                set(pch_owner ${pch_target})
+            endif()
+        endforeach()
+    endif()
+
     # Add lib search path to link flags
     foreach(abs_dir ${g_link_search_path})
         set(CMAKE_C_LINK_FLAGS "${CMAKE_C_LINK_FLAGS} -L${abs_dir} -Wl,-rpath,${abs_dir}")
@@ -464,6 +615,16 @@ macro(project name)
     # Add main component(lib)
     target_link_libraries(${name} main)
 
+    # Add objects of ADD_EXECUTABLE_SRCS
+    foreach(objs_target ${g_executable_objs})
+        target_sources(${name} PRIVATE $<TARGET_OBJECTS:${objs_target}>)
+    endforeach()
+
+    # Build python extension modules(ADD_PYTHON_MODULES) with the project, components are EXCLUDE_FROM_ALL
+    if(g_python_modules)
+        add_dependencies(${name} ${g_python_modules})
+    endif()
+
     # Add binary
     if(EXISTS "${PROJECT_PATH}/compile/gen_binary.cmake")
         include("${PROJECT_PATH}/compile/gen_binary.cmake")
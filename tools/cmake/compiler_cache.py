@@ -0,0 +1,96 @@
+#
+# compiler cache(ccache/sccache) stats of `project.py build`
+#
+# @license MIT
+#
+# compile.cmake runs every compile through the cache as CMAKE_<LANG>_COMPILER_LAUNCHER with its
+# per toolchain cache dir in the environment (CCACHE_DIR, or SCCACHE_DIR and SCCACHE_SERVER_PORT),
+# the stats of that cache are read before and after the build, and the difference is printed.
+#
+
+import os
+import json
+import subprocess
+
+# ccache --print-stats counters of compiles that ran without the cache
+UNCACHEABLE = ("could_not_use_precompiled_header", "unsupported_compiler_option", "unsupported_code_directive",
+               "unsupported_source_language", "preprocessor_error", "compile_failed", "bad_compiler_arguments",
+               "multiple_source_files", "output_to_stdout", "compiler_produced_no_output", "internal_error")
+
+
+def run(program, env, args):
+    '''
+        Run program with the cache environment(["NAME=value", ...]), return stdout, None if failed.
+    '''
+    full_env = os.environ.copy()
+    for item in env:
+        k, v = item.split("=", 1)
+        full_env[k] = v
+    try:
+        res = subprocess.run([program] + args, env=full_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    except OSError:
+        return None
+    return res.stdout if res.returncode == 0 else None
+
+
+def is_sccache(program):
+    return os.path.basename(program).startswith("sccache")
+
+
+def stats(program, env):
+    '''
+        Current counters of the cache, {"hits", "misses", "uncacheable", "size_kb"}, None if not readable
+        (ccache < 4.0 has no --print-stats).
+    '''
+    if is_sccache(program):
+        out = run(program, env, ["--show-stats", "--stats-format=json"])
+        if out is None:
+            return None
+        try:
+            data = json.loads(out)
+        except ValueError:
+            return None
+        s = data.get("stats", {})
+        return {
+            "hits": sum(s.get("cache_hits", {}).get("counts", {}).values()),
+            "misses": sum(s.get("cache_misses", {}).get("counts", {}).values()),
+            "uncacheable": s.get("non_cacheable_compilations", 0) + sum(s.get("not_cached", {}).values()),
+            "size_kb": (data.get("cache_size") or 0) // 1024,
+        }
+    out = run(program, env, ["--print-stats"])
+    if out is None:
+        return None
+    counters = {}
+    for line in out.splitlines():
+        k, _, v = line.partition("\t")
+        if v.strip().isdigit():
+            counters[k] = int(v)
+    hits = counters.get("direct_cache_hit", 0) + counters.get("preprocessed_cache_hit", 0)
+    misses = counters.get("cache_miss", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "uncacheable": sum(counters.get(k, 0) for k in UNCACHEABLE),
+        "size_kb": counters.get("cache_size_kibibyte", 0),
+    }
+
+
+def print_stats(program, env, before):
+    '''
+        Print the hits and misses of this build, before is stats() read before the build.
+    '''
+    cache_dir = [item.split("=", 1)[1] for item in env if item.split("=", 1)[0] in ("CCACHE_DIR", "SCCACHE_DIR")]
+    name = os.path.basename(program)
+    after = stats(program, env)
+    if after is None or before is None:
+        # no machine readable stats, print the tool's own summary
+        out = run(program, env, ["-s"])
+        print("-- {} stats:\n{}".format(name, out.rstrip() if out else "unavailable"))
+        return
+    diff = {k: max(after[k] - before[k], 0) for k in ("hits", "misses", "uncacheable")}
+    total = diff["hits"] + diff["misses"]
+    print("-- {}: {} hits, {} misses{}, hit rate {:.0f}%, cache {:.1f} MB in {}".format(
+        name, diff["hits"], diff["misses"],
+        ", {} uncacheable".format(diff["uncacheable"]) if diff["uncacheable"] else "",
+        diff["hits"] * 100 / total if total else 0,
+        after["size_kb"] / 1024, cache_dir[0] if cache_dir else "default dir"))
@@ -37,6 +37,11 @@ if project_name == "":
     print("[ERROR] Can not find project name in {}, not set(PROJECT_NAME {})".format(project_cmake_path, "${project_name}"))
     exit(1)
 
+# build phase timings(--timings)
+sys.path.insert(1, os.path.join(sdk_path, "tools", "cmake"))
+import timings
+import compiler_cache
+
 # find extra tools
 tools_dir = os.path.join(sdk_path, "tools", "cmds")
 sys.path.insert(1, tools_dir)
@@ -77,6 +82,18 @@ project_parser.add_argument('--verbose',
                         help='for build command, execute `cmake -build . --verbose` to compile',
                         action="store_true",
                         default=False)
+project_parser.add_argument('--timings',
+                        help='for build command, record wall and CPU time of every build phase, compile and link to build/timings/timings.json',
+                        action="store_true",
+                        default=False)
+project_parser.add_argument('--compiler-cache',
+                        help='for build command, compile through ccache or sccache (CMAKE_<LANG>_COMPILER_LAUNCHER) instead of the COMPILER_CACHE Kconfig option',
+                        choices=["ccache", "sccache", "none"],
+                        default="")
+project_parser.add_argument('--compiler-cache-dir',
+                        help='for build command, compiler cache root dir instead of the COMPILER_CACHE_DIR Kconfig option, every toolchain uses a sub dir',
+                        metavar='DIR',
+                        default="")
 project_parser.add_argument('-G', '--generator', default="", help="project type to generate, supported type on your platform see `cmake --help`")
 project_parser.add_argument('--release', action="store_true", default=False, help="release mode, default is debug mode")
 project_parser.add_argument('--build-type', default=None, help="build type, [Debug, Release, MinRelSize, RelWithDebInfo], you can also set build type by CMAKE_BUILD_TYPE environment variable")
@@ -147,6 +164,14 @@ def dump_config_mk(configs, path):
                 v = '"' + v + '"'
             f.write("{}={}\n".format(k, v))
 
+def get_cmake_cache_var(name):
+    if os.path.exists("CMakeCache.txt"):
+        with open("CMakeCache.txt") as f:
+            for line in f:
+                if line.startswith(name + ":"):
+                    return line.split("=", 1)[1].strip()
+    return ""
+
 def get_config_files(config_file, sdk_path, project_path):
     files = []
     config_mk = os.path.join(project_path, ".config.mk")
@@ -203,8 +228,17 @@ elif project_args.cmd == "build" or project_args.cmd == "rebuild":
     time_start = time.time()
     if not os.path.exists("build"):
         os.mkdir("build")
+    # the outer project.py(building the wheel) may have started timings already and reports at its end
+    timings_owner = project_args.timings and not timings.log_path()
+    if project_args.timings:
+        timings.start("build")
     os.chdir("build")
-    if not os.path.exists("Makefile") or project_args.cmd == "rebuild":
+    # BUILD_TIMINGS is a cmake cache variable, configure again when --timings is turned on or off
+    timings_changed = os.path.exists("Makefile") and get_cmake_cache_var("BUILD_TIMINGS") != timings.log_path()
+    # so are COMPILER_CACHE and COMPILER_CACHE_DIR, configure again when --compiler-cache(-dir) changed
+    cache_dir = os.path.abspath(project_args.compiler_cache_dir) if project_args.compiler_cache_dir else ""
+    cache_changed = os.path.exists("Makefile") and (get_cmake_cache_var("COMPILER_CACHE"), get_cmake_cache_var("COMPILER_CACHE_DIR")) != (project_args.compiler_cache, cache_dir)
+    if not os.path.exists("Makefile") or project_args.cmd == "rebuild" or timings_changed or cache_changed:
         if not os.path.isabs(project_args.config_file):
             project_args.config_file = os.path.join(project_path, project_args.config_file)
         config_path = os.path.abspath(project_args.config_file)
@@ -214,7 +248,10 @@ elif project_args.cmd == "build" or project_args.cmd == "rebuild":
         print("-- build type: {}".format(build_type))
         cmd = ["cmake", "-G", configs["CONFIG_CMAKE_GENERATOR"],
                                "-DCMAKE_BUILD_TYPE={}".format(build_type),
-                               "-DDEFAULT_CONFIG_FILE={}".format(config_path),  ".."]
+                               "-DDEFAULT_CONFIG_FILE={}".format(config_path),
+                               "-DBUILD_TIMINGS={}".format(timings.log_path()),
+                               "-DCOMPILER_CACHE={}".format(project_args.compiler_cache),
+                               "-DCOMPILER_CACHE_DIR={}".format(cache_dir),  ".."]
         if custom_components_path:
             cmd.insert(4, "-DCUSTOM_COMPONENTS_PATH={}".format(custom_components_path))
         # 添加额外的 cmake 参数（如平台变量 -DLinux=ON, -DMaixCam2=ON 等）
@@ -224,21 +261,28 @@ elif project_args.cmd == "build" or project_args.cmd == "rebuild":
             for arg in extra_cmake_args:
                 cmd.insert(-1, arg)
         print(f"-- [DEBUG] Final cmake command: {' '.join(cmd)}")
-        res = subprocess.call(cmd)
+        with timings.phase("cmake configure"):
+            res = subprocess.call(cmd)
         if res != 0:
             exit(1)
-    if project_args.verbose:
-        if configs["CONFIG_CMAKE_GENERATOR"] == "Unix Makefiles":
-            res = subprocess.call(["cmake", "--build", ".", "--target", "all", "--", "VERBOSE=1"])
-        elif configs["CONFIG_CMAKE_GENERATOR"] == "Ninja":
-            res = subprocess.call(["cmake", "--build", ".", "--target", "all", "--", "-v"])
-        else:
-            res = subprocess.call(["cmake", "--build", ".", "--target", "all"])
-    else:
-        if configs["CONFIG_CMAKE_GENERATOR"] in ["Unix Makefiles", "Ninja"]:
-            res = subprocess.call(["cmake", "--build", ".", "--target", "all", "--", "-j{}".format(thread_num)])
+    cache_program = get_cmake_cache_var("COMPILER_CACHE_PROGRAM")
+    cache_env = [x for x in get_cmake_cache_var("COMPILER_CACHE_ENV").split(";") if x]
+    cache_stats = compiler_cache.stats(cache_program, cache_env) if cache_program else None
+    with timings.phase("cmake build"):
+        if project_args.verbose:
+            if configs["CONFIG_CMAKE_GENERATOR"] == "Unix Makefiles":
+                res = subprocess.call(["cmake", "--build", ".", "--target", "all", "--", "VERBOSE=1"])
+            elif configs["CONFIG_CMAKE_GENERATOR"] == "Ninja":
+                res = subprocess.call(["cmake", "--build", ".", "--target", "all", "--", "-v"])
+            else:
+                res = subprocess.call(["cmake", "--build", ".", "--target", "all"])
         else:
-            res = subprocess.call(["cmake", "--build", ".", "--target", "all"])
+            if configs["CONFIG_CMAKE_GENERATOR"] in ["Unix Makefiles", "Ninja"]:
+                res = subprocess.call(["cmake", "--build", ".", "--target", "all", "--", "-j{}".format(thread_num)])
+            else:
+                res = subprocess.call(["cmake", "--build", ".", "--target", "all"])
+    if cache_program:
+        compiler_cache.print_stats(cache_program, cache_env, cache_stats)
     if res != 0:
         exit(1)
 
@@ -246,6 +290,8 @@ elif project_args.cmd == "build" or project_args.cmd == "rebuild":
     print("==================================")
     print("build end, time last:%.2fs" %(time_end-time_start))
     print("==================================")
+    if timings_owner:
+        timings.report()
 # clean
 elif project_args.cmd == "clean":
     print("clean now")
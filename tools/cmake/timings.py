@@ -0,0 +1,239 @@
+#
+# build phase timings of `project.py build --timings`
+#
+# @license MIT
+#
+# Every phase (binding generation, Kconfig genconfig.py, CMake configure, build, setup.py bdist_wheel),
+# compile and link appends one JSON line with its wall and CPU time to build/timings/events.jsonl,
+# report() aggregates them to build/timings/timings.json and prints the top offenders.
+# Compiles and links are timed by this script as CMake's RULE_LAUNCH_COMPILE/RULE_LAUNCH_LINK,
+# with clang the -ftime-trace file of every TU is also aggregated per template family and header.
+#
+# @usage: python timings.py launch events.jsonl compile|link|<phase> -- command args...
+#
+
+import os, sys, time, json
+import subprocess
+from contextlib import contextmanager
+
+ENV_NAME = "BUILD_TIMINGS"
+TOP = 10            # summary rows
+TRACE_TOP = 50      # templates/headers kept per TU and in the report
+
+
+def cpu_time():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def append(log_path, event):
+    # one write per line, O_APPEND keeps lines of parallel compiles whole
+    line = (json.dumps(event) + "\n").encode()
+    fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def start(build_dir):
+    '''
+        Enable timings for this process and its children, a new log is started unless an outer
+        project.py already started one (they share os.environ when executed in-process).
+        @return log path
+    '''
+    log_path = os.path.abspath(os.path.join(build_dir, "timings", "events.jsonl"))
+    if os.environ.get(ENV_NAME) != log_path:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        open(log_path, "w").close()
+        os.environ[ENV_NAME] = log_path
+    return log_path
+
+
+def log_path():
+    return os.environ.get(ENV_NAME, "")
+
+
+@contextmanager
+def phase(name):
+    '''
+        Time the block as phase name if timings started, CPU time includes the waited child processes.
+    '''
+    path = log_path()
+    wall, cpu = time.time(), cpu_time()
+    try:
+        yield
+    finally:
+        if path:
+            append(path, {"kind": "phase", "name": name, "start": wall, "wall_s": time.time() - wall, "cpu_s": cpu_time() - cpu})
+
+
+def template_family(name):
+    '''
+        Name with template arguments removed, `std::vector<int>::push_back` -> `std::vector<>::push_back`.
+    '''
+    out = []
+    depth = 0
+    for c in name:
+        if c == "<":
+            if depth == 0:
+                out.append("<>")
+            depth += 1
+        elif c == ">" and depth:
+            depth -= 1
+        elif depth == 0:
+            out.append(c)
+    return "".join(out)
+
+
+def top(d, n):
+    return dict(sorted(d.items(), key=lambda x: -x[1])[:n])
+
+
+def parse_time_trace(path):
+    '''
+        Aggregate a clang -ftime-trace file: frontend/backend totals, inclusive time per template family
+        (InstantiateClass/InstantiateFunction) and per included header (Source).
+    '''
+    with open(path, "r", encoding="utf-8") as f:
+        events = json.load(f).get("traceEvents", [])
+    result = {"frontend_s": 0.0, "backend_s": 0.0, "templates": {}, "headers": {}}
+    for e in events:
+        name, dur = e.get("name", ""), e.get("dur", 0) / 1e6
+        detail = e.get("args", {}).get("detail", "")
+        if name == "Total Frontend":
+            result["frontend_s"] = dur
+        elif name == "Total Backend":
+            result["backend_s"] = dur
+        elif name in ("InstantiateClass", "InstantiateFunction") and detail:
+            family = template_family(detail)
+            result["templates"][family] = result["templates"].get(family, 0.0) + dur
+        elif name == "Source" and detail:
+            result["headers"][detail] = result["headers"].get(detail, 0.0) + dur
+    result["templates"] = top(result["templates"], TRACE_TOP)
+    result["headers"] = top(result["headers"], TRACE_TOP)
+    return result
+
+
+def arg_after(cmd, flag):
+    for i, arg in enumerate(cmd[:-1]):
+        if arg == flag:
+            return cmd[i + 1]
+    return ""
+
+
+def launch(log, kind, cmd):
+    '''
+        Run cmd, append its wall and CPU time (and the -ftime-trace data of a compile), return its exit code.
+    '''
+    wall = time.time()
+    res = subprocess.call(cmd)
+    t = os.times()
+    event = {"kind": kind, "start": wall, "wall_s": time.time() - wall, "cpu_s": t.children_user + t.children_system, "exit": res}
+    output = arg_after(cmd, "-o")
+    if kind == "compile":
+        event["source"] = arg_after(cmd, "-c")
+        event["output"] = output
+        # clang writes the trace next to the object, foo.cpp.o -> foo.cpp.json
+        trace = os.path.splitext(output)[0] + ".json"
+        if res == 0 and output and os.path.exists(trace) and os.path.getmtime(trace) >= wall - 1:
+            try:
+                event["time_trace"] = parse_time_trace(trace)
+            except (ValueError, OSError):
+                pass
+    elif kind == "link":
+        event["output"] = output
+    else:
+        event["name"] = kind
+    append(log, event)
+    return res
+
+
+def load(path):
+    events = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        pass
+    return events
+
+
+def report(path=None):
+    '''
+        Aggregate the log to timings.json next to it and print a short summary.
+        @return report dict, None if timings not started
+    '''
+    path = path or log_path()
+    if not path:
+        return None
+    events = load(path)
+    phases = sorted((e for e in events if e["kind"] not in ("compile", "link")), key=lambda e: e["start"])
+    compiles = sorted((e for e in events if e["kind"] == "compile"), key=lambda e: -e["wall_s"])
+    links = sorted((e for e in events if e["kind"] == "link"), key=lambda e: -e["wall_s"])
+    templates, headers = {}, {}
+    for e in compiles:
+        for k, v in e.get("time_trace", {}).get("templates", {}).items():
+            templates[k] = templates.get(k, 0.0) + v
+        for k, v in e.get("time_trace", {}).get("headers", {}).items():
+            headers[k] = headers.get(k, 0.0) + v
+    start = min((e["start"] for e in events), default=0)
+    end = max((e["start"] + e["wall_s"] for e in events), default=0)
+    result = {
+        "wall_s": end - start,
+        "phases": [{"name": e["name"], "offset_s": e["start"] - start, "wall_s": e["wall_s"], "cpu_s": e["cpu_s"]} for e in phases],
+        "compile": {
+            "count": len(compiles),
+            "wall_s": sum(e["wall_s"] for e in compiles),
+            "cpu_s": sum(e["cpu_s"] for e in compiles),
+            "time_trace": any("time_trace" in e for e in compiles),
+            "units": [{k: e[k] for k in ("source", "output", "wall_s", "cpu_s", "exit", "time_trace") if k in e} for e in compiles],
+        },
+        "link": {
+            "count": len(links),
+            "wall_s": sum(e["wall_s"] for e in links),
+            "cpu_s": sum(e["cpu_s"] for e in links),
+            "outputs": [{k: e[k] for k in ("output", "wall_s", "cpu_s", "exit")} for e in links],
+        },
+        "templates": top(templates, TRACE_TOP),
+        "headers": top(headers, TRACE_TOP),
+    }
+    out_path = os.path.join(os.path.dirname(path), "timings.json")
+    project_dir = os.path.dirname(os.path.dirname(os.path.dirname(path)))  # <project>/build/timings/events.jsonl
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4)
+
+    print("==================================")
+    print("build timings, total {:.2f}s (wall)".format(result["wall_s"]))
+    print("-- phases:")
+    for e in result["phases"]:
+        print("   {:>8.2f}s wall {:>8.2f}s cpu  {}".format(e["wall_s"], e["cpu_s"], e["name"]))
+    print("-- {} compiles: {:.2f}s cpu, {} links: {:.2f}s cpu".format(len(compiles), result["compile"]["cpu_s"], len(links), result["link"]["cpu_s"]))
+    if compiles:
+        print("-- slowest translation units:")
+        for e in compiles[:TOP]:
+            print("   {:>8.2f}s wall {:>8.2f}s cpu  {}".format(e["wall_s"], e["cpu_s"], os.path.relpath(e["source"], project_dir) if e.get("source") else e.get("output", "")))
+    if links:
+        print("-- slowest links:")
+        for e in links[:TOP]:
+            print("   {:>8.2f}s wall {:>8.2f}s cpu  {}".format(e["wall_s"], e["cpu_s"], os.path.basename(e["output"])))
+    if templates:
+        print("-- most expensive template families (inclusive, all TUs):")
+        for k, v in list(result["templates"].items())[:TOP]:
+            print("   {:>8.2f}s  {}".format(v, k if len(k) <= 120 else k[:117] + "..."))
+    elif compiles:
+        print("-- compiler doesn't support -ftime-trace (clang >= 9), no per-template costs")
+    print("-- details: {}".format(out_path))
+    print("==================================")
+    return result
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5 or sys.argv[1] != "launch" or sys.argv[4] != "--":
+        print("usage: python timings.py launch events.jsonl compile|link|<phase> -- command args...")
+        sys.exit(2)
+    sys.exit(launch(sys.argv[2], sys.argv[3], sys.argv[5:]))
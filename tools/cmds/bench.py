@@ -0,0 +1,328 @@
+#
+# @file bench.py
+# @brief `project.py bench`: run the benchmarks against the built wheel, compare with a baseline, HTML trend report
+# @license MIT
+#
+
+import argparse
+import os, sys, time, shlex, shutil
+import subprocess
+import statistics
+import zipfile
+import html
+import json
+
+
+parser = argparse.ArgumentParser(add_help=False, prog="bench.py")
+cmds = ["bench"]
+
+############################### Add option here #############################
+parser.add_argument("--bench-repeat", type=int, help="bench: runs of every benchmark script, median and MAD of the runs are compared", default=5)
+parser.add_argument("--bench-threshold", type=float, help="bench: regression if slower than the baseline by more than this percent", default=5.0)
+parser.add_argument("--bench-noise", type=float, help="bench: and by more than this many MADs (median absolute deviation) of the runs", default=3.0)
+parser.add_argument("--bench-baseline", help="bench: baseline JSON file, default build/bench/baseline.json", default="")
+parser.add_argument("--bench-save-baseline", help="bench: save this run as the baseline", default=False, action="store_true")
+parser.add_argument("--bench-script", help="bench: extra benchmark script, run with `--json FILE`, can be repeated", default=[], action="append")
+parser.add_argument("--bench-args", help="bench: extra args of every benchmark script, e.g. \"--min-time 0.5\"", default="")
+parser.add_argument("--bench-native", help="bench: also run the native harness of the generated microbenchmarks", default=False, action="store_true")
+#############################################################################
+
+# MAD of normally distributed samples times this is their standard deviation
+MAD_SIGMA = 1.4826
+
+
+def load_mk(path):
+    configs = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if "=" in line and not line.startswith("#"):
+                    k, v = line.split("=", 1)
+                    configs[k.strip()] = v.strip().strip('"')
+    return configs
+
+
+def find_package(project_path, bench_dir):
+    '''
+        Python path of the built package: the newest wheel in dist/ extracted to build/bench/site,
+        or build/ with the package directory setup.py prepares if there is no wheel.
+        @return (python path, description)
+    '''
+    configs = load_mk(os.path.join(project_path, "build", "config", "global_config.mk"))
+    name = configs.get("CONFIG_WHL_PACKAGE_NAME", "")
+    dist_dir = os.path.join(project_path, "dist")
+    wheels = []
+    if os.path.isdir(dist_dir):
+        wheels = [os.path.join(dist_dir, x) for x in os.listdir(dist_dir) if x.endswith(".whl") and (not name or x.startswith(name + "-"))]
+    if wheels:
+        wheel = max(wheels, key=os.path.getmtime)
+        site_dir = os.path.join(bench_dir, "site")
+        if os.path.exists(site_dir):
+            shutil.rmtree(site_dir)
+        with zipfile.ZipFile(wheel) as z:
+            for info in z.infolist():
+                z.extract(info, site_dir)
+                # zipfile drops the permissions
+                mode = info.external_attr >> 16
+                if mode:
+                    os.chmod(os.path.join(site_dir, info.filename), mode)
+        return site_dir, wheel
+    if name and os.path.exists(os.path.join(project_path, "build", name, "__init__.py")):
+        print("-- [WARNING] no wheel of {} in dist/, benchmark the package directory build/{}".format(name, name))
+        return os.path.join(project_path, "build"), os.path.join(project_path, "build", name)
+    return None, None
+
+
+def generate_scripts(project_path, sdk_path, bench_dir):
+    '''
+        Generate the call overhead microbenchmarks of every module (cpp_bind_python.py --bench),
+        bindings are written to build/bench/bind so main/src is not touched.
+    '''
+    generator = os.path.join(project_path, "cpp_bind_python.py")
+    if not os.path.exists(generator):
+        return []
+    scripts_dir = os.path.join(bench_dir, "scripts")
+    if os.path.exists(scripts_dir):
+        shutil.rmtree(scripts_dir)
+    env = dict(os.environ, MY_SDK_PATH=sdk_path)
+    cmd = [sys.executable, generator, "-o", os.path.join(bench_dir, "bind"), "--bench", scripts_dir]
+    if subprocess.call(cmd, cwd=project_path, env=env, stdout=subprocess.DEVNULL) != 0:
+        print("[ERROR] generate benchmarks failed: {}".format(" ".join(cmd)))
+        return []
+    return sorted(os.path.join(scripts_dir, x) for x in os.listdir(scripts_dir) if x.endswith(".py"))
+
+
+def parse_metrics(prefix, data):
+    '''
+        Metrics (lower is better) of a benchmark JSON file: `{"results": [{"name", "python_ns"}, ...]}`
+        written by the generated microbenchmarks, or a flat `{name: value}` object.
+    '''
+    metrics = {}
+    if isinstance(data, dict) and isinstance(data.get("results"), list):
+        for x in data["results"]:
+            if x.get("python_ns") is not None:
+                metrics["{}:{}".format(prefix, x["name"])] = float(x["python_ns"])
+    elif isinstance(data, dict):
+        for k, v in data.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                metrics["{}:{}".format(prefix, k)] = float(v)
+    return metrics
+
+
+def run_scripts(scripts, python_path, repeat, script_args, tmp_dir):
+    '''
+        Run every script repeat times in fresh interpreters.
+        @return {metric: [samples]}
+    '''
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([python_path] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    samples = {}
+    for script, args in scripts:
+        prefix = os.path.splitext(os.path.basename(script))[0]
+        out = os.path.join(tmp_dir, prefix + ".json")
+        for i in range(repeat):
+            print("-- run {} ({}/{})".format(prefix, i + 1, repeat))
+            if os.path.exists(out):
+                os.remove(out)
+            cmd = [sys.executable, script, "--json", out] + args + script_args
+            if subprocess.call(cmd, env=env, stdout=subprocess.DEVNULL) != 0 or not os.path.exists(out):
+                print("[ERROR] benchmark failed: {}".format(" ".join(cmd)))
+                break
+            with open(out, "r", encoding="utf-8") as f:
+                for k, v in parse_metrics(prefix, json.load(f)).items():
+                    samples.setdefault(k, []).append(v)
+    return samples
+
+
+def summarize(samples):
+    metrics = {}
+    for k, v in sorted(samples.items()):
+        median = statistics.median(v)
+        metrics[k] = {
+            "median": median,
+            "mad": statistics.median(abs(x - median) for x in v),
+            "samples": v,
+        }
+    return metrics
+
+
+def compare(metrics, baseline, threshold, noise):
+    '''
+        Compare medians with the baseline, a metric regressed if it is slower by more than threshold percent
+        and the difference is larger than noise times the larger MAD (scaled to a standard deviation).
+        @return list of {name, baseline, current, change, regressed}
+    '''
+    rows = []
+    for k, cur in metrics.items():
+        base = baseline.get(k)
+        if not base:
+            rows.append({"name": k, "baseline": None, "current": cur["median"], "change": None, "regressed": False})
+            continue
+        diff = cur["median"] - base["median"]
+        change = diff / base["median"] * 100 if base["median"] else 0.0
+        mad = max(cur["mad"], base["mad"]) * MAD_SIGMA
+        regressed = change > threshold and diff > noise * mad
+        rows.append({"name": k, "baseline": base["median"], "current": cur["median"], "change": change, "regressed": regressed})
+    return rows
+
+
+def git_commit(path):
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=path, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ""
+
+
+def load_history(history_dir):
+    records = []
+    if os.path.isdir(history_dir):
+        for name in sorted(os.listdir(history_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(history_dir, name), "r", encoding="utf-8") as f:
+                    records.append(json.load(f))
+    return records
+
+
+def svg_chart(values, mads, baseline, width=640, height=120, pad=8):
+    '''
+        Line chart of the medians with MAD bars, the baseline as a dashed line.
+    '''
+    lows = [v - m for v, m in zip(values, mads)] + ([baseline] if baseline is not None else [])
+    highs = [v + m for v, m in zip(values, mads)] + ([baseline] if baseline is not None else [])
+    lo, hi = min(lows), max(highs)
+    if hi - lo < 1e-12:
+        lo, hi = lo - 1, hi + 1
+    step = (width - 2 * pad) / max(len(values) - 1, 1)
+
+    def x(i):
+        return pad + i * step
+
+    def y(v):
+        return height - pad - (v - lo) / (hi - lo) * (height - 2 * pad)
+    items = ['<svg width="{}" height="{}" xmlns="http://www.w3.org/2000/svg">'.format(width, height),
+             '<rect width="100%" height="100%" fill="#fafafa" stroke="#ddd"/>']
+    if baseline is not None:
+        items.append('<line x1="{}" x2="{}" y1="{:.1f}" y2="{:.1f}" stroke="#888" stroke-dasharray="4"/>'.format(pad, width - pad, y(baseline), y(baseline)))
+    for i, (v, m) in enumerate(zip(values, mads)):
+        if m:
+            items.append('<line x1="{0:.1f}" x2="{0:.1f}" y1="{1:.1f}" y2="{2:.1f}" stroke="#9bc"/>'.format(x(i), y(v - m), y(v + m)))
+    points = " ".join("{:.1f},{:.1f}".format(x(i), y(v)) for i, v in enumerate(values))
+    items.append('<polyline points="{}" fill="none" stroke="#26a" stroke-width="1.5"/>'.format(points))
+    for i, v in enumerate(values):
+        items.append('<circle cx="{:.1f}" cy="{:.1f}" r="2.5" fill="#26a"><title>{:.3f}</title></circle>'.format(x(i), y(v), v))
+    items.append("</svg>")
+    return "".join(items)
+
+
+def render_report(path, history, baseline, rows):
+    '''
+        Static HTML report: latest comparison table and the trend of every metric over the saved runs.
+    '''
+    e = html.escape
+    names = sorted({k for r in history for k in r["metrics"]})
+    out = ["<!DOCTYPE html>", '<html><head><meta charset="utf-8"><title>Benchmark report</title>',
+           "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}td,th{border:1px solid #ccc;padding:2px 8px;text-align:right}"
+           "td:first-child{text-align:left}.bad{color:#c00;font-weight:bold}.good{color:#080}</style></head><body>",
+           "<h1>Benchmark report</h1>",
+           "<p>{} runs, latest {} {}</p>".format(len(history), e(history[-1]["time"]), e(history[-1].get("commit", ""))) if history else "<p>no runs</p>",
+           "<h2>Latest run vs baseline</h2><table><tr><th>metric</th><th>baseline</th><th>current</th><th>change</th></tr>"]
+    for r in rows:
+        cls = "bad" if r["regressed"] else ("good" if r["change"] is not None and r["change"] < 0 else "")
+        out.append('<tr><td>{}</td><td>{}</td><td>{:.3f}</td><td class="{}">{}</td></tr>'.format(
+            e(r["name"]), "-" if r["baseline"] is None else "{:.3f}".format(r["baseline"]), r["current"], cls,
+            "-" if r["change"] is None else "{:+.1f}%".format(r["change"])))
+    out.append("</table><h2>Trends</h2><p>median of the runs, bars are the MAD, dashed line is the baseline</p>")
+    for k in names:
+        points = [(r["metrics"][k]["median"], r["metrics"][k]["mad"]) for r in history if k in r["metrics"]]
+        base = baseline.get(k, {}).get("median")
+        out.append("<h3>{}</h3>".format(e(k)))
+        out.append(svg_chart([p[0] for p in points], [p[1] for p in points], base))
+    out.append("</body></html>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(out))
+
+
+def main(vars):
+    '''
+        @vars: dict,
+            "project_path": project_path,
+            "project_name": project_name,
+            "sdk_path": sdk_path,
+            "build_type": build_type,
+            "project_parser": project_parser,
+            "project_args": project_args,
+            "configs": configs,
+    '''
+    project_path = vars["project_path"]
+    project_args = vars["project_args"]
+    bench_dir = os.path.join(project_path, "build", "bench")
+    history_dir = os.path.join(bench_dir, "history")
+    baseline_path = project_args.bench_baseline or os.path.join(bench_dir, "baseline.json")
+    os.makedirs(history_dir, exist_ok=True)
+
+    python_path, package = find_package(project_path, bench_dir)
+    if not python_path:
+        print("[ERROR] no built package found, run `python project.py build` with CONFIG_BUILD_WHL_PACKAGE first")
+        return 1
+    print("-- benchmark package: {}".format(package))
+
+    native_args = [] if project_args.bench_native else ["--no-native"]
+    scripts = [(x, native_args) for x in generate_scripts(project_path, vars["sdk_path"], bench_dir)]
+    scripts += [(os.path.join(project_path, x) if not os.path.isabs(x) else x, []) for x in project_args.bench_script]
+    if not scripts:
+        print("[ERROR] no benchmark script, add headers with bindings or --bench-script")
+        return 1
+
+    tmp_dir = os.path.join(bench_dir, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    samples = run_scripts(scripts, python_path, max(project_args.bench_repeat, 1), shlex.split(project_args.bench_args), tmp_dir)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    if not samples:
+        print("[ERROR] benchmarks produced no results")
+        return 1
+
+    record = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": git_commit(project_path),
+        "package": os.path.basename(package),
+        "repeat": project_args.bench_repeat,
+        "metrics": summarize(samples),
+    }
+    record_path = os.path.join(history_dir, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(record_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=4)
+    shutil.copy(record_path, os.path.join(bench_dir, "latest.json"))
+    print("-- results saved to {}".format(record_path))
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["metrics"]
+    rows = compare(record["metrics"], baseline, project_args.bench_threshold, project_args.bench_noise)
+
+    print("\n| metric | baseline | current | MAD | change |")
+    print("| --- | --- | --- | --- | --- |")
+    for r in rows:
+        print("| {} | {} | {:.3f} | {:.3f} | {}{} |".format(r["name"], "-" if r["baseline"] is None else "{:.3f}".format(r["baseline"]),
+              r["current"], record["metrics"][r["name"]]["mad"], "-" if r["change"] is None else "{:+.1f}%".format(r["change"]),
+              " REGRESSED" if r["regressed"] else ""))
+
+    report_path = os.path.join(bench_dir, "report.html")
+    render_report(report_path, load_history(history_dir), baseline, rows)
+    print("\n-- report: {}".format(report_path))
+
+    if project_args.bench_save_baseline or not baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        shutil.copy(record_path, baseline_path)
+        print("-- baseline saved to {}".format(baseline_path))
+        return 0
+    regressed = [r["name"] for r in rows if r["regressed"]]
+    if regressed:
+        print("[ERROR] {} regression(s) over {}% beyond noise: {}".format(len(regressed), project_args.bench_threshold, ", ".join(regressed)))
+        return 1
+    print("-- no regression")
+    return 0
+
+if __name__ == '__main__':
+    main()
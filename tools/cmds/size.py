@@ -0,0 +1,375 @@
+#
+# @file size.py
+# @brief `project.py size`: flash size of the built extension modules per binding, class and source
+# @license MIT
+#
+
+import argparse
+import os, re, time, shutil
+import subprocess
+import struct
+import json
+
+from timings import template_family
+
+
+parser = argparse.ArgumentParser(add_help=False, prog="size.py")
+cmds = ["size"]
+
+############################### Add option here #############################
+parser.add_argument("--size-top", type=int, help="size: rows of the owner and template tables", default=20)
+parser.add_argument("--size-diff", help="size: compare with this size.json, default the previous `size` run", default="")
+#############################################################################
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHT_DYNSYM = 11
+STT_OBJECT = 1
+STT_FUNC = 2
+SHN_UNDEF = 0
+SHN_LORESERVE = 0xff00
+# flash cost buckets by section name prefix, .bss takes no flash
+BUCKETS = [(".text", "text"), (".rodata", "rodata"), (".data", "data")]
+
+
+class Elf:
+    '''
+        Minimal ELF reader: section headers and symbol tables, 32/64 bit, either endian.
+    '''
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        if self.data[:4] != b"\x7fELF":
+            raise ValueError("{} is not an ELF file".format(path))
+        self.is64 = self.data[4] == 2
+        self.endian = "<" if self.data[5] == 1 else ">"
+        if self.is64:
+            shoff, = struct.unpack_from(self.endian + "Q", self.data, 0x28)
+            shentsize, shnum, shstrndx = struct.unpack_from(self.endian + "HHH", self.data, 0x3A)
+            fmt = "IIQQQQIIQQ"
+        else:
+            shoff, = struct.unpack_from(self.endian + "I", self.data, 0x20)
+            shentsize, shnum, shstrndx = struct.unpack_from(self.endian + "HHH", self.data, 0x2E)
+            fmt = "IIIIIIIIII"
+        self.sections = []
+        for i in range(shnum):
+            name, type_, flags, addr, offset, size, link, info, align, entsize = struct.unpack_from(self.endian + fmt, self.data, shoff + i * shentsize)
+            self.sections.append({"name_off": name, "type": type_, "addr": addr, "offset": offset, "size": size, "link": link, "entsize": entsize})
+        if shstrndx < len(self.sections):
+            strtab = self.sections[shstrndx]
+            for s in self.sections:
+                s["name"] = self.string(strtab, s["name_off"])
+
+    def string(self, strtab, offset):
+        start = strtab["offset"] + offset
+        return self.data[start:self.data.index(b"\0", start)].decode("utf-8", "replace")
+
+    def section(self, name):
+        for s in self.sections:
+            if s.get("name") == name:
+                return s
+        return None
+
+    def content(self, section):
+        if section["type"] == SHT_NOBITS:
+            return b""
+        return self.data[section["offset"]:section["offset"] + section["size"]]
+
+    def symbols(self):
+        '''
+            Defined functions and objects with a size, from .symtab, or .dynsym of a stripped file.
+            @return list of (name, address, size, section name)
+        '''
+        tables = [s for s in self.sections if s["type"] == SHT_SYMTAB] or [s for s in self.sections if s["type"] == SHT_DYNSYM]
+        result = []
+        for table in tables:
+            strtab = self.sections[table["link"]]
+            fmt, entsize = (self.endian + "IBBHQQ", 24) if self.is64 else (self.endian + "IIIBBH", 16)
+            for i in range(1, table["size"] // entsize):
+                if self.is64:
+                    name, info, other, shndx, value, size = struct.unpack_from(fmt, self.data, table["offset"] + i * entsize)
+                else:
+                    name, value, size, info, other, shndx = struct.unpack_from(fmt, self.data, table["offset"] + i * entsize)
+                if (info & 0xf) not in (STT_FUNC, STT_OBJECT) or shndx == SHN_UNDEF or shndx >= SHN_LORESERVE:
+                    continue
+                result.append((self.string(strtab, name), value, size, self.sections[shndx].get("name", "")))
+        return result
+
+
+def bucket_of(section):
+    for prefix, bucket in BUCKETS:
+        if section.startswith(prefix):
+            return bucket
+    return None
+
+
+def base_name(name):
+    '''
+        Demangled name without return type, parameters and template arguments, e.g. `pybind11::class_<>::def<>`.
+    '''
+    return template_family(name).split("(")[0].split(" ")[-1]
+
+
+def demangle(names, cxxfilt):
+    if not cxxfilt or not names:
+        return list(names)
+    try:
+        out = subprocess.run([cxxfilt], input="\n".join(names), capture_output=True, text=True, check=True).stdout.split("\n")
+        return out[:len(names)] if len(out) >= len(names) else list(names)
+    except (OSError, subprocess.CalledProcessError):
+        return list(names)
+
+
+def find_cxxfilt(configs):
+    path = configs.get("CONFIG_TOOLCHAIN_PATH", "")
+    prefix = configs.get("CONFIG_TOOLCHAIN_PREFIX", "")
+    if path and prefix and os.path.exists(os.path.join(path, prefix + "c++filt")):
+        return os.path.join(path, prefix + "c++filt")
+    return shutil.which("c++filt")
+
+
+def unescape(literal):
+    return re.sub(r'\\(.)', lambda m: {"n": "\n", "t": "\t"}.get(m.group(1), m.group(1)), literal)
+
+
+def parse_binding(path, module):
+    '''
+        Bound classes and functions of a generated bind_<module>.cpp: {C++ name: Python name},
+        function signatures of static_cast (dispatchers are shared per signature) and docstring literals.
+    '''
+    with open(path, "r", encoding="utf-8") as f:
+        code = f.read()
+    scopes = {"m": module}
+    for var, parent, name in re.findall(r'auto (\w+) = (\w+)\.def_submodule\("(\w+)"', code):
+        scopes[var] = scopes.get(parent, module) + "." + name
+    classes = {}
+    for var, cpp, parent, name in re.findall(r'auto (\w+) = py::class_<([\w:]+)[^>]*>\((\w+), "(\w+)"', code):
+        classes[cpp] = scopes.get(parent, module) + "." + name
+        scopes[var] = classes[cpp]
+    functions, signatures = {}, {}
+    for var, name, sig, cpp in re.findall(r'(\w+)\.def(?:_static)?\("(\w+)",\s*static_cast<(.+?)>\(&([\w:]+)\)', code):
+        py_name = scopes.get(var, module) + "." + name
+        functions.setdefault(cpp, py_name)
+        signatures.setdefault(sig.replace(" ", ""), []).append(py_name)
+    # --fastcall functions are plain C functions fastcall_<name>
+    fastcall = dict(re.findall(r'static PyMethodDef (\w+)_def = \{"(\w+)"', code))
+    for var, c_name in re.findall(r'autobind::fastcall::add_function\((\w+), &(\w+)_def\)', code):
+        functions[c_name] = scopes.get(var, module) + "." + fastcall.get(c_name, c_name)
+    # docstrings are the literals with spaces or newlines, names never have them
+    docs = {unescape(x) for x in re.findall(r'"((?:[^"\\\n]|\\.)*)"', code) if (" " in x or "\\n" in x) and len(x) >= 8}
+    return classes, functions, signatures, docs
+
+
+def owner_of(name, module, classes, functions, signatures, class_res, function_res):
+    '''
+        Owner of a demangled symbol of extension module: a class, a function (pybind11 dispatchers
+        shared by functions of the same signature are split), the module init, or a runtime.
+        @return list of owners sharing the symbol
+    '''
+    for cpp, regex in class_res:
+        if regex.search(name):
+            return ["class " + classes[cpp]]
+    for cpp, regex in function_res:
+        if regex.search(name):
+            return ["function " + functions[cpp]]
+    base = base_name(name)
+    if base.startswith("pybind11::cpp_function::initialize<>"):
+        args = re.sub(r"^void ", "", name).replace(" ", "").replace("(*&)", "(*)")
+        for sig, py_names in signatures.items():
+            if args.startswith("pybind11::cpp_function::initialize<" + sig):
+                return ["function " + x for x in py_names]
+    if "pybind11_init_" + module in name or "PyInit_" + module in name:
+        return ["module init " + module]
+    return [runtime_owner(base) or "other"]
+
+
+def runtime_owner(base):
+    for prefix, owner in (("pybind11::", "pybind11 runtime"), ("autobind::", "autobind runtime"), ("std::", "C++ standard library"), ("__gnu_cxx::", "C++ standard library")):
+        if base.startswith(prefix):
+            return owner
+    return None
+
+
+def object_sources(build_dir, target):
+    '''
+        {symbol: set of sources} of the objects of a CMake target (build/<component>/CMakeFiles/<target>.dir).
+    '''
+    sources = {}
+    for root, dirs, files in os.walk(build_dir):
+        if not root.endswith(os.path.join("CMakeFiles", target + ".dir")):
+            continue
+        component = os.path.relpath(os.path.dirname(os.path.dirname(root)), build_dir)
+        for sub_root, _, sub_files in os.walk(root):
+            for name in sub_files:
+                if not name.endswith(".o"):
+                    continue
+                path = os.path.join(sub_root, name)
+                source = os.path.join(component, os.path.relpath(path, root)[:-2])
+                try:
+                    for sym, value, size, section in Elf(path).symbols():
+                        sources.setdefault(sym, set()).add(source)
+                except (ValueError, OSError, struct.error):
+                    pass
+    return sources
+
+
+def analyze(path, module, binding, sources, cxxfilt, top_templates):
+    '''
+        Flash bytes of one .so per owner and bucket, section sizes, docstring bytes, template families.
+        Symbols of an extension module are attributed to the bindings of its bind_<module>.cpp,
+        symbols of the core lib to the user source defining them (sources, from the object files).
+    '''
+    elf = Elf(path)
+    symbols = elf.symbols()
+    demangled = demangle([x[0] for x in symbols], cxxfilt)
+    classes, functions, signatures, docs = binding or ({}, {}, {}, set())
+    # longest names first, nested classes before their outer class
+    class_res = [(c, re.compile(r"(?<![\w:])" + re.escape(c) + r"(?![\w])")) for c in sorted(classes, key=len, reverse=True)]
+    function_res = [(c, re.compile(r"(?<![\w:])" + re.escape(c) + r"\(")) for c in sorted(functions, key=len, reverse=True)]
+    owners = {}
+    seen = set()
+    for (mangled, address, size, section), name in zip(symbols, demangled):
+        bucket = bucket_of(section)
+        # aliases (C1/C2 constructors, local and global names) counted once
+        if not bucket or not size or (section, address) in seen:
+            continue
+        seen.add((section, address))
+        if module:
+            names = owner_of(name, module, classes, functions, signatures, class_res, function_res)
+        elif runtime_owner(base_name(name)):
+            names = [runtime_owner(base_name(name))]
+        elif mangled in sources:
+            srcs = sources[mangled]
+            names = ["source " + next(iter(srcs))] if len(srcs) == 1 else ["inline/template code of {} sources".format(len(srcs))]
+        else:
+            names = ["other"]
+        for owner in names:
+            o = owners.setdefault(owner, {"text": 0, "rodata": 0, "data": 0})
+            o[bucket] += size / len(names)
+        if "<" in name:
+            t = top_templates.setdefault(base_name(name), {"bytes": 0, "count": 0})
+            t["bytes"] += size
+            t["count"] += 1
+    sections = {}
+    for s in elf.sections:
+        name = s.get("name", "")
+        if s["size"] and s["type"] != SHT_NOBITS and (bucket_of(name) or name in (".eh_frame", ".gcc_except_table", ".dynsym", ".dynstr", ".rela.dyn", ".rela.plt")):
+            sections[name] = s["size"]
+    rodata = b"".join(elf.content(s) for s in elf.sections if s.get("name", "").startswith(".rodata"))
+    doc_bytes = sum(len(d.encode()) + 1 for d in docs if d.encode() + b"\0" in rodata)
+    return {"size": os.path.getsize(path), "sections": sections, "owners": {k: {b: round(v) for b, v in o.items()} for k, o in owners.items()}, "docstrings": doc_bytes}
+
+
+def find_binding(project_path, module):
+    for root, dirs, files in os.walk(project_path):
+        dirs[:] = [d for d in dirs if d not in ("build", "dist", ".git")]
+        if "bind_{}.cpp".format(module) in files:
+            return os.path.join(root, "bind_{}.cpp".format(module))
+    return None
+
+
+def owner_total(o):
+    return o["text"] + o["rodata"] + o["data"]
+
+
+def main(vars):
+    '''
+        @vars: dict,
+            "project_path": project_path,
+            "project_name": project_name,
+            "sdk_path": sdk_path,
+            "build_type": build_type,
+            "project_parser": project_parser,
+            "project_args": project_args,
+            "configs": configs,
+    '''
+    project_path = vars["project_path"]
+    project_args = vars["project_args"]
+    build_dir = os.path.join(project_path, "build")
+    size_dir = os.path.join(build_dir, "size")
+    modules_dir = os.path.join(build_dir, "python_modules")
+    files = []
+    if os.path.isdir(modules_dir):
+        files += [(os.path.join(modules_dir, x), x[:-3]) for x in sorted(os.listdir(modules_dir)) if x.endswith(".so")]
+    core = os.path.join(build_dir, "main", "libmain.so")
+    if os.path.exists(core):
+        files.append((core, None))
+    if not files:
+        print("[ERROR] no extension module in {}, run `python project.py build` first".format(modules_dir))
+        return 1
+    cxxfilt = find_cxxfilt(vars["configs"])
+    if not cxxfilt:
+        print("-- [WARNING] c++filt not found, symbols are not demangled, classes/functions/templates can't be attributed")
+
+    templates = {}
+    result = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "build_type": vars["build_type"], "files": {}, "templates": {}}
+    for path, module in files:
+        name = os.path.basename(path)
+        if module:
+            binding_path = find_binding(project_path, module)
+            binding = parse_binding(binding_path, module) if binding_path else None
+            sources = {}
+        else:
+            binding = None
+            sources = object_sources(build_dir, "main")
+        print("-- analyze {}".format(name))
+        result["files"][name] = analyze(path, module, binding, sources, cxxfilt, templates)
+    result["templates"] = dict(sorted(templates.items(), key=lambda x: -x[1]["bytes"])[:200])
+
+    top = project_args.size_top
+    kib = lambda v: "{:.1f}".format(v / 1024)
+    print("\n| file | size KiB | .text | .rodata | .data* | .eh_frame | .dynsym+.dynstr | docstrings |")
+    print("| --- | --- | --- | --- | --- | --- | --- | --- |")
+    for name, f in result["files"].items():
+        s = f["sections"]
+        print("| {} | {} | {} | {} | {} | {} | {} | {} |".format(name, kib(f["size"]),
+              kib(sum(v for k, v in s.items() if k.startswith(".text"))), kib(sum(v for k, v in s.items() if k.startswith(".rodata"))),
+              kib(sum(v for k, v in s.items() if k.startswith(".data"))), kib(s.get(".eh_frame", 0) + s.get(".gcc_except_table", 0)),
+              kib(s.get(".dynsym", 0) + s.get(".dynstr", 0)), kib(f["docstrings"])))
+
+    owners = {}
+    for name, f in result["files"].items():
+        for owner, o in f["owners"].items():
+            key = "{}: {}".format(name, owner)
+            owners[key] = o
+    print("\n| owner (symbol bytes) | text KiB | rodata KiB | data KiB | total KiB |")
+    print("| --- | --- | --- | --- | --- |")
+    for key, o in sorted(owners.items(), key=lambda x: -owner_total(x[1]))[:top]:
+        print("| {} | {} | {} | {} | {} |".format(key, kib(o["text"]), kib(o["rodata"]), kib(o["data"]), kib(owner_total(o))))
+
+    if templates:
+        print("\n| template family | instantiations | KiB |")
+        print("| --- | --- | --- |")
+        for family, t in list(result["templates"].items())[:top]:
+            print("| {} | {} | {} |".format(family if len(family) <= 100 else family[:97] + "...", t["count"], kib(t["bytes"])))
+
+    # compare with the given file or the previous run
+    os.makedirs(size_dir, exist_ok=True)
+    out_path = os.path.join(size_dir, "size.json")
+    previous_path = project_args.size_diff or os.path.join(size_dir, "previous.json")
+    if not project_args.size_diff and os.path.exists(out_path):
+        shutil.copy(out_path, previous_path)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4)
+    if os.path.exists(previous_path):
+        with open(previous_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        old_owners = {"{}: {}".format(n, k): owner_total(o) for n, f in previous["files"].items() for k, o in f["owners"].items()}
+        new_owners = {k: owner_total(o) for k, o in owners.items()}
+        print("\n-- diff with {} ({})".format(previous_path, previous.get("time", "")))
+        for name in sorted(set(result["files"]) | set(previous["files"])):
+            old = previous["files"].get(name, {}).get("size", 0)
+            new = result["files"].get(name, {}).get("size", 0)
+            print("   {:<40} {:>10} -> {:>10} bytes ({:+d})".format(name, old, new, new - old))
+        changes = [(k, new_owners.get(k, 0) - old_owners.get(k, 0)) for k in set(old_owners) | set(new_owners)]
+        changes = [x for x in changes if x[1]]
+        if changes:
+            print("\n| owner | change bytes |")
+            print("| --- | --- |")
+            for k, d in sorted(changes, key=lambda x: -abs(x[1]))[:top]:
+                print("| {} | {:+d} |".format(k, d))
+    print("\n-- details: {}".format(out_path))
+    return 0
+
+if __name__ == '__main__':
+    main()